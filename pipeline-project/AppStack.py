@@ -2,6 +2,7 @@
 AppStack.py - Contains website monitoring Lambda functions
 """
 from aws_cdk import (
+    ArnFormat,
     Stack,
     Duration,
     aws_lambda as _lambda,
@@ -12,8 +13,11 @@ from aws_cdk import (
     aws_iam as iam,
     aws_sns as sns,
     aws_sns_subscriptions as subs,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_codedeploy as codedeploy,
     aws_dynamodb as dynamodb,
+    aws_s3 as s3,
     aws_apigateway as apigateway,
 )
 from constructs import Construct
@@ -23,6 +27,28 @@ from datetime import datetime
 # Import your constants
 import constants
 
+# Names of the per-website alarms the reconciler manages
+ALARM_NAME_PREFIX = "website-monitor-"
+# Suffix of the fleet composite alarm, the one fleet mode emails about
+FLEET_HEALTH_ALARM_SUFFIX = "fleet-health"
+
+# Content types the CRUD Lambda may gzip; API Gateway passes base64 bodies of these through as binary
+BINARY_MEDIA_TYPES = ["application/json", "application/x-ndjson", "text/csv"]
+
+# GSIs each table has at every rollout stage, oldest first (constants.*_INDEX_STAGE picks one)
+WEBSITES_TABLE_INDEX_STAGES = [
+    ("enabled-index",),
+    ("enabled-index", "created-at-index"),
+    ("enabled-index", "created-at-index", "enabled-key-index"),
+    ("created-at-index", "enabled-key-index"),
+    ("created-at-index", "enabled-key-index", "name-index"),
+]
+ALARM_TABLE_INDEX_STAGES = [
+    (),
+    ("recent-transitions-index",),
+    ("recent-transitions-index", "firing-alarms-index"),
+]
+
 class AppStack(Stack):
     """
     AppStack contains the website monitoring Lambda functions
@@ -34,9 +60,13 @@ class AppStack(Stack):
         # 1) DynamoDB Tables
         alarm_table = self.create_alarm_table()
         target_websites_table = self.create_target_websites_table()
+        search_index_table = self.create_search_index_table()
+        target_status_table = self.create_target_status_table()
+        idempotency_table = self.create_idempotency_table()
+        incident_table = self.create_incident_table()
 
         # 2) Website Crawler Lambda
-        wh_lambda = self.create_website_crawler_lambda(target_websites_table)
+        wh_lambda = self.create_website_crawler_lambda(target_websites_table, target_status_table)
 
         # 3) SNS Topic for Alarms
         alarm_topic = sns.Topic(
@@ -50,18 +80,30 @@ class AppStack(Stack):
             alarm_topic.add_subscription(subs.EmailSubscription(constants.ALERT_EMAIL))
 
         # 3) Alarm Logger Lambda  
-        db_lambda = self.create_alarm_logger_lambda(alarm_table)
+        db_lambda = self.create_alarm_logger_lambda(alarm_table, incident_table)
         
-        # Subscribe Lambda to SNS Topic
-        alarm_topic.add_subscription(subs.LambdaSubscription(db_lambda))
+        # Fleet checks notify the logger only; people are emailed about the composite over them
+        fleet_check_topic = None
+        if constants.ALARM_MODE == "fleet":
+            fleet_check_topic = sns.Topic(self, "FleetCheckTopic", display_name="Website Fleet Checks")
+
+        # Buffer alarm notifications in SQS so bursts reach the logger as a few large batches
+        self.create_alarm_logger_queue(alarm_topic, db_lambda, fleet_check_topic)
+
+        # Archive alarm history to S3 before its TTL removes it from the table
+        self.create_alarm_archiver_lambda(alarm_table)
         
         # 4) CRUD API Lambda
-        crud_lambda = self.create_crud_api_lambda(target_websites_table)
+        crud_lambda = self.create_crud_api_lambda(target_websites_table, target_status_table, idempotency_table,
+                                                  alarm_table, search_index_table)
 
         # 5) CloudWatch Dashboard and Alarms
         # Dashboard and alarms are created dynamically based on DynamoDB content
         self.create_dashboard()
-        self.create_alarms(alarm_topic)
+        if constants.ALARM_MODE == "fleet":
+            self.create_fleet_alarms(alarm_topic, fleet_check_topic)
+        # In fleet mode the reconciler only deletes per-website alarms left from per_target mode
+        self.create_alarms(alarm_topic, target_websites_table)
         
         # 6) API Gateway for CRUD Operations
         self.create_api_gateway(crud_lambda)
@@ -69,7 +111,7 @@ class AppStack(Stack):
         # 7) Lambda Operational Monitoring and Blue-Green Deployment
         self.create_operational_monitoring(wh_lambda, alarm_topic)
 
-    def create_website_crawler_lambda(self, target_websites_table):
+    def create_website_crawler_lambda(self, target_websites_table, target_status_table):
         """Create the website crawler Lambda function"""
         website_crawler = _lambda.Function(
             self,
@@ -79,6 +121,8 @@ class AppStack(Stack):
             code=_lambda.Code.from_asset("lambda/website_crawler"),
             environment={
                 "TARGET_WEBSITES_TABLE": target_websites_table.table_name,
+                "TARGET_STATUS_TABLE": target_status_table.table_name,
+                "STATUS_REFRESH_SECONDS": "900",
                 "NAMESPACE": constants.URL_MONITOR_NAMESPACE,
                 "AVAILABILITY_METRIC_NAME": constants.AVAILABILITY_METRIC_NAME,
                 "LATENCY_METRIC_NAME": constants.LATENCY_METRIC_NAME,
@@ -97,6 +141,9 @@ class AppStack(Stack):
         
         # Grant the Lambda function permission to read from the target websites table
         target_websites_table.grant_read_data(website_crawler)
+        
+        # The crawler maintains the last-known-status view
+        target_status_table.grant_read_write_data(website_crawler)
 
         # Run Lambda every 5 minutes
         rule = events.Rule(
@@ -108,7 +155,7 @@ class AppStack(Stack):
 
         return website_crawler
 
-    def create_alarm_logger_lambda(self, alarm_table):
+    def create_alarm_logger_lambda(self, alarm_table, incident_table):
         """Create the alarm logger Lambda function"""
         alarm_logger = _lambda.Function(
             self,
@@ -118,15 +165,114 @@ class AppStack(Stack):
             code=_lambda.Code.from_asset("lambda/alarm_logger"),
             environment={
                 "ALARM_TABLE": alarm_table.table_name,
+                # Alarms with this many transitions inside the window are logged as flapping
+                "FLAP_WINDOW_SECONDS": "3600",
+                "FLAP_THRESHOLD": "6",
+                # History entries get an ExpiresAt TTL this many days after the transition
+                "RETENTION_DAYS": str(constants.ALARM_RETENTION_DAYS),
+                # Firing alarms sharing a domain, IP or metric within this window form one incident
+                "INCIDENT_TABLE": incident_table.table_name,
+                "CORRELATION_WINDOW_SECONDS": "300",
+                "CORRELATE_BY_IP": "false",
                 "FORCE_UPDATE": str(datetime.utcnow())
-            }
+            },
+            timeout=Duration.seconds(30),
         )
 
-        # Grant the Lambda function permission to write to the DynamoDB table
-        alarm_table.grant_write_data(alarm_logger)
+        # Read access is for the current-state items the logger updates
+        alarm_table.grant_read_write_data(alarm_logger)
+        incident_table.grant_read_write_data(alarm_logger)
+
+        # Fleet alarms are broken down into the URLs that breached
+        alarm_logger.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["cloudwatch:GetMetricData"],
+                resources=["*"],
+            )
+        )
 
         return alarm_logger
 
+    def create_alarm_logger_queue(self, alarm_topic, alarm_logger, fleet_check_topic=None):
+        """Queue between the alarm topics and the logger, drained in batches"""
+        dead_letter_queue = sqs.Queue(
+            self,
+            "AlarmLoggerDLQ",
+            retention_period=Duration.days(14)
+        )
+        alarm_queue = sqs.Queue(
+            self,
+            "AlarmLoggerQueue",
+            # At least six times the logger timeout, as Lambda recommends for SQS sources
+            visibility_timeout=Duration.seconds(180),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=dead_letter_queue)
+        )
+
+        # Keep the SNS envelope: its MessageId is part of the alarm table sort key
+        if fleet_check_topic is None:
+            alarm_topic.add_subscription(subs.SqsSubscription(alarm_queue))
+        else:
+            # The fleet checks are logged with the breached targets their trigger resolves to;
+            # logging the composite as well would record every breach twice
+            fleet_check_topic.add_subscription(subs.SqsSubscription(alarm_queue))
+            alarm_topic.add_subscription(subs.SqsSubscription(
+                alarm_queue,
+                filter_policy_with_message_body={"AlarmName": sns.FilterOrPolicy.filter(
+                    sns.SubscriptionFilter.string_filter(denylist=[self.fleet_health_alarm_name()]))},
+            ))
+
+        # Wait up to 10s to fill a batch; failed messages are retried individually
+        alarm_logger.add_event_source(lambda_event_sources.SqsEventSource(
+            alarm_queue,
+            batch_size=100,
+            max_batching_window=Duration.seconds(10),
+            report_batch_item_failures=True
+        ))
+
+        return alarm_queue
+
+    def create_alarm_archiver_lambda(self, alarm_table):
+        """Create the daily job archiving expiring alarm history to S3"""
+        archive_bucket = s3.Bucket(
+            self,
+            "AlarmArchiveBucket",
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            # Archives are read rarely, for long-range analysis
+            lifecycle_rules=[s3.LifecycleRule(transitions=[s3.Transition(
+                storage_class=s3.StorageClass.INFREQUENT_ACCESS,
+                transition_after=Duration.days(30)
+            )])]
+        )
+        alarm_archiver = _lambda.Function(
+            self,
+            "AlarmArchiverLambda",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="alarm_archiver.lambda_handler",
+            code=_lambda.Code.from_asset("lambda/alarm_archiver"),
+            environment={
+                "ALARM_TABLE": alarm_table.table_name,
+                "ARCHIVE_BUCKET": archive_bucket.bucket_name,
+                "RETENTION_DAYS": str(constants.ALARM_RETENTION_DAYS),
+                "ARCHIVE_LEAD_DAYS": "2",
+            },
+            timeout=Duration.minutes(5),
+            memory_size=512,
+        )
+
+        alarm_table.grant_read_data(alarm_archiver)
+        archive_bucket.grant_read_write(alarm_archiver)
+
+        rule = events.Rule(
+            self,
+            "AlarmArchiveScheduleRule",
+            schedule=events.Schedule.rate(Duration.days(1)),
+        )
+        rule.add_target(targets.LambdaFunction(alarm_archiver))
+
+        return alarm_archiver
+
     def create_dashboard(self):
         """Create CloudWatch Dashboard - Dynamic based on DynamoDB content"""
         dashboard = cloudwatch.Dashboard(
@@ -189,16 +335,123 @@ class AppStack(Stack):
         dashboard.add_widgets(latency_widget)
         dashboard.add_widgets(response_size_widget)
 
-    def create_alarms(self, alarm_topic):
-        """Create CloudWatch Alarms - Dynamic based on DynamoDB content"""
-        # Note: Alarms will be created dynamically by the web crawler
-        # or by a separate Lambda function that reads from DynamoDB
-        # This method creates the infrastructure but doesn't create specific alarms
-        # since we don't know which websites will be monitored at deployment time
-        
-        # The web crawler or a separate alarm manager will create alarms
-        # for websites that are added to DynamoDB via the CRUD API
-        pass  # Alarms created dynamically based on DynamoDB content
+    def create_alarms(self, alarm_topic, target_websites_table):
+        """Create the reconciler that keeps per-website CloudWatch alarms in line with DynamoDB"""
+        # Alarms depend on which websites are monitored, so they are managed at runtime:
+        # on every change to the websites table, plus an hourly full sync. In fleet mode
+        # only the hourly sync runs, deleting any alarms left under the prefix
+        alarm_reconciler = _lambda.Function(
+            self,
+            "AlarmReconcilerLambda",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="alarm_reconciler.lambda_handler",
+            code=_lambda.Code.from_asset("lambda/alarm_reconciler"),
+            environment={
+                "TARGET_WEBSITES_TABLE": target_websites_table.table_name,
+                "ALARM_TOPIC_ARN": alarm_topic.topic_arn,
+                "ALARM_NAME_PREFIX": ALARM_NAME_PREFIX,
+                "ALARM_MODE": constants.ALARM_MODE,
+                "NAMESPACE": constants.URL_MONITOR_NAMESPACE,
+                "AVAILABILITY_METRIC_NAME": constants.AVAILABILITY_METRIC_NAME,
+                "LATENCY_METRIC_NAME": constants.LATENCY_METRIC_NAME,
+                "RESPONSE_SIZE_METRIC_NAME": constants.RESPONSE_SIZE_METRIC_NAME,
+                "AVAIL_THRESHOLD": str(constants.AVAIL_THRESHOLD),
+                "LATENCY_THRESHOLD_MS": str(constants.LATENCY_THRESHOLD_MS),
+                "RESPONSE_SIZE_MIN_BYTES": str(constants.RESPONSE_SIZE_MIN_BYTES),
+            },
+            timeout=Duration.minutes(5),
+        )
+
+        target_websites_table.grant_read_data(alarm_reconciler)
+        alarm_reconciler.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["cloudwatch:DescribeAlarms"],
+                resources=["*"],
+            )
+        )
+        alarm_reconciler.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["cloudwatch:PutMetricAlarm", "cloudwatch:DeleteAlarms"],
+                resources=[self.format_arn(service="cloudwatch", resource="alarm",
+                                           resource_name=f"{ALARM_NAME_PREFIX}*",
+                                           arn_format=ArnFormat.COLON_RESOURCE_NAME)],
+            )
+        )
+
+        # A full sync that runs out of time invokes itself to continue. A separate policy,
+        # since the function already depends on its role's default policy
+        iam.Policy(
+            self,
+            "AlarmReconcilerContinuePolicy",
+            roles=[alarm_reconciler.role],
+            statements=[iam.PolicyStatement(actions=["lambda:InvokeFunction"],
+                                            resources=[alarm_reconciler.function_arn])],
+        )
+
+        # Stream batches only touch the websites they carry; failing batches are split to isolate bad records
+        if constants.ALARM_MODE != "fleet":
+            alarm_reconciler.add_event_source(lambda_event_sources.DynamoEventSource(
+                target_websites_table,
+                starting_position=_lambda.StartingPosition.LATEST,
+                batch_size=100,
+                max_batching_window=Duration.seconds(5),
+                bisect_batch_on_error=True,
+                retry_attempts=3
+            ))
+
+        rule = events.Rule(
+            self,
+            "AlarmReconcileScheduleRule",
+            schedule=events.Schedule.rate(Duration.hours(1)),
+        )
+        rule.add_target(targets.LambdaFunction(alarm_reconciler))
+
+        return alarm_reconciler
+
+    def fleet_health_alarm_name(self):
+        return f"{self.stack_name}-{FLEET_HEALTH_ALARM_SUFFIX}"
+
+    def create_fleet_alarms(self, alarm_topic, fleet_check_topic):
+        """Create fleet-level alarms whose count does not grow with the number of websites"""
+        # One Metrics Insights query per check aggregates every URL's series, so the worst
+        # website decides the fleet's state; the alarm logger resolves which URLs breached
+        namespace = constants.URL_MONITOR_NAMESPACE
+        checks = [
+            ("availability", f'SELECT MIN({constants.AVAILABILITY_METRIC_NAME}) FROM SCHEMA("{namespace}", URL)',
+             cloudwatch.ComparisonOperator.LESS_THAN_THRESHOLD, constants.AVAIL_THRESHOLD),
+            ("latency", f'SELECT MAX({constants.LATENCY_METRIC_NAME}) FROM SCHEMA("{namespace}", URL)',
+             cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD, constants.LATENCY_THRESHOLD_MS),
+            ("response_size", f'SELECT MIN({constants.RESPONSE_SIZE_METRIC_NAME}) FROM SCHEMA("{namespace}", URL)',
+             cloudwatch.ComparisonOperator.LESS_THAN_THRESHOLD, constants.RESPONSE_SIZE_MIN_BYTES),
+        ]
+        fleet_alarms = []
+        for check, query, comparison, threshold in checks:
+            alarm = cloudwatch.Alarm(
+                self,
+                f"fleet_{check}_alarm",
+                metric=cloudwatch.MathExpression(expression=query, period=Duration.minutes(5),
+                                                 label=f"Fleet {check}"),
+                comparison_operator=comparison,
+                threshold=threshold,
+                evaluation_periods=1,
+                alarm_description=f"At least one website breached the {check} threshold",
+                treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            )
+            # The logger needs these notifications: only they carry the query it resolves targets from
+            alarm.add_alarm_action(cloudwatch_actions.SnsAction(fleet_check_topic))
+            alarm.add_ok_action(cloudwatch_actions.SnsAction(fleet_check_topic))
+            fleet_alarms.append(alarm)
+
+        fleet_health = cloudwatch.CompositeAlarm(
+            self,
+            "fleet_health_alarm",
+            composite_alarm_name=self.fleet_health_alarm_name(),
+            alarm_rule=cloudwatch.AlarmRule.any_of(*fleet_alarms),
+            alarm_description="Website fleet unhealthy: one or more fleet checks are in ALARM",
+        )
+        fleet_health.add_alarm_action(cloudwatch_actions.SnsAction(alarm_topic))
+        fleet_health.add_ok_action(cloudwatch_actions.SnsAction(alarm_topic))
+        return fleet_health
 
     def create_operational_monitoring(self, wh_lambda, alarm_topic):
         """Create operational monitoring and blue-green deployment for Lambda"""
@@ -303,6 +556,18 @@ class AppStack(Stack):
         
         return deployment_group
 
+    def add_staged_indexes(self, table, indexes, stages, stage):
+        """
+        Give a table the GSIs of one rollout stage. CloudFormation creates or deletes
+        at most one GSI per table per update, so each stage differs from the one
+        before it by a single index and an existing stack is deployed stage by stage.
+        """
+        for previous, current in zip(stages, stages[1:]):
+            if len(set(previous) ^ set(current)) != 1:
+                raise ValueError(f"Index stages {previous} -> {current} must change exactly one GSI")
+        for index_name in stages[stage]:
+            table.add_global_secondary_index(index_name=index_name, **indexes[index_name])
+
     def create_alarm_table(self):
         """Create DynamoDB table for alarm logging"""
         # Use CDK-generated name to avoid conflicts
@@ -312,8 +577,29 @@ class AppStack(Stack):
             # Remove explicit table_name to let CDK generate a unique name
             partition_key=dynamodb.Attribute(name="AlarmName", type=dynamodb.AttributeType.STRING),
             sort_key=dynamodb.Attribute(name="Timestamp", type=dynamodb.AttributeType.STRING),
-            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            # History entries expire after the retention period; current-state items have no ExpiresAt
+            time_to_live_attribute="ExpiresAt"
         )
+        indexes = {
+            # Transitions across all alarms by UTC day, newest first (GET /alarms/recent)
+            "recent-transitions-index": dict(
+                partition_key=dynamodb.Attribute(name="TransitionDay", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="Timestamp", type=dynamodb.AttributeType.STRING),
+                projection_type=dynamodb.ProjectionType.INCLUDE,
+                non_key_attributes=["StateChangeTime", "State", "OldState", "Reason", "MessageId",
+                                    "TransitionCount", "LastState", "LastStateChangeTime"]
+            ),
+            # Sparse: only current-state items of alarms in ALARM carry Firing (GET /alarms/firing)
+            "firing-alarms-index": dict(
+                partition_key=dynamodb.Attribute(name="Firing", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="StateChangeTime", type=dynamodb.AttributeType.STRING),
+                projection_type=dynamodb.ProjectionType.INCLUDE,
+                non_key_attributes=["State", "Reason"]
+            ),
+        }
+        self.add_staged_indexes(alarm_table, indexes, ALARM_TABLE_INDEX_STAGES,
+                                constants.ALARM_TABLE_INDEX_STAGE)
         return alarm_table
     
     def create_target_websites_table(self):
@@ -322,19 +608,95 @@ class AppStack(Stack):
             self,
             "TargetWebsitesTable",
             partition_key=dynamodb.Attribute(name="id", type=dynamodb.AttributeType.STRING),
-            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            # Changes drive the alarm reconciler
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES
         )
         
-        # Add GSI for enabled websites (for efficient querying)
-        target_websites_table.add_global_secondary_index(
-            index_name="enabled-index",
-            partition_key=dynamodb.Attribute(name="enabled", type=dynamodb.AttributeType.STRING),
-            sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
-        )
+        indexes = {
+            # Original index on the 'enabled' attribute, kept until enabled-key-index replaces it.
+            # It is keyed as a string but websites store a boolean, so writes fail while it exists
+            "enabled-index": dict(
+                partition_key=dynamodb.Attribute(name="enabled", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
+            ),
+            # Every website sorted by creation time (paginated listing)
+            "created-at-index": dict(
+                partition_key=dynamodb.Attribute(name="record_type", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
+            ),
+            # Enabled websites, keyed on enabled_key ("true"/"false") because 'enabled' itself is a boolean
+            "enabled-key-index": dict(
+                partition_key=dynamodb.Attribute(name="enabled_key", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
+            ),
+            # Websites sorted by name for ?name_prefix= lookups
+            "name-index": dict(
+                partition_key=dynamodb.Attribute(name="record_type", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="name", type=dynamodb.AttributeType.STRING)
+            ),
+        }
+        self.add_staged_indexes(target_websites_table, indexes, WEBSITES_TABLE_INDEX_STAGES,
+                                constants.WEBSITES_TABLE_INDEX_STAGE)
         
         return target_websites_table
     
-    def create_crud_api_lambda(self, target_websites_table):
+    def create_search_index_table(self):
+        """Create DynamoDB table for the trigram search index over websites"""
+        # Search documents (SEARCH#) and postings (TRIGRAM#) grow with every website's text,
+        # so they stay out of the websites table, its stream and its scans
+        search_index_table = dynamodb.Table(
+            self,
+            "SearchIndexTable",
+            partition_key=dynamodb.Attribute(name="id", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+        # Created with the table, so it needs no staged rollout
+        search_index_table.add_global_secondary_index(
+            index_name="trigram-index",
+            partition_key=dynamodb.Attribute(name="trigram", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="website_id", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.KEYS_ONLY
+        )
+        return search_index_table
+    
+    def create_target_status_table(self):
+        """Create DynamoDB table for the crawler's last-known status per target"""
+        # Every record shares the "all" partition so the fleet is one paginated Query
+        target_status_table = dynamodb.Table(
+            self,
+            "TargetStatusTable",
+            partition_key=dynamodb.Attribute(name="fleet", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="website_id", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+        return target_status_table
+    
+    def create_idempotency_table(self):
+        """Create DynamoDB table for Idempotency-Key records of CRUD API POSTs"""
+        # Records expire through TTL; the handler also ignores expired records DynamoDB has not removed yet
+        idempotency_table = dynamodb.Table(
+            self,
+            "IdempotencyTable",
+            partition_key=dynamodb.Attribute(name="idempotency_key", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at"
+        )
+        return idempotency_table
+
+    def create_incident_table(self):
+        """Create DynamoDB table for incidents correlated from alarm transitions"""
+        # Holds incidents (INC#), correlation keys (KEY#) and alarm-to-incident links (ALARM#)
+        incident_table = dynamodb.Table(
+            self,
+            "IncidentTable",
+            partition_key=dynamodb.Attribute(name="incident_id", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+        return incident_table
+    
+    def create_crud_api_lambda(self, target_websites_table, target_status_table, idempotency_table, alarm_table,
+                               search_index_table):
         """Create the CRUD API Lambda function"""
         crud_lambda = _lambda.Function(
             self,
@@ -344,12 +706,51 @@ class AppStack(Stack):
             code=_lambda.Code.from_asset("lambda/crud_api"),
             environment={
                 "TARGET_WEBSITES_TABLE": target_websites_table.table_name,
+                "TARGET_STATUS_TABLE": target_status_table.table_name,
+                "IDEMPOTENCY_TABLE": idempotency_table.table_name,
+                "IDEMPOTENCY_TTL_SECONDS": "86400",
+                "ALARM_TABLE": alarm_table.table_name,
+                "SEARCH_INDEX_TABLE": search_index_table.table_name,
+                "NAMESPACE": constants.URL_MONITOR_NAMESPACE,
+                "AVAILABILITY_METRIC_NAME": constants.AVAILABILITY_METRIC_NAME,
+                "LATENCY_METRIC_NAME": constants.LATENCY_METRIC_NAME,
+                "RESPONSE_SIZE_METRIC_NAME": constants.RESPONSE_SIZE_METRIC_NAME,
+                "METRICS_CACHE_TTL_SECONDS": "60",
+                # Gzip responses larger than this for clients sending Accept-Encoding: gzip
+                "GZIP_MIN_BYTES": "1024",
+                "BINARY_MEDIA_TYPES": ",".join(BINARY_MEDIA_TYPES),
+                # Warm-container read cache for GET endpoints (CACHE_TTL_SECONDS=0 disables it)
+                "CACHE_TTL_SECONDS": "5",
+                "CACHE_MAX_ENTRIES": "256",
+                "CACHE_VERSION_CHECK_SECONDS": "1",
             },
             timeout=Duration.seconds(30),
         )
         
         # Grant the Lambda function permission to read/write to the target websites table
         target_websites_table.grant_read_write_data(crud_lambda)
+        target_status_table.grant_read_data(crud_lambda)
+        idempotency_table.grant_read_write_data(crud_lambda)
+        alarm_table.grant_read_data(crud_lambda)
+        search_index_table.grant_read_write_data(crud_lambda)
+        
+        # The fleet counters are kept from the table's stream, off the request path.
+        # A batch is one counter update, so it is not split or retried piecemeal
+        crud_lambda.add_event_source(lambda_event_sources.DynamoEventSource(
+            target_websites_table,
+            starting_position=_lambda.StartingPosition.LATEST,
+            batch_size=1000,
+            max_batching_window=Duration.seconds(5),
+            retry_attempts=10
+        ))
+        
+        # Allow the Lambda to read crawler metrics for the /metrics endpoints
+        crud_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["cloudwatch:GetMetricData"],
+                resources=["*"],
+            )
+        )
         
         return crud_lambda
     
@@ -363,8 +764,11 @@ class AppStack(Stack):
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_origins=apigateway.Cors.ALL_ORIGINS,
                 allow_methods=apigateway.Cors.ALL_METHODS,
-                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Amz-Security-Token"]
-            )
+                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Amz-Security-Token", "If-Match", "If-None-Match", "Idempotency-Key"]
+            ),
+            # Let the CRUD Lambda return gzip bodies (isBase64Encoded) as binary.
+            # Request bodies of these types then arrive base64 encoded and are decoded by the handler.
+            binary_media_types=BINARY_MEDIA_TYPES
         )
         
         # Create Lambda integration
@@ -382,6 +786,30 @@ class AppStack(Stack):
         # POST /websites - Create new website
         websites_resource.add_method("POST", crud_integration)
         
+        # POST /websites:batch - Bulk import websites (JSON array or NDJSON)
+        websites_batch_resource = api.root.add_resource("websites:batch")
+        websites_batch_resource.add_method("POST", crud_integration)
+        
+        # GET /websites:export - Stream every website as NDJSON or CSV
+        websites_export_resource = api.root.add_resource("websites:export")
+        websites_export_resource.add_method("GET", crud_integration)
+        
+        # GET /websites/search - Ranked trigram search over names and hostnames
+        websites_search_resource = websites_resource.add_resource("search")
+        websites_search_resource.add_method("GET", crud_integration)
+        
+        # GET /websites/status - Last-known status of every target
+        websites_status_resource = websites_resource.add_resource("status")
+        websites_status_resource.add_method("GET", crud_integration)
+        
+        # GET /websites/stats - Maintained fleet counters
+        websites_stats_resource = websites_resource.add_resource("stats")
+        websites_stats_resource.add_method("GET", crud_integration)
+        
+        # GET /websites/metrics?ids= - Crawler metrics for many websites
+        websites_metrics_resource = websites_resource.add_resource("metrics")
+        websites_metrics_resource.add_method("GET", crud_integration)
+        
         # Create /websites/{id} resource
         website_by_id_resource = websites_resource.add_resource("{id}")
         
@@ -394,7 +822,29 @@ class AppStack(Stack):
         # DELETE /websites/{id} - Delete website
         website_by_id_resource.add_method("DELETE", crud_integration)
         
+        # GET /websites/{id}/metrics - Crawler metrics for one website
+        website_metrics_resource = website_by_id_resource.add_resource("metrics")
+        website_metrics_resource.add_method("GET", crud_integration)
+        
+        # GET /alarms/recent - State transitions across every alarm
+        alarms_resource = api.root.add_resource("alarms")
+        recent_alarms_resource = alarms_resource.add_resource("recent")
+        recent_alarms_resource.add_method("GET", crud_integration)
+        
+        # GET /alarms/firing - Alarms currently in ALARM
+        firing_alarms_resource = alarms_resource.add_resource("firing")
+        firing_alarms_resource.add_method("GET", crud_integration)
+        
+        # GET /alarms/{name}/history - State transitions of one alarm
+        alarm_by_name_resource = alarms_resource.add_resource("{name}")
+        alarm_history_resource = alarm_by_name_resource.add_resource("history")
+        alarm_history_resource.add_method("GET", crud_integration)
+        
         # CORS is handled automatically by default_cors_preflight_options above
-        # No need to add OPTIONS methods manually
+        # No need to add OPTIONS methods manually, but their MOCK integrations must not
+        # treat a preflight carrying a binary Content-Type as a binary payload
+        for method in api.methods:
+            if method.http_method == "OPTIONS":
+                method.node.default_child.add_property_override("Integration.ContentHandling", "CONVERT_TO_TEXT")
         
         return api
\ No newline at end of file
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+bench_gzip_response.py - Wire size and latency of gzip-compressed CRUD responses
+
+Builds a GET /websites style response for a synthetic fleet, then compares
+the plain body with the gzip + base64 body produced by compress_response.
+Only the CPU times are measured. End-to-end latency is a model, not a
+measurement: serialization + compression + transfer at the given bandwidth
++ client-side decompression, leaving out API Gateway, TLS and round trips.
+
+Usage:
+    python benchmarks/bench_gzip_response.py [--items 5000] [--bandwidth-mbps 50] [--repeat 5]
+"""
+import argparse
+import base64
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'crud_api'))
+# crud_handler creates its boto3 clients at import; no AWS calls are made here
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from bench_json_encoding import make_items
+import crud_handler
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--bandwidth-mbps", type=float, default=50.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    body = {"websites": make_items(args.items), "count": args.items, "next_cursor": None}
+    bytes_per_second = args.bandwidth_mbps * 1_000_000 / 8
+
+    encode_time, plain = best_of(lambda: crud_handler.create_response(200, body, content_etag=True), args.repeat)
+    compress_time, zipped = best_of(lambda: crud_handler.compress_response(plain, 'gzip', 'application/json'), args.repeat)
+    wire = base64.b64decode(zipped['body'])
+    decompress_time, _ = best_of(lambda: gzip.decompress(wire), args.repeat)
+
+    plain_bytes = len(plain['body'].encode('utf-8'))
+    # API Gateway decodes isBase64Encoded bodies, so the client receives the raw gzip bytes
+    gzip_bytes = len(wire)
+    plain_total = encode_time + plain_bytes / bytes_per_second
+    gzip_total = encode_time + compress_time + gzip_bytes / bytes_per_second + decompress_time
+
+    print(f"{args.items} websites at {args.bandwidth_mbps:g} Mbit/s")
+    print(f"{'plain':<6} wire={plain_bytes / 1024:9.1f} KiB  modelled end-to-end={plain_total * 1000:8.1f} ms")
+    print(f"{'gzip':<6} wire={gzip_bytes / 1024:9.1f} KiB  modelled end-to-end={gzip_total * 1000:8.1f} ms "
+          f"(compress {compress_time * 1000:.1f} ms, decompress {decompress_time * 1000:.1f} ms)")
+    print(f"Bytes on the wire reduced by {(1 - gzip_bytes / plain_bytes) * 100:.1f}%, "
+          f"modelled latency reduced by {(1 - gzip_total / plain_total) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+bench_json_encoding.py - Serialization benchmark for CRUD API responses
+
+Compares the old convert_decimals() copy followed by json.dumps against the
+single-pass decimal_json encoder on a list of DynamoDB-style items, and
+reports wall time and tracemalloc peaks.
+
+Usage:
+    python benchmarks/bench_json_encoding.py [--items 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'crud_api'))
+
+import decimal_json
+
+
+def convert_decimals(obj):
+    """Previous implementation: recursive copy converting Decimals to floats"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    elif isinstance(obj, dict):
+        return {k: convert_decimals(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_decimals(item) for item in obj]
+    else:
+        return obj
+
+
+def make_items(count):
+    """Items shaped like boto3 returns them (numbers as Decimal)"""
+    return [
+        {
+            'id': f'00000000-0000-0000-0000-{i:012d}',
+            'url': f'https://target-{i}.example.com/',
+            'name': f'Target {i}',
+            'description': 'Synthetic benchmark target',
+            'enabled': i % 7 != 0,
+            'check_interval': Decimal(300),
+            'timeout': Decimal(30),
+            'expected_status': Decimal(200),
+            'created_at': '2026-01-01T00:00:00.000000',
+            'updated_at': '2026-01-01T00:00:00.000000',
+            'version': Decimal(i % 5 + 1),
+        }
+        for i in range(count)
+    ]
+
+
+def old_encode(items):
+    return json.dumps({"websites": convert_decimals(items), "count": len(items)})
+
+
+def new_encode(items):
+    return decimal_json.dumps({"websites": items, "count": len(items)})
+
+
+def measure(label, func, items, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(items)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(items)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} best={best * 1000:8.1f} ms  peak={peak / 1024 / 1024:7.2f} MiB")
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    print(f"Serializing {args.items} items")
+    old_time, old_peak = measure("convert_decimals+dumps", old_encode, items, args.repeat)
+    new_time, new_peak = measure("decimal_json.dumps", new_encode, items, args.repeat)
+    print(f"Time reduced by {(1 - new_time / old_time) * 100:.1f}%, "
+          f"peak memory reduced by {(1 - new_peak / old_peak) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
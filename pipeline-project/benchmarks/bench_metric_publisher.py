@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+bench_metric_publisher.py - Memory and PutMetricData benchmark for the crawler's publish path
+
+Replays synthetic probes through two publish paths and reports the
+tracemalloc peak and the number of PutMetricData calls of each:
+
+- baseline: the crawler loop before batching. Each URL's payload is built,
+  sent in its own put_metric_data call and dropped, so nothing accumulates.
+- MetricPublisher: the current crawler. Probes are added as they finish and
+  sent up to 1000 datums per call, so it holds at most one call's payload.
+
+Both paths are run at two shard sizes to show whether the peak grows with
+the number of targets. The publisher's peak is one buffered call, which is
+more than the baseline's single datum list but does not grow with the shard.
+
+CloudWatch is a stub that only counts calls, so the times are CPU cost only.
+The publisher spends a little more CPU per probe on size accounting; the
+times do not include the network round trips the batching saves.
+
+Usage:
+    python benchmarks/bench_metric_publisher.py [--targets 100000]
+"""
+import argparse
+import importlib.util
+import os
+import random
+import time
+import tracemalloc
+
+CRAWLER_PATH = os.path.join(os.path.dirname(__file__), '..', 'lambda', 'website_crawler', 'lambda_function.py')
+
+
+class CountingCloudWatch:
+    """Stand-in CloudWatch client that records how many calls and datums it received"""
+
+    def __init__(self):
+        self.calls = 0
+        self.datums = 0
+
+    def put_metric_data(self, Namespace, MetricData):
+        self.calls += 1
+        self.datums += len(MetricData)
+
+
+def load_crawler():
+    """Import the crawler module the same way the tests do"""
+    spec = importlib.util.spec_from_file_location("lambda_function", CRAWLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_probes(crawler, count):
+    rng = random.Random(42)
+    for i in range(count):
+        status = 200 if rng.random() > 0.05 else 503
+        error = crawler.PROBE_OK if status == 200 else crawler.PROBE_HTTP_ERROR
+        yield crawler.Probe(f"https://target-{i}.example.com/", status, rng.uniform(20, 900), rng.randint(500, 200000), error)
+
+
+def run_baseline(cw, probes):
+    """The pre-batching loop: probe, publish that URL's three datums, move on"""
+    successful_checks = 0
+    failed_checks = 0
+    for url, status, latency_ms, size, error in probes:
+        availability = 1 if status == 200 else 0
+        if status == 200:
+            successful_checks += 1
+        else:
+            failed_checks += 1
+        cw.put_metric_data(
+            Namespace="bench",
+            MetricData=[
+                {"MetricName": "Availability", "Dimensions": [{"Name": "URL", "Value": url}], "Value": availability},
+                {"MetricName": "Latency", "Dimensions": [{"Name": "URL", "Value": url}], "Value": latency_ms},
+                {"MetricName": "ResponseSize", "Dimensions": [{"Name": "URL", "Value": url}], "Value": size},
+            ],
+        )
+    return successful_checks, failed_checks
+
+
+def run_publisher(crawler, cw, probes):
+    """The current crawler loop: each probe goes to MetricPublisher as it finishes"""
+    publisher = crawler.MetricPublisher(cw, "bench", "Availability", "Latency", "ResponseSize")
+    for result in probes:
+        publisher.add(result)
+    publisher.flush()
+
+
+def measure(label, func):
+    cw = CountingCloudWatch()
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(cw)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} peak={peak / 1024 / 1024:8.2f} MiB  cpu={elapsed:6.2f}s  "
+          f"put_metric_data calls={cw.calls:>7}  datums={cw.datums}")
+    return peak, cw.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--targets", type=int, default=100000)
+    args = parser.parse_args()
+
+    crawler = load_crawler()
+    for count in (args.targets // 10, args.targets):
+        # Probes are generated lazily, the way the crawler produces them one at a time
+        print(f"Publishing {count} synthetic probes")
+        base_peak, base_calls = measure(f"baseline ({count})",
+                                        lambda cw: run_baseline(cw, synthetic_probes(crawler, count)))
+        publisher_peak, publisher_calls = measure(f"MetricPublisher ({count})",
+                                                  lambda cw: run_publisher(crawler, cw, synthetic_probes(crawler, count)))
+        print(f"Peak memory: {(publisher_peak - base_peak) / 1024:.0f} KiB more than the baseline "
+              f"(one buffered PutMetricData call)")
+        print(f"PutMetricData calls: {base_calls} -> {publisher_calls} ({base_calls / publisher_calls:.0f}x fewer)")
+
+
+if __name__ == "__main__":
+    main()
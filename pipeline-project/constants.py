@@ -12,3 +12,17 @@ ALERT_EMAIL = "22070210@student.westernsydney.edu.au"
 AVAIL_THRESHOLD = 0.99
 LATENCY_THRESHOLD_MS = 500
 RESPONSE_SIZE_MIN_BYTES = 1
+
+# Alarm history stays in DynamoDB this long, then lives on in the S3 archive
+ALARM_RETENTION_DAYS = 90
+
+# "per_target": three alarms per enabled website, kept in sync by the alarm reconciler
+# "fleet": a constant set of Metrics Insights alarms over the whole namespace plus one composite
+ALARM_MODE = "per_target"
+
+# GSI rollout stage of the websites and alarm tables (see WEBSITES_TABLE_INDEX_STAGES and
+# ALARM_TABLE_INDEX_STAGES in AppStack.py). CloudFormation can add or remove only one GSI per
+# table per deployment, and the pipeline deploys every push: deployed stacks were at stage 0
+# of both, so these are raised by one per commit, each pushed once the previous deploy finished.
+WEBSITES_TABLE_INDEX_STAGE = 1
+ALARM_TABLE_INDEX_STAGE = 1
@@ -0,0 +1,202 @@
+"""
+alarm_archiver.py - Archives alarm history before TTL removes it
+
+Every transition the alarm logger writes carries an ExpiresAt TTL of
+RETENTION_DAYS. Once a day this job takes the UTC days about to expire from
+the recent-transitions-index and writes each as one gzip-compressed NDJSON
+file, partitioned by day:
+
+    alarms/day=2024-01-01/transitions.ndjson.gz
+
+The sink is S3 (ARCHIVE_BUCKET) in the deployed stack or a local directory
+(ARCHIVE_DIR) for tests and local runs. A day already archived is never
+rewritten, because by then TTL may have removed part of it from the table.
+read_archive streams archived ranges back one transition at a time.
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+RECENT_INDEX = "recent-transitions-index"
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "90"))
+# Archive a day this many days before it starts expiring
+ARCHIVE_LEAD_DAYS = int(os.environ.get("ARCHIVE_LEAD_DAYS", "2"))
+# Days before the newest archivable one that are retried if a run was missed
+CATCHUP_DAYS = int(os.environ.get("CATCHUP_DAYS", "7"))
+ARCHIVE_PREFIX = "alarms"
+BATCH_GET_LIMIT = 100
+# Spill the compressed day to disk past this size instead of holding it in memory
+SPOOL_BYTES = 8 * 1024 * 1024
+
+
+class LocalSink:
+    """Archive files under a local directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, *key.split("/"))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, fileobj):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a crashed run never leaves a partial archive behind
+        with open(path + ".tmp", "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        os.replace(path + ".tmp", path)
+
+    def open(self, key):
+        return open(self.path(key), "rb") if self.exists(key) else None
+
+
+class S3Sink:
+    """Archive objects in an S3 bucket"""
+
+    def __init__(self, bucket, s3=None):
+        self.bucket = bucket
+        self.s3 = s3 or boto3.client("s3")
+
+    def exists(self, key):
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self.s3.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key, fileobj):
+        # Multipart for large days; the object only appears once the upload completes
+        self.s3.upload_fileobj(fileobj, self.bucket, key, ExtraArgs={
+            "ContentType": "application/x-ndjson", "ContentEncoding": "gzip"})
+
+    def open(self, key):
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=key)["Body"]
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+
+def default_sink():
+    if os.environ.get("ARCHIVE_BUCKET"):
+        return S3Sink(os.environ["ARCHIVE_BUCKET"])
+    return LocalSink(os.environ.get("ARCHIVE_DIR", "alarm-archive"))
+
+
+def archive_key(day):
+    return f"{ARCHIVE_PREFIX}/day={day}/transitions.ndjson.gz"
+
+
+def to_json(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def day_keys(table, day):
+    """Keys of one day's transitions, oldest first. The index only projects some attributes."""
+    params = {
+        "IndexName": RECENT_INDEX,
+        "KeyConditionExpression": Key("TransitionDay").eq(day),
+        "ProjectionExpression": "AlarmName, #ts",
+        "ExpressionAttributeNames": {"#ts": "Timestamp"},
+    }
+    while True:
+        response = table.query(**params)
+        for item in response.get("Items", []):
+            yield {"AlarmName": item["AlarmName"], "Timestamp": item["Timestamp"]}
+        if not response.get("LastEvaluatedKey"):
+            return
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def full_items(table, keys):
+    """Whole items for index keys, in the order given (BatchGetItem)"""
+    keys = list(keys)
+    client = table.meta.client
+    for start in range(0, len(keys), BATCH_GET_LIMIT):
+        chunk = keys[start:start + BATCH_GET_LIMIT]
+        found = {}
+        request = {table.name: {"Keys": chunk}}
+        while request:
+            response = client.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(table.name, []):
+                found[(item["AlarmName"], item["Timestamp"])] = item
+            request = response.get("UnprocessedKeys")
+        for key in chunk:
+            # Items TTL removed between the query and the read are simply skipped
+            if (key["AlarmName"], key["Timestamp"]) in found:
+                yield found[(key["AlarmName"], key["Timestamp"])]
+
+
+def archive_day(table, sink, day):
+    """Write one day's transitions to the sink. Returns how many were archived."""
+    count = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        with gzip.GzipFile(fileobj=spool, mode="wb") as out:
+            for item in full_items(table, day_keys(table, day)):
+                out.write(json.dumps(item, default=to_json, sort_keys=True).encode("utf-8") + b"\n")
+                count += 1
+        if count:
+            spool.seek(0)
+            sink.put(archive_key(day), spool)
+    return count
+
+
+def archivable_days(now):
+    """Days from CATCHUP_DAYS back up to the newest day within ARCHIVE_LEAD_DAYS of expiring"""
+    newest = (now - timedelta(days=RETENTION_DAYS - ARCHIVE_LEAD_DAYS)).date()
+    return [(newest - timedelta(days=back)).isoformat() for back in range(CATCHUP_DAYS, -1, -1)]
+
+
+def archive_expiring(table, sink, now=None):
+    """Archive every expiring day not archived yet. Returns {day: transitions archived}."""
+    archived = {}
+    for day in archivable_days(now or datetime.now(timezone.utc)):
+        if sink.exists(archive_key(day)):
+            continue
+        count = archive_day(table, sink, day)
+        if count:
+            archived[day] = count
+    return archived
+
+
+def read_archive(sink, start, end, alarm_name=None):
+    """
+    Stream archived transitions with StateChangeTime between start and end
+    (ISO 8601 UTC), oldest first, optionally for one alarm. Days are read one
+    at a time and decompressed line by line, so long ranges stay cheap in memory.
+    """
+    day = datetime.fromisoformat(start[:10]).date()
+    last_day = datetime.fromisoformat(end[:10]).date()
+    while day <= last_day:
+        body = sink.open(archive_key(day.isoformat()))
+        if body is not None:
+            with gzip.GzipFile(fileobj=body, mode="rb") as lines:
+                for line in lines:
+                    item = json.loads(line)
+                    if alarm_name and item["AlarmName"] != alarm_name:
+                        continue
+                    if start <= item["StateChangeTime"] <= end:
+                        yield item
+        day += timedelta(days=1)
+
+
+def lambda_handler(event, context):
+    table = boto3.resource("dynamodb").Table(os.environ["ALARM_TABLE"])
+    archived = archive_expiring(table, default_sink())
+    print(json.dumps({"archived_days": archived}))
+    return {"statusCode": 200, "archived": archived}
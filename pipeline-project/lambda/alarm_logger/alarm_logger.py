@@ -1,73 +1,450 @@
 import json
+import hashlib
 import boto3
 import os
-from datetime import datetime
+from datetime import datetime, timezone
+
+import fleet_breaches
+import incident_correlator
 
 dynamodb = boto3.resource("dynamodb")
+cloudwatch = boto3.client("cloudwatch")
 table_name = os.environ["ALARM_TABLE"]
 table = dynamodb.Table(table_name)
+# Incident correlation is skipped when no incident table is configured
+incident_table = dynamodb.Table(os.environ["INCIDENT_TABLE"]) if os.environ.get("INCIDENT_TABLE") else None
+
+# CloudWatch formats StateChangeTime as 2024-01-01T00:00:00.000+0000
+STATE_CHANGE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+# Current-state item kept per alarm next to its history. Letters sort after the
+# digits history keys start with, so history range queries never reach it.
+CURRENT_STATE_KEY = "CURRENT"
+# Set only while an alarm is in ALARM, so firing-alarms-index holds firing alarms only
+FIRING_STATE = "ALARM"
+
+# Flap detection: an alarm with FLAP_THRESHOLD or more transitions inside the
+# sliding window is flapping. Its transitions are then folded into one
+# aggregated history entry instead of one row each, until the rate drops again.
+FLAP_WINDOW_SECONDS = int(os.environ.get("FLAP_WINDOW_SECONDS", "3600"))
+FLAP_THRESHOLD = int(os.environ.get("FLAP_THRESHOLD", "6"))
+FLAPPING_STATE = "FLAPPING"
+BATCH_GET_LIMIT = 100
+# Times an alarm's transitions are re-planned after a newer one moved its state first
+PLAN_ATTEMPTS = 3
+
+# History entries expire through the table's ExpiresAt TTL; alarm_archiver
+# archives each day shortly before. Current-state items never expire.
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "90"))
+
+
+def parse_time(value):
+    """Normalize a CloudWatch or SNS timestamp to sortable UTC ISO 8601, or None"""
+    if not value:
+        return None
+    for fmt in (STATE_CHANGE_TIME_FORMAT, "%Y-%m-%dT%H:%M:%S.%fZ"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc).isoformat()
+    return None
+
+
+def expires_at(state_change_time):
+    return int(datetime.fromisoformat(state_change_time).timestamp()) + RETENTION_DAYS * 86400
+
+
+def alarm_item(message, message_id, sns_timestamp=None):
+    """
+    Table item for one alarm notification. The sort key is the alarm's
+    StateChangeTime plus the SNS MessageId, so two transitions never collide
+    and a redelivered message rewrites the same item instead of adding one.
+    """
+    state_change_time = (parse_time(message.get("StateChangeTime")) or parse_time(sns_timestamp)
+                         or datetime.now(timezone.utc).isoformat())
+    if not message_id:
+        # Direct invocations have no MessageId; the content makes retries land on the same key
+        message_id = hashlib.sha256(json.dumps(message, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+    item = {
+        "AlarmName": message["AlarmName"],
+        "Timestamp": f"{state_change_time}#{message_id}",
+        "StateChangeTime": state_change_time,
+        # Partition of the recent-transitions-index (UTC day)
+        "TransitionDay": state_change_time[:10],
+        "MessageId": message_id,
+        "State": message.get("NewStateValue") or "UNKNOWN",
+        "OldState": message.get("OldStateValue") or "UNKNOWN",
+        "Reason": message.get("NewStateReason") or "",
+        "ExpiresAt": expires_at(state_change_time),
+    }
+    # The metric and monitored URL are what incidents are correlated on
+    trigger = message.get("Trigger") if isinstance(message.get("Trigger"), dict) else {}
+    if trigger.get("MetricName"):
+        item["MetricName"] = trigger["MetricName"]
+    for dimension in trigger.get("Dimensions") or []:
+        # SNS alarm payloads spell dimension keys in lower case
+        if (dimension.get("name") or dimension.get("Name")) == "URL":
+            item["Target"] = dimension.get("value") or dimension.get("Value")
+    # Fleet alarms cover every URL at once; record which ones breached when one fires
+    query = fleet_breaches.fleet_query(trigger)
+    if query:
+        item["MetricName"] = query[1]
+        if item["State"] == FIRING_STATE:
+            try:
+                breached, truncated = fleet_breaches.breached_targets(cloudwatch, trigger, query,
+                                                                      state_change_time)
+                item["BreachedTargets"] = breached
+                if truncated:
+                    # Only the first SEARCH_SERIES_LIMIT series were checked
+                    item["BreachedTargetsTruncated"] = True
+            except Exception as e:
+                # Logging the transition matters more than the breakdown
+                print(f"Could not resolve breached targets of {item['AlarmName']}: {e}")
+    return item
+
+
+def parse_record(record):
+    """Alarm item for one SNS record, or None when the record carries no alarm"""
+    sns_obj = record.get("Sns") or record.get("SNS")
+    if not sns_obj:
+        return None
+
+    raw_message = sns_obj.get("Message")
+    if raw_message is None:
+        return None
+
+    # Parse message which can be a JSON string or already a dict
+    if isinstance(raw_message, str):
+        try:
+            message = json.loads(raw_message)
+        except json.JSONDecodeError:
+            # If not JSON, store as raw reason
+            message = {"AlarmName": "UNKNOWN", "NewStateValue": "UNKNOWN", "NewStateReason": raw_message}
+    elif isinstance(raw_message, dict):
+        message = raw_message
+    else:
+        return None
+
+    # Require keys for the PK/SK
+    if not isinstance(message, dict) or not message.get("AlarmName"):
+        return None
+
+    return alarm_item(message, sns_obj.get("MessageId"), sns_obj.get("Timestamp"))
+
+
+def parse_queue_record(record):
+    """Alarm item for one SQS record carrying an SNS notification, or None"""
+    body = json.loads(record["body"])
+    if "Message" in body:
+        return parse_record({"Sns": body})
+    # Raw message delivery: the body is the alarm itself
+    if isinstance(body, dict) and body.get("AlarmName"):
+        return alarm_item(body, record.get("messageId"))
+    return None
+
+
+def item_key(item):
+    return (item["AlarmName"], item["Timestamp"])
+
+
+def dedupe(items):
+    """Drop repeats of the same key within an invocation. Returns (unique, duplicates)"""
+    unique = {}
+    for item in items:
+        unique.setdefault(item_key(item), item)
+    return list(unique.values()), len(items) - len(unique)
+
+
+def write_items(items):
+    """Write history rows through one batch_writer, returning how many were written"""
+    with table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    return len(items)
+
+
+def load_current_states(alarm_names):
+    """Current-state items of the given alarms, keyed by alarm name (BatchGetItem)"""
+    states = {}
+    names = list(alarm_names)
+    for start in range(0, len(names), BATCH_GET_LIMIT):
+        request = {table_name: {
+            "Keys": [{"AlarmName": name, "Timestamp": CURRENT_STATE_KEY} for name in names[start:start + BATCH_GET_LIMIT]],
+            "ConsistentRead": True,
+        }}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(table_name, []):
+                states[item["AlarmName"]] = item
+            request = response.get("UnprocessedKeys")
+    return states
+
+
+def load_current_state(alarm_name):
+    return table.get_item(Key={"AlarmName": alarm_name, "Timestamp": CURRENT_STATE_KEY},
+                          ConsistentRead=True).get("Item")
+
+
+def transition_epoch(item):
+    return int(datetime.fromisoformat(item["StateChangeTime"]).timestamp())
+
+
+def plan_alarm(current, items):
+    """
+    Decide what one alarm's new transitions turn into, oldest first.
+    Transitions no newer than the current state (late arrivals and redeliveries)
+    only go to history. Newer ones move the sliding window, and are kept as
+    rows unless the alarm is flapping, in which case they are folded into the
+    aggregated entry of that flapping episode (keyed by when it started).
+    "latest" is None when the current state does not move.
+    """
+    current = current or {}
+    last = current.get("LastTransition", "")
+    recent = [int(t) for t in current.get("RecentTransitions", [])]
+    flapping_since = current.get("FlappingSince")
+    rows, flapped, latest = [], {}, None
+    for item in sorted(items, key=lambda item: item["Timestamp"]):
+        if item["Timestamp"] <= last:
+            rows.append(item)
+            continue
+        now = transition_epoch(item)
+        recent = [t for t in recent if t > now - FLAP_WINDOW_SECONDS] + [now]
+        if flapping_since is None and len(recent) >= FLAP_THRESHOLD:
+            flapping_since = item["StateChangeTime"]
+        elif flapping_since is not None and len(recent) < FLAP_THRESHOLD:
+            flapping_since = None
+        if flapping_since:
+            flapped.setdefault(flapping_since, []).append(item)
+        else:
+            rows.append(item)
+        last, latest = item["Timestamp"], item
+    return {"rows": rows, "flapped": flapped, "latest": latest,
+            "recent": recent, "flapping_since": flapping_since}
+
+
+def flapping_entry_update(alarm_name, flapping_since, flapped):
+    """UpdateItem parameters adding flapped transitions to the aggregated history entry"""
+    latest = flapped[-1]
+    return {
+        "Key": {"AlarmName": alarm_name, "Timestamp": f"{flapping_since}#{FLAPPING_STATE}"},
+        "UpdateExpression": ("SET StateChangeTime = :since, TransitionDay = :day, MessageId = :flapping, "
+                             "#state = :flapping, Reason = :reason, LastState = :last_state, "
+                             "LastStateChangeTime = :last_changed, ExpiresAt = :expires ADD TransitionCount :count"),
+        "ExpressionAttributeNames": {"#state": "State"},
+        "ExpressionAttributeValues": {
+            ":since": flapping_since,
+            ":day": flapping_since[:10],
+            ":flapping": FLAPPING_STATE,
+            ":reason": f"Flapping: at least {FLAP_THRESHOLD} transitions within {FLAP_WINDOW_SECONDS}s",
+            ":last_state": latest["State"],
+            ":last_changed": latest["StateChangeTime"],
+            ":count": len(flapped),
+            ":expires": expires_at(flapping_since),
+        },
+    }
+
+
+def current_state_update(alarm_name, plan):
+    """UpdateItem parameters moving the current-state item to the plan's latest transition"""
+    latest = plan["latest"]
+    sets = ["#state = :state", "OldState = :old_state", "Reason = :reason", "StateChangeTime = :changed",
+            "MessageId = :message_id", "LastTransition = :transition", "RecentTransitions = :recent"]
+    removes = []
+    values = {
+        ":state": latest["State"],
+        ":old_state": latest["OldState"],
+        ":reason": latest["Reason"],
+        ":changed": latest["StateChangeTime"],
+        ":message_id": latest["MessageId"],
+        ":transition": latest["Timestamp"],
+        ":recent": plan["recent"],
+    }
+    if latest["State"] == FIRING_STATE:
+        sets.append("Firing = :firing")
+        values[":firing"] = FIRING_STATE
+    else:
+        removes.append("Firing")
+    if plan["flapping_since"]:
+        sets.append("FlappingSince = :flapping_since")
+        values[":flapping_since"] = plan["flapping_since"]
+    else:
+        removes.append("FlappingSince")
+    update = "SET " + ", ".join(sets)
+    if removes:
+        update += " REMOVE " + ", ".join(removes)
+    return {
+        "Key": {"AlarmName": alarm_name, "Timestamp": CURRENT_STATE_KEY},
+        "UpdateExpression": update,
+        # Transition keys are StateChangeTime#MessageId, so they also order same-instant changes
+        "ConditionExpression": "attribute_not_exists(LastTransition) OR LastTransition < :transition",
+        "ExpressionAttributeNames": {"#state": "State"},
+        "ExpressionAttributeValues": values,
+    }
+
+
+def apply_plan(alarm_name, plan):
+    """
+    Move the current state and, when flapping, the aggregated entry together.
+    Returns False when a newer transition got there first.
+    """
+    current_update = current_state_update(alarm_name, plan)
+    try:
+        if not plan["flapped"]:
+            table.update_item(**current_update)
+            return True
+        # One transaction, so a lost race cannot count the same transitions twice
+        table.meta.client.transact_write_items(TransactItems=[
+            {"Update": {"TableName": table_name, **current_update}},
+        ] + [
+            {"Update": {"TableName": table_name, **flapping_entry_update(alarm_name, since, episode)}}
+            for since, episode in plan["flapped"].items()
+        ])
+        return True
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    except table.meta.client.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get("CancellationReasons") or []
+        if reasons and reasons[0].get("Code") == "ConditionalCheckFailed":
+            return False
+        raise
+
+
+def apply_alarm(alarm_name, plan, items, stored):
+    """
+    Apply one alarm's plan. When another invocation moved the current state
+    first, the plan is redone from the state stored now, so transitions it had
+    folded into a flapping entry are written as history rows instead of being
+    lost. Returns (applied plan, times it was redone); raises when the state
+    kept moving for PLAN_ATTEMPTS plans, so the messages are processed again.
+    stored holds the keys of history rows already written and is updated.
+    """
+    for attempt in range(PLAN_ATTEMPTS):
+        if attempt:
+            plan = plan_alarm(load_current_state(alarm_name), items)
+            for row in plan["rows"]:
+                if item_key(row) not in stored:
+                    table.put_item(Item=row)
+                    stored.add(item_key(row))
+        if plan["latest"] is None or apply_plan(alarm_name, plan):
+            return plan, attempt
+    raise RuntimeError(f"Current state kept moving during {PLAN_ATTEMPTS} attempts")
+
+
+def process_items(items):
+    """
+    Log one invocation's transitions: history rows in one batch, then each
+    alarm's current state (and flapping entry). Returns (summary, failed items);
+    failed items were not fully applied and are safe to process again.
+    """
+    items, duplicates = dedupe(items)
+    by_alarm = {}
+    for item in items:
+        by_alarm.setdefault(item["AlarmName"], []).append(item)
+    current = load_current_states(by_alarm)
+    plans = {name: plan_alarm(current.get(name), alarm_items) for name, alarm_items in by_alarm.items()}
+
+    rows = [row for plan in plans.values() for row in plan["rows"]]
+    unstored = set()
+    try:
+        write_items(rows)
+    except Exception as e:
+        # The batch cannot tell which rows landed; writes are idempotent, so retry
+        # them one by one and keep only the rows that still fail
+        print(f"Batch write failed, retrying items individually: {e}")
+        for row in rows:
+            try:
+                table.put_item(Item=row)
+            except Exception as row_error:
+                print(f"Failed to store {item_key(row)}: {row_error}")
+                unstored.add(item_key(row))
+
+    stored = {item_key(row) for row in rows} - unstored
+    summary = {"processed": len(items), "duplicates": duplicates, "written": 0,
+               "flapping": 0, "current_updated": 0, "current_stale": 0}
+    failed, applied = [], []
+    for name, plan in plans.items():
+        # Leave the state alone until every row of the alarm is stored, so a retry redoes it all
+        if any(item_key(row) in unstored for row in plan["rows"]):
+            failed.extend(by_alarm[name])
+            continue
+        if plan["latest"] is None:
+            continue
+        try:
+            plan, replans = apply_alarm(name, plan, by_alarm[name], stored)
+        except Exception as e:
+            print(f"Failed to update current state of {name}: {e}")
+            failed.extend(by_alarm[name])
+            continue
+        summary["current_stale"] += replans
+        if plan["latest"] is not None:
+            applied.append(plan["latest"])
+            summary["current_updated"] += 1
+            summary["flapping"] += sum(len(episode) for episode in plan["flapped"].values())
+    summary["written"] = len(stored)
+
+    if incident_table is not None and applied:
+        try:
+            summary["incidents"], summary["incidents_resolved"] = incident_correlator.correlate(incident_table, applied)
+        except Exception as e:
+            # Correlation is derived data; a failure must not redeliver transitions already logged
+            print(f"Incident correlation failed: {e}")
+    return summary, failed
+
+
+def handle_queue_batch(records):
+    """
+    Log an SQS batch and report the messages that could not be applied, so
+    only those are redelivered. Messages that cannot be parsed are dropped:
+    retrying them would never succeed.
+    """
+    sources = []
+    for record in records:
+        try:
+            item = parse_queue_record(record)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Dropping unreadable message {record.get('messageId')}: {e}")
+            continue
+        if item:
+            sources.append((record["messageId"], item))
+
+    summary, failed = process_items([item for _, item in sources])
+    failed_keys = {item_key(item) for item in failed}
+    failed_ids = [message_id for message_id, item in sources if item_key(item) in failed_keys]
+
+    print(json.dumps({**summary, "failed": len(failed_ids)}))
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_ids]}
+
 
 def lambda_handler(event, context):
     print("Received event:", json.dumps(event))
 
-    # Handle direct test events or malformed payloads gracefully
-    records = event.get("Records")
-    processed = 0
+    # Alarm notifications normally arrive through the SQS buffer queue
+    records = event.get("Records") or []
+    if records and records[0].get("eventSource") == "aws:sqs":
+        return handle_queue_batch(records)
 
+    # Handle direct SNS deliveries, test events or malformed payloads gracefully
     if not records:
         # Support direct CloudWatch Alarm message (not via SNS) for testing
         if all(k in event for k in ("AlarmName", "NewStateValue", "NewStateReason")):
-            table.put_item(
-                Item={
-                    "AlarmName": event["AlarmName"],
-                    "Timestamp": datetime.utcnow().isoformat(),
-                    "State": event["NewStateValue"],
-                    "Reason": event["NewStateReason"],
-                }
-            )
-            processed = 1
+            items = [alarm_item(event, None)]
         else:
             # Nothing to do
             return {"statusCode": 200, "body": "No Records; nothing processed"}
-
     else:
-        for record in records:
-            sns_obj = record.get("Sns") or record.get("SNS")
-            if not sns_obj:
-                continue
-
-            raw_message = sns_obj.get("Message")
-            if raw_message is None:
-                continue
-
-            # Parse message which can be a JSON string or already a dict
-            if isinstance(raw_message, str):
-                try:
-                    message = json.loads(raw_message)
-                except json.JSONDecodeError:
-                    # If not JSON, store as raw reason
-                    message = {"AlarmName": "UNKNOWN", "NewStateValue": "UNKNOWN", "NewStateReason": raw_message}
-            elif isinstance(raw_message, dict):
-                message = raw_message
-            else:
-                continue
-
-            alarm_name = message.get("AlarmName")
-            state = message.get("NewStateValue")
-            reason = message.get("NewStateReason")
-
-            # Require keys for the PK/SK
-            if not alarm_name:
-                continue
-
-            table.put_item(
-                Item={
-                    "AlarmName": alarm_name,
-                    "Timestamp": datetime.utcnow().isoformat(),
-                    "State": state or "UNKNOWN",
-                    "Reason": reason or "",
-                }
-            )
-            processed += 1
-
-    return {"statusCode": 200, "body": f"Processed {processed} record(s)"}
+        items = [item for item in (parse_record(record) for record in records) if item]
+
+    summary, failed = process_items(items)
+    print(json.dumps(summary))
+    if failed:
+        # Let SNS retry the delivery
+        raise RuntimeError(f"Failed to log {len(failed)} transition(s)")
+
+    return {
+        "statusCode": 200,
+        "body": f"Processed {summary['processed']} record(s), dropped {summary['duplicates']} duplicate(s)",
+        **summary,
+    }
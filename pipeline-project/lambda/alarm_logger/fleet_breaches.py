@@ -0,0 +1,80 @@
+"""
+fleet_breaches.py - Which targets a fleet-level alarm fired for
+
+In fleet alarm mode there is one alarm per check for the whole fleet, on a
+Metrics Insights query such as
+
+    SELECT MAX(Latency) FROM SCHEMA("amiel-week3", URL)
+
+Its notification says the fleet breached, not which URLs did. When one fires,
+the per-URL series behind it are fetched with a single GetMetricData SEARCH
+and the URLs whose latest datapoint breaches the same threshold are returned.
+
+A SEARCH returns at most 500 series, whatever the paging, so on a larger
+fleet the breakdown can miss URLs. breached_targets reports when the cap was
+reached so the caller can mark the breakdown as partial.
+"""
+import re
+from datetime import datetime, timedelta
+
+FLEET_QUERY = re.compile(r'SELECT\s+(MIN|MAX|AVG)\((\w+)\)\s+FROM\s+SCHEMA\("([^"]+)",\s*URL\)', re.IGNORECASE)
+STATISTICS = {"MIN": "Minimum", "MAX": "Maximum", "AVG": "Average"}
+DEFAULT_PERIOD = 300
+# Most series one SEARCH expression returns
+SEARCH_SERIES_LIMIT = 500
+# Dynamic label that makes each returned series' Label its URL dimension value
+URL_LABEL = "${PROP('Dim.URL')}"
+
+BREACHES = {
+    "GreaterThanThreshold": lambda value, threshold: value > threshold,
+    "GreaterThanOrEqualToThreshold": lambda value, threshold: value >= threshold,
+    "LessThanThreshold": lambda value, threshold: value < threshold,
+    "LessThanOrEqualToThreshold": lambda value, threshold: value <= threshold,
+}
+
+
+def fleet_query(trigger):
+    """(namespace, metric, statistic, period) of a fleet alarm's trigger, or None for other alarms"""
+    for metric in trigger.get("Metrics") or []:
+        match = FLEET_QUERY.search(metric.get("Expression") or "")
+        if match:
+            aggregate, metric_name, namespace = match.groups()
+            period = int(metric.get("Period") or trigger.get("Period") or DEFAULT_PERIOD)
+            return namespace, metric_name, STATISTICS[aggregate.upper()], period
+    return None
+
+
+def breached_targets(cloudwatch, trigger, query, state_change_time):
+    """
+    (urls, truncated): the URLs whose latest value at state_change_time breaches
+    the trigger's threshold, and whether the SEARCH hit its series limit, in
+    which case URLs beyond the limit were not checked
+    """
+    breaches = BREACHES.get(trigger.get("ComparisonOperator"))
+    if breaches is None or trigger.get("Threshold") is None:
+        return [], False
+    namespace, metric_name, statistic, period = query
+    end = datetime.fromisoformat(state_change_time)
+    start = end - timedelta(seconds=period * max(int(trigger.get("EvaluationPeriods") or 1), 1))
+    search = f"SEARCH('{{{namespace},URL}} MetricName=\"{metric_name}\"', '{statistic}', {period})"
+    params = {
+        # The label is set explicitly rather than relying on CloudWatch's default series label
+        "MetricDataQueries": [{"Id": "targets", "Expression": search, "Label": URL_LABEL, "ReturnData": True}],
+        "StartTime": start,
+        "EndTime": end + timedelta(seconds=period),
+        "ScanBy": "TimestampDescending",
+    }
+    breached, seen = set(), set()
+    while True:
+        response = cloudwatch.get_metric_data(**params)
+        for series in response.get("MetricDataResults", []):
+            url = series.get("Label")
+            # Later pages continue a series with older values; only its newest one counts
+            if not url or url in seen:
+                continue
+            seen.add(url)
+            if series.get("Values") and breaches(series["Values"][0], float(trigger["Threshold"])):
+                breached.add(url)
+        if not response.get("NextToken"):
+            return sorted(breached), len(seen) >= SEARCH_SERIES_LIMIT
+        params["NextToken"] = response["NextToken"]
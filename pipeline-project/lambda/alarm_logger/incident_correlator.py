@@ -0,0 +1,298 @@
+"""
+incident_correlator.py - Groups alarm transitions into incidents
+
+Alarms that start firing close together and share an attribute - the
+target's domain, its resolved IP or the error class (the alarm's metric) -
+belong to one incident. Each invocation clusters its own transitions in
+memory first, so a burst of alarms costs one incident update per cluster
+rather than one per alarm. Incidents found recently are remembered per
+container, and the incident table holds the shared state:
+
+    KEY#<attribute>   -> incident that attribute belongs to, and when it was last seen
+    ALARM#<name>      -> incident an alarm joined, so its OK transition can resolve it
+    INC#<uuid>        -> the incident: start, affected targets, firing alarms, MTTR
+
+Keys are claimed with conditional updates, so two containers seeing the same
+burst agree on a single incident. A transition whose keys belong to two open
+incidents bridges them: the oldest one wins and the others are merged into it.
+"""
+import os
+import socket
+import time
+import urllib.parse
+import uuid
+from datetime import datetime
+
+CORRELATION_WINDOW_SECONDS = int(os.environ.get("CORRELATION_WINDOW_SECONDS", "300"))
+# DNS lookups add latency per new hostname, so IP correlation is opt-in
+CORRELATE_BY_IP = os.environ.get("CORRELATE_BY_IP", "false").lower() == "true"
+
+INCIDENT_PREFIX = "INC#"
+KEY_PREFIX = "KEY#"
+ALARM_PREFIX = "ALARM#"
+OPEN = "OPEN"
+RESOLVED = "RESOLVED"
+MERGED = "MERGED"
+FIRING_STATE = "ALARM"
+RESOLVED_STATE = "OK"
+BATCH_GET_LIMIT = 100
+# Rounds of claiming a cluster's keys before settling for the keys already won
+CLAIM_ATTEMPTS = 3
+
+# key -> (incident id, last seen epoch) for incidents this container worked on
+_window = {}
+_resolved_ips = {}
+
+
+def transition_epoch(item):
+    return int(datetime.fromisoformat(item["StateChangeTime"]).timestamp())
+
+
+def registered_domain(hostname):
+    """example.com for www.example.com (last two labels; good enough to group sibling hosts)"""
+    labels = hostname.lower().rstrip(".").split(".")
+    return ".".join(labels[-2:])
+
+
+def resolve_ip(hostname):
+    if hostname not in _resolved_ips:
+        try:
+            _resolved_ips[hostname] = socket.gethostbyname(hostname)
+        except OSError:
+            _resolved_ips[hostname] = None
+    return _resolved_ips[hostname]
+
+
+def targets(item):
+    """URLs a transition is about: its alarm's URL, or the URLs a fleet alarm found breaching"""
+    return item.get("BreachedTargets") or ([item["Target"]] if item.get("Target") else [])
+
+
+def correlation_keys(item):
+    """Shared attributes a transition can be correlated on"""
+    keys = [f"class:{item.get('MetricName') or 'unknown'}"]
+    for target in targets(item):
+        hostname = urllib.parse.urlsplit(target).hostname
+        if not hostname:
+            continue
+        keys.append(f"domain:{registered_domain(hostname)}")
+        ip = resolve_ip(hostname) if CORRELATE_BY_IP else None
+        if ip:
+            keys.append(f"ip:{ip}")
+    return list(dict.fromkeys(keys))
+
+
+def cluster(items):
+    """Group transitions sharing any correlation key (union-find over keys)"""
+    parent = {}
+
+    def find(key):
+        while parent.setdefault(key, key) != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    item_keys = [correlation_keys(item) for item in items]
+    for keys in item_keys:
+        for key in keys[1:]:
+            parent[find(key)] = find(keys[0])
+    clusters = {}
+    for item, keys in zip(items, item_keys):
+        entry = clusters.setdefault(find(keys[0]), {"items": [], "keys": set()})
+        entry["items"].append(item)
+        entry["keys"].update(keys)
+    return list(clusters.values())
+
+
+def batch_get(table, ids):
+    """Items by id from the incident table (BatchGetItem, resource-deserialized)"""
+    found = {}
+    ids = list(ids)
+    client = table.meta.client
+    for start in range(0, len(ids), BATCH_GET_LIMIT):
+        request = {table.name: {"Keys": [{"incident_id": i} for i in ids[start:start + BATCH_GET_LIMIT]],
+                                "ConsistentRead": True}}
+        while request:
+            response = client.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(table.name, []):
+                found[item["incident_id"]] = item
+            request = response.get("UnprocessedKeys")
+    return found
+
+
+def active_incident(table, keys, cutoff):
+    """Incident any of the keys was seen in since cutoff: memory first, then the table"""
+    for key in keys:
+        incident_id, last_seen = _window.get(key, (None, 0))
+        if incident_id and last_seen >= cutoff:
+            return incident_id
+    stored = batch_get(table, [KEY_PREFIX + key for key in keys])
+    recent = [item for item in stored.values() if int(item.get("last_seen", 0)) >= cutoff]
+    if recent:
+        return max(recent, key=lambda item: int(item["last_seen"]))["incident"]
+    return None
+
+
+def claim_key(table, key, incident_id, seen, cutoff, replaces=None):
+    """
+    Point one key at an incident unless another incident claimed it within
+    the window (replaces is an incident it may be taken from). Returns the
+    incident the key points at afterwards.
+    """
+    condition = "attribute_not_exists(incident) OR incident = :incident OR last_seen < :cutoff"
+    values = {":incident": incident_id, ":seen": seen, ":cutoff": cutoff}
+    if replaces and replaces != incident_id:
+        condition += " OR incident = :replaces"
+        values[":replaces"] = replaces
+    try:
+        table.update_item(
+            Key={"incident_id": KEY_PREFIX + key},
+            UpdateExpression="SET incident = :incident, last_seen = :seen",
+            ConditionExpression=condition,
+            ExpressionAttributeValues=values,
+        )
+        return incident_id
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return table.get_item(Key={"incident_id": KEY_PREFIX + key}, ConsistentRead=True)["Item"]["incident"]
+
+
+def merge_incident(table, loser, winner_id):
+    """Move an incident's alarms, targets and keys to the winner and mark it merged"""
+    sets = {name: set(loser[name]) for name in ("affected_targets", "firing", "alarms", "correlation_keys")
+            if loser.get(name)}
+    if sets:
+        table.update_item(
+            Key={"incident_id": winner_id},
+            UpdateExpression="ADD " + ", ".join(f"{name} :{name}" for name in sets),
+            ExpressionAttributeValues={f":{name}": values for name, values in sets.items()},
+        )
+    table.update_item(
+        Key={"incident_id": loser["incident_id"]},
+        UpdateExpression="SET #status = :merged, merged_into = :winner REMOVE firing",
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={":merged": MERGED, ":winner": winner_id},
+    )
+    # Recoveries find their incident through these, so they follow the merge
+    client = table.meta.client
+    pointers = ([ALARM_PREFIX + alarm for alarm in loser.get("alarms", ())] +
+                [KEY_PREFIX + key for key in loser.get("correlation_keys", ())])
+    for pointer in pointers:
+        try:
+            table.update_item(
+                Key={"incident_id": pointer},
+                UpdateExpression="SET incident = :winner",
+                ConditionExpression="incident = :loser",
+                ExpressionAttributeValues={":winner": winner_id, ":loser": loser["incident_id"]},
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            pass
+
+
+def claim_keys(table, keys, incident_id, seen, cutoff):
+    """
+    Point the keys at one incident. When keys were claimed for other
+    incidents within the window, the oldest of all those incidents wins: the
+    others are merged into it and their keys taken over. Gives up after
+    CLAIM_ATTEMPTS rounds, keeping the keys won so far.
+    """
+    owners = {}
+    for _ in range(CLAIM_ATTEMPTS):
+        owners = {key: claim_key(table, key, incident_id, seen, cutoff, owners.get(key)) for key in sorted(keys)}
+        candidates = set(owners.values()) | {incident_id}
+        if len(candidates) == 1:
+            break
+        stored = batch_get(table, candidates)
+        # An incident not written yet (a fresh id) is the newest
+        winner = min(candidates, key=lambda i: (stored.get(i, {}).get("started_at") or "~", i))
+        for loser in candidates - {winner}:
+            if loser in stored and stored[loser].get("status") != MERGED:
+                merge_incident(table, stored[loser], winner)
+        incident_id = winner
+    else:
+        print(f"Incident keys still contended after {CLAIM_ATTEMPTS} attempts; using {incident_id}")
+    for key, owner in owners.items():
+        if owner == incident_id:
+            _window[key] = (incident_id, seen)
+    return incident_id
+
+
+def open_incident(table, incident_id, items, keys):
+    """Add firing alarms to an incident, creating or reopening it"""
+    affected = {target for item in items for target in targets(item) or [item["AlarmName"]]}
+    alarms = {item["AlarmName"] for item in items}
+    started = min(item["StateChangeTime"] for item in items)
+    last = max(item["StateChangeTime"] for item in items)
+    table.update_item(
+        Key={"incident_id": incident_id},
+        UpdateExpression=("SET started_at = if_not_exists(started_at, :started), last_transition_at = :last, "
+                          "#status = :open REMOVE resolved_at, mttr_seconds "
+                          "ADD affected_targets :targets, firing :alarms, alarms :alarms, "
+                          "correlation_keys :keys, transition_count :count"),
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={
+            ":started": started, ":last": last, ":open": OPEN, ":targets": affected,
+            ":alarms": alarms, ":keys": set(keys), ":count": len(items),
+        },
+    )
+    with table.batch_writer() as batch:
+        for alarm in alarms:
+            batch.put_item(Item={"incident_id": ALARM_PREFIX + alarm, "incident": incident_id})
+
+
+def resolve_alarms(table, items):
+    """Take recovered alarms off their incidents, resolving incidents with nothing left firing"""
+    mappings = batch_get(table, [ALARM_PREFIX + item["AlarmName"] for item in items])
+    by_incident = {}
+    for item in items:
+        mapping = mappings.get(ALARM_PREFIX + item["AlarmName"])
+        if mapping:
+            by_incident.setdefault(mapping["incident"], []).append(item)
+    resolved = 0
+    for incident_id, recovered in by_incident.items():
+        last = max(item["StateChangeTime"] for item in recovered)
+        incident = table.update_item(
+            Key={"incident_id": incident_id},
+            UpdateExpression="SET last_transition_at = :last DELETE firing :alarms",
+            ConditionExpression="attribute_exists(incident_id)",
+            ExpressionAttributeValues={":last": last, ":alarms": {item["AlarmName"] for item in recovered}},
+            ReturnValues="ALL_NEW",
+        )["Attributes"]
+        if incident.get("firing") or incident.get("status") != OPEN:
+            continue
+        mttr = int(datetime.fromisoformat(last).timestamp() - datetime.fromisoformat(incident["started_at"]).timestamp())
+        try:
+            # Only one recovery closes the incident, and only if nothing fired again meanwhile
+            table.update_item(
+                Key={"incident_id": incident_id},
+                UpdateExpression="SET #status = :resolved, resolved_at = :last, mttr_seconds = :mttr",
+                ConditionExpression="attribute_not_exists(firing) AND #status = :open",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":resolved": RESOLVED, ":open": OPEN, ":last": last, ":mttr": max(mttr, 0)},
+            )
+            resolved += 1
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+    return resolved
+
+
+def correlate(table, items):
+    """
+    Fold the newest transition of each alarm into incidents.
+    Returns (incidents touched by firing alarms, incidents resolved).
+    """
+    now = int(time.time())
+    for key, (_, last_seen) in list(_window.items()):
+        if last_seen < now - 2 * CORRELATION_WINDOW_SECONDS:
+            del _window[key]
+
+    incidents = set()
+    for group in cluster([item for item in items if item["State"] == FIRING_STATE]):
+        seen = max(transition_epoch(item) for item in group["items"])
+        cutoff = min(transition_epoch(item) for item in group["items"]) - CORRELATION_WINDOW_SECONDS
+        incident_id = active_incident(table, group["keys"], cutoff) or f"{INCIDENT_PREFIX}{uuid.uuid4()}"
+        incident_id = claim_keys(table, group["keys"], incident_id, seen, cutoff)
+        open_incident(table, incident_id, group["items"], group["keys"])
+        incidents.add(incident_id)
+
+    resolved = resolve_alarms(table, [item for item in items if item["State"] == RESOLVED_STATE])
+    return len(incidents), resolved
@@ -0,0 +1,271 @@
+"""
+alarm_reconciler.py - Keeps per-website CloudWatch alarms in line with the target table
+
+Every enabled website gets three alarms on the metrics the crawler publishes
+(availability, latency and response size), named
+
+    <ALARM_NAME_PREFIX><website id>-<check>
+
+The reconciler computes the alarms that should exist, reads the ones that do,
+and applies only the difference: PutMetricAlarm for missing or changed alarms,
+DeleteAlarms (100 names per call) for alarms without an enabled website.
+
+It runs two ways:
+- DynamoDB Streams on the websites table reconcile just the websites a batch
+  changed, reading their alarms by name.
+- A scheduled full sync reconciles every website against all alarms under the
+  prefix, read with paginated DescribeAlarms, catching anything a stream
+  event missed.
+
+With ALARM_MODE "fleet" no website has alarms of its own, so a full sync
+deletes every alarm left under the prefix from per_target mode.
+
+PutMetricAlarm is the bottleneck: its default quota is 3 requests per second
+per Region, so a first sync (or a threshold change) of N websites takes about
+N seconds, e.g. close to 3 hours for 10,000 websites. A full sync stops putting
+alarms shortly before its timeout and invokes itself again to continue. The
+plan is always computed from the alarms that exist, so an interrupted or
+retried sync never redoes the puts that already landed.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+WEBSITE_RECORD_TYPE = "website"
+ENABLED_INDEX = "enabled-key-index"
+ALARM_NAME_PREFIX = os.environ.get("ALARM_NAME_PREFIX", "website-monitor-")
+ALARM_MODE = os.environ.get("ALARM_MODE", "per_target")
+# DescribeAlarms takes at most 100 names or records, DeleteAlarms at most 100 names
+DESCRIBE_BATCH = 100
+DELETE_BATCH = 100
+# PutMetricAlarm has no batch form and a default quota of 3 TPS; changed alarms
+# are put that many at a time, with adaptive client-side retries absorbing throttling
+PUT_CONCURRENCY = int(os.environ.get("PUT_CONCURRENCY", "3"))
+# A full sync stops putting alarms this long before its timeout, then continues in a new invocation
+SYNC_MARGIN_SECONDS = 30
+CONTINUE_SOURCE = "alarm-reconciler.continue"
+PERIOD_SECONDS = 300
+
+# Fields compared between a desired alarm and an existing one
+COMPARED_FIELDS = ("Namespace", "MetricName", "Dimensions", "Statistic", "Period", "EvaluationPeriods",
+                   "Threshold", "ComparisonOperator", "TreatMissingData", "AlarmActions", "OKActions",
+                   "ActionsEnabled")
+
+_deserializer = TypeDeserializer()
+
+
+def checks():
+    """check suffix -> (metric name, statistic, comparison, threshold), from the stack's constants"""
+    return {
+        "availability": (os.environ.get("AVAILABILITY_METRIC_NAME", "Availability"), "Average",
+                         "LessThanThreshold", float(os.environ.get("AVAIL_THRESHOLD", "0.99"))),
+        "latency": (os.environ.get("LATENCY_METRIC_NAME", "Latency"), "Average",
+                    "GreaterThanThreshold", float(os.environ.get("LATENCY_THRESHOLD_MS", "500"))),
+        "response-size": (os.environ.get("RESPONSE_SIZE_METRIC_NAME", "ResponseSize"), "Minimum",
+                          "LessThanThreshold", float(os.environ.get("RESPONSE_SIZE_MIN_BYTES", "1"))),
+    }
+
+
+def alarm_names(website_id):
+    return [f"{ALARM_NAME_PREFIX}{website_id}-{check}" for check in checks()]
+
+
+def desired_alarms(website):
+    """PutMetricAlarm parameters for one website, keyed by alarm name"""
+    topic = os.environ.get("ALARM_TOPIC_ARN")
+    actions = [topic] if topic else []
+    alarms = {}
+    for check, (metric, statistic, comparison, threshold) in checks().items():
+        name = f"{ALARM_NAME_PREFIX}{website['id']}-{check}"
+        alarms[name] = {
+            "AlarmName": name,
+            "AlarmDescription": f"{check} of {website['url']}",
+            "Namespace": os.environ.get("NAMESPACE", "amiel-week3"),
+            "MetricName": metric,
+            "Dimensions": [{"Name": "URL", "Value": website["url"]}],
+            "Statistic": statistic,
+            "Period": PERIOD_SECONDS,
+            "EvaluationPeriods": 1,
+            "Threshold": threshold,
+            "ComparisonOperator": comparison,
+            "TreatMissingData": "notBreaching",
+            # OK notifications let the alarm logger close incidents
+            "AlarmActions": actions,
+            "OKActions": actions,
+            "ActionsEnabled": True,
+        }
+    return alarms
+
+
+def comparable(alarm):
+    values = {field: alarm.get(field) for field in COMPARED_FIELDS}
+    values["Threshold"] = float(values["Threshold"]) if values["Threshold"] is not None else None
+    values["Dimensions"] = sorted((d["Name"], d["Value"]) for d in values["Dimensions"] or [])
+    values["AlarmActions"] = sorted(values["AlarmActions"] or [])
+    values["OKActions"] = sorted(values["OKActions"] or [])
+    return values
+
+
+def plan(desired, existing, managed):
+    """
+    Alarms to put (missing or different) and names to delete (existing, managed
+    by this run, not desired). managed is the set of names this run owns.
+    """
+    puts = [alarm for name, alarm in desired.items()
+            if name not in existing or comparable(existing[name]) != comparable(alarm)]
+    deletes = sorted(name for name in existing if name in managed and name not in desired)
+    return puts, deletes
+
+
+def is_website(image):
+    # Cache, stats, URL guard and search items share the table but carry another record_type
+    return bool(image) and "url" in image and image.get("record_type", WEBSITE_RECORD_TYPE) == WEBSITE_RECORD_TYPE
+
+
+def index_missing(error):
+    """True when a query failed because its index does not exist (yet)"""
+    code = error.response["Error"]["Code"]
+    message = error.response["Error"].get("Message", "")
+    return code == "ResourceNotFoundException" or (
+        code == "ValidationException" and "does not have the specified index" in message)
+
+
+def enabled_websites(websites_table):
+    """Every enabled website (id, url) through the enabled-key-index"""
+    params = {
+        "IndexName": ENABLED_INDEX,
+        "KeyConditionExpression": Key("enabled_key").eq("true"),
+        "ProjectionExpression": "id, #url, record_type",
+        "ExpressionAttributeNames": {"#url": "url"},
+    }
+    while True:
+        response = websites_table.query(**params)
+        for item in response.get("Items", []):
+            if is_website(item):
+                yield item
+        if not response.get("LastEvaluatedKey"):
+            return
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def alarms_by_prefix(cloudwatch):
+    """Every metric alarm under the prefix, keyed by name (paginated DescribeAlarms)"""
+    existing = {}
+    paginator = cloudwatch.get_paginator("describe_alarms")
+    for page in paginator.paginate(AlarmNamePrefix=ALARM_NAME_PREFIX, AlarmTypes=["MetricAlarm"],
+                                   PaginationConfig={"PageSize": DESCRIBE_BATCH}):
+        for alarm in page.get("MetricAlarms", []):
+            existing[alarm["AlarmName"]] = alarm
+    return existing
+
+
+def alarms_by_name(cloudwatch, names):
+    """Existing metric alarms among the given names, keyed by name"""
+    existing = {}
+    names = list(names)
+    for start in range(0, len(names), DESCRIBE_BATCH):
+        response = cloudwatch.describe_alarms(AlarmNames=names[start:start + DESCRIBE_BATCH],
+                                              AlarmTypes=["MetricAlarm"], MaxRecords=DESCRIBE_BATCH)
+        for alarm in response.get("MetricAlarms", []):
+            existing[alarm["AlarmName"]] = alarm
+    return existing
+
+
+def apply(cloudwatch, puts, deletes, deadline=None):
+    """
+    Delete and put alarms. Puts stop once deadline (a time.monotonic() value)
+    passes; the alarms left are reported as pending.
+    """
+    for start in range(0, len(deletes), DELETE_BATCH):
+        cloudwatch.delete_alarms(AlarmNames=deletes[start:start + DELETE_BATCH])
+
+    def put(alarm):
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        cloudwatch.put_metric_alarm(**alarm)
+        return True
+
+    done = 0
+    if puts:
+        with ThreadPoolExecutor(max_workers=PUT_CONCURRENCY) as pool:
+            # sum() re-raises the first failed put
+            done = sum(pool.map(put, puts))
+    return {"put": done, "deleted": len(deletes), "pending": len(puts) - done}
+
+
+def full_sync(websites_table, cloudwatch, deadline=None):
+    """Reconcile every enabled website against every alarm under the prefix"""
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # List alarms while the table is read
+        existing_future = pool.submit(alarms_by_prefix, cloudwatch)
+        try:
+            websites = list(enabled_websites(websites_table)) if ALARM_MODE != "fleet" else []
+        except ClientError as e:
+            if not index_missing(e):
+                raise
+            # Before the index rollout reaches enabled-key-index every alarm would look orphaned
+            print(f"Skipping full sync: {ENABLED_INDEX} does not exist yet")
+            return {"websites": 0, "put": 0, "deleted": 0, "pending": 0}
+        existing = existing_future.result()
+    desired = {}
+    for website in websites:
+        desired.update(desired_alarms(website))
+    puts, deletes = plan(desired, existing, managed=set(existing))
+    return {"websites": len(websites), **apply(cloudwatch, puts, deletes, deadline=deadline)}
+
+
+def continue_sync(context):
+    """Start another full sync asynchronously to put the alarms this one had no time for"""
+    boto3.client("lambda").invoke(FunctionName=context.invoked_function_arn, InvocationType="Event",
+                                  Payload=json.dumps({"source": CONTINUE_SOURCE}))
+
+
+def changed_websites(records):
+    """Newest image of each website a stream batch touched (None when removed or not a website)"""
+    changed = {}
+    for record in records:
+        change = record.get("dynamodb", {})
+        image = {k: _deserializer.deserialize(v) for k, v in (change.get("NewImage") or {}).items()}
+        old_image = {k: _deserializer.deserialize(v) for k, v in (change.get("OldImage") or {}).items()}
+        if not is_website(image) and not is_website(old_image):
+            continue
+        website_id = _deserializer.deserialize(change["Keys"]["id"])
+        enabled = record.get("eventName") != "REMOVE" and is_website(image) and image.get("enabled", True)
+        changed[website_id] = image if enabled else None
+    return changed
+
+
+def stream_sync(records, cloudwatch):
+    """Reconcile only the websites in a stream batch"""
+    changed = changed_websites(records)
+    managed = {name for website_id in changed for name in alarm_names(website_id)}
+    desired = {}
+    for website in changed.values():
+        if website:
+            desired.update(desired_alarms(website))
+    puts, deletes = plan(desired, alarms_by_name(cloudwatch, sorted(managed)), managed)
+    return {"websites": len(changed), **apply(cloudwatch, puts, deletes)}
+
+
+def lambda_handler(event, context):
+    cloudwatch = boto3.client("cloudwatch", config=Config(retries={"mode": "adaptive", "max_attempts": 10}))
+    records = event.get("Records") or []
+    if records and records[0].get("eventSource") == "aws:dynamodb":
+        summary = stream_sync(records, cloudwatch)
+    else:
+        websites_table = boto3.resource("dynamodb").Table(os.environ["TARGET_WEBSITES_TABLE"])
+        remaining = getattr(context, "get_remaining_time_in_millis", None)
+        deadline = time.monotonic() + remaining() / 1000 - SYNC_MARGIN_SECONDS if remaining else None
+        summary = full_sync(websites_table, cloudwatch, deadline)
+        # Keep going while each run makes progress; a fully throttled run leaves the rest to the schedule
+        if summary["pending"] and summary["put"]:
+            continue_sync(context)
+    print(json.dumps(summary))
+    return {"statusCode": 200, **summary}
@@ -0,0 +1,125 @@
+"""
+alarm_history.py - Paginated reads of the alarm logger's table
+
+History for one alarm is a key-condition Query on its partition, bounded on
+the Timestamp sort key (StateChangeTime#MessageId). Recent transitions across
+every alarm come from the recent-transitions-index GSI, whose partition is
+the UTC day of the transition, walked newest day first. Alarms currently in
+ALARM are the whole of the sparse firing-alarms-index.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Key
+
+RECENT_INDEX = 'recent-transitions-index'
+FIRING_INDEX = 'firing-alarms-index'
+FIRING_STATE = 'ALARM'
+# The last three are only set on aggregated FLAPPING entries
+HISTORY_FIELDS = ('AlarmName', 'Timestamp', 'StateChangeTime', 'State', 'OldState', 'Reason', 'MessageId',
+                  'TransitionCount', 'LastState', 'LastStateChangeTime')
+# Only on fleet alarm entries, and not projected into recent-transitions-index
+TABLE_ONLY_FIELDS = ('BreachedTargets', 'BreachedTargetsTruncated')
+DEFAULT_RECENT_HOURS = 24
+MAX_RECENT_DAYS = 7
+# Sorts after '#<MessageId>', so an upper bound includes every message at that instant
+KEY_SUFFIX_MAX = '~'
+# Transition keys start with a year; the alarm's CURRENT item sorts after all of them
+MIN_TRANSITION_KEY = '0000'
+MAX_TRANSITION_KEY = '9999'
+
+
+def parse_time(value: str, name: str) -> str:
+    """Normalize an ISO 8601 query parameter to the UTC form stored in the sort key"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 timestamp")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def projection(fields: Tuple[str, ...] = HISTORY_FIELDS) -> Dict[str, Any]:
+    # State and Timestamp are DynamoDB reserved words
+    names = {f"#f{i}": field for i, field in enumerate(fields)}
+    return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+
+def history_condition(alarm_name: str, start: Optional[str], end: Optional[str]):
+    # Always bounded, so the current-state item is never part of the history
+    return Key('AlarmName').eq(alarm_name) & Key('Timestamp').between(
+        start or MIN_TRANSITION_KEY, (end or MAX_TRANSITION_KEY) + KEY_SUFFIX_MAX)
+
+
+def history_page(table, alarm_name: str, start: Optional[str], end: Optional[str], limit: int,
+                 start_key: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """One page of an alarm's transitions between start and end, newest first"""
+    params = {
+        'KeyConditionExpression': history_condition(alarm_name, start, end),
+        'ScanIndexForward': False,
+        'Limit': limit,
+        **projection(HISTORY_FIELDS + TABLE_ONLY_FIELDS)
+    }
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+    response = table.query(**params)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+
+def recent_since(since: Optional[str], now: datetime) -> str:
+    """Validate ?since=, defaulting to a day ago and refusing more than MAX_RECENT_DAYS back"""
+    if not since:
+        return (now - timedelta(hours=DEFAULT_RECENT_HOURS)).isoformat()
+    since = parse_time(since, 'since')
+    if since < (now - timedelta(days=MAX_RECENT_DAYS)).isoformat():
+        raise ValueError(f"since must be within the last {MAX_RECENT_DAYS} days")
+    return since
+
+
+def recent_page(table, since: str, limit: int, cursor: Optional[Dict[str, Any]],
+                now: datetime) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    One page of transitions across all alarms since a timestamp, newest first.
+    The cursor is {'day': <partition to continue in>, 'key': <ExclusiveStartKey or None>}.
+    """
+    oldest_day = since[:10]
+    day = cursor['day'] if cursor else now.date().isoformat()
+    start_key = cursor.get('key') if cursor else None
+    items = []
+    while day >= oldest_day:
+        params = {
+            'IndexName': RECENT_INDEX,
+            'KeyConditionExpression': Key('TransitionDay').eq(day) & Key('Timestamp').gte(since),
+            'ScanIndexForward': False,
+            'Limit': limit - len(items),
+            **projection()
+        }
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        response = table.query(**params)
+        items.extend(response.get('Items', []))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            day = (datetime.fromisoformat(day) - timedelta(days=1)).date().isoformat()
+        if len(items) >= limit:
+            break
+    if day < oldest_day:
+        return items, None
+    return items, {'day': day, 'key': start_key}
+
+
+def firing_page(table, limit: int, start_key: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """One page of the alarms currently in ALARM, longest firing first"""
+    names = {'#name': 'AlarmName', '#state': 'State', '#since': 'StateChangeTime', '#reason': 'Reason'}
+    params = {
+        'IndexName': FIRING_INDEX,
+        'KeyConditionExpression': Key('Firing').eq(FIRING_STATE),
+        'Limit': limit,
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+    response = table.query(**params)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
@@ -0,0 +1,174 @@
+"""
+bulk_export.py - Streaming export of the target websites table
+
+Runs a parallel segmented scan (Segment/TotalSegments) and serializes each
+page as soon as it arrives, so memory stays bounded by a few scan pages no
+matter how large the table is. Used by GET /websites:export and locally:
+
+    python lambda/crud_api/bulk_export.py --table <table-name> --format csv > targets.csv
+"""
+import argparse
+import csv
+import logging
+import queue
+import sys
+import threading
+from typing import Any, Dict, Iterator, Optional, TextIO
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+import decimal_json
+
+logger = logging.getLogger()
+
+# Public website attributes, in CSV column order
+EXPORT_FIELDS = (
+    'id', 'url', 'name', 'description', 'enabled', 'check_interval',
+    'timeout', 'expected_status', 'created_at', 'updated_at', 'version'
+)
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+DEFAULT_SEGMENTS = 4
+MAX_SEGMENTS = 16
+# Scan pages buffered between the scanner threads and the writer
+QUEUE_PAGES = 8
+
+_SEGMENT_DONE = object()
+
+
+class ExportTooLarge(Exception):
+    """Raised when an export does not fit in the output size limit"""
+
+
+class LimitedWriter:
+    """Text sink that refuses to grow past max_chars"""
+
+    def __init__(self, out: TextIO, max_chars: int):
+        self.out = out
+        self.remaining = max_chars
+
+    def write(self, text: str) -> int:
+        self.remaining -= len(text)
+        if self.remaining < 0:
+            raise ExportTooLarge("Export exceeds the maximum response size")
+        return self.out.write(text)
+
+
+def website_filter():
+    """Skip non-website records (items written before record_type existed have none)"""
+    return Attr('record_type').not_exists() | Attr('record_type').eq('website')
+
+
+def scan_segment(table_name: str, segment: int, total_segments: int,
+                 pages: queue.Queue, stop: threading.Event) -> None:
+    """Scan one segment page by page, handing each page to the writer"""
+    try:
+        # boto3 resources must not be shared between threads
+        table = boto3.session.Session().resource('dynamodb').Table(table_name)
+        names = {f"#f{i}": field for i, field in enumerate(EXPORT_FIELDS)}
+        params = {
+            'Segment': segment,
+            'TotalSegments': total_segments,
+            'FilterExpression': website_filter(),
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names
+        }
+        while not stop.is_set():
+            response = table.scan(**params)
+            pages.put(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except Exception as e:
+        pages.put(e)
+    finally:
+        pages.put(_SEGMENT_DONE)
+
+
+def iter_websites(table_name: str, segments: int = DEFAULT_SEGMENTS) -> Iterator[Dict[str, Any]]:
+    """Yield every website from a parallel scan, in arrival order"""
+    pages = queue.Queue(maxsize=QUEUE_PAGES)
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=scan_segment, args=(table_name, segment, segments, pages, stop), daemon=True)
+        for segment in range(segments)
+    ]
+    for thread in threads:
+        thread.start()
+
+    finished = 0
+    try:
+        while finished < segments:
+            page = pages.get()
+            if page is _SEGMENT_DONE:
+                finished += 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        # Unblock scanner threads if the consumer stopped early
+        stop.set()
+        while finished < segments:
+            if pages.get() is _SEGMENT_DONE:
+                finished += 1
+
+
+def write_ndjson(items: Iterator[Dict[str, Any]], out: TextIO) -> int:
+    count = 0
+    for item in items:
+        out.write(decimal_json.dumps(item) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(items: Iterator[Dict[str, Any]], out: TextIO) -> int:
+    # csv writes Decimals via str(), which keeps integers as integers
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for item in items:
+        writer.writerow(item)
+        count += 1
+    return count
+
+
+def export_websites(table_name: str, out: TextIO, fmt: str = 'ndjson',
+                    segments: int = DEFAULT_SEGMENTS, max_chars: Optional[int] = None) -> int:
+    """Stream the whole table to out as NDJSON or CSV, returning the item count"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if segments < 1 or segments > MAX_SEGMENTS:
+        raise ValueError(f"segments must be between 1 and {MAX_SEGMENTS}")
+    if max_chars is not None:
+        out = LimitedWriter(out, max_chars)
+
+    items = iter_websites(table_name, segments)
+    try:
+        if fmt == 'csv':
+            return write_csv(items, out)
+        return write_ndjson(items, out)
+    finally:
+        items.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export the target websites table as NDJSON or CSV")
+    parser.add_argument('--table', required=True, help="DynamoDB table name")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS, help="Parallel scan segments")
+    parser.add_argument('--output', help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as out:
+            count = export_websites(args.table, out, args.format, args.segments)
+    else:
+        count = export_websites(args.table, sys.stdout, args.format, args.segments)
+    print(f"Exported {count} website(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,29 @@
 import boto3
+import base64
+import binascii
+import gzip
+import hashlib
+import io
 import json
+import re
+import threading
+import urllib.parse
 import uuid
 import time
 import os
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
 import logging
-from decimal import Decimal
+from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from bulk_export import export_websites, website_filter, ExportTooLarge, DEFAULT_SEGMENTS
+from read_cache import TTLCache
+import alarm_history
+import decimal_json
+import idempotency
+import search_index
 
 # Configure logging
 logger = logging.getLogger()
@@ -14,59 +31,513 @@ logger.setLevel(logging.INFO)
 
 # Initialize DynamoDB
 dynamodb = boto3.resource('dynamodb')
+cloudwatch = boto3.client('cloudwatch')
+type_deserializer = TypeDeserializer()
 
-def convert_decimals(obj):
-    """Convert Decimal objects to regular numbers for JSON serialization"""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, dict):
-        return {k: convert_decimals(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_decimals(item) for item in obj]
-    else:
-        return obj
+# Every website item carries a constant record_type so the created-at-index
+# GSI can return the whole fleet already sorted by created_at
+WEBSITE_RECORD_TYPE = 'website'
+CREATED_AT_INDEX = 'created-at-index'
+# enabled_key is the string form of 'enabled' ("true"/"false") used as GSI key
+ENABLED_INDEX = 'enabled-key-index'
+NAME_INDEX = 'name-index'
+
+# Each website owns a guard item keyed by its normalized URL, written in the
+# same transaction as the website, so a URL can only be registered once
+URL_GUARD_PREFIX = 'URL#'
+URL_GUARD_RECORD_TYPE = 'url_guard'
+MAX_URL_KEY_LENGTH = 1024
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Attributes used for indexing only - never returned to API clients
+INTERNAL_FIELDS = ('record_type', 'enabled_key', 'url_key')
+
+# Attributes clients may request with ?fields=
+PUBLIC_FIELDS = (
+    'id', 'url', 'name', 'description', 'enabled', 'check_interval',
+    'timeout', 'expected_status', 'created_at', 'updated_at', 'version'
+)
+
+# Pagination limits for GET /websites
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 100
+
+# Bulk import (POST /websites:batch) settings
+BATCH_PATH = '/websites:batch'
+MAX_BATCH_ITEMS = 1000
+BATCH_CHUNK_SIZE = 25  # BatchWriteItem limit
+BATCH_WRITE_WORKERS = 4
+
+_thread_local = threading.local()
+
+# Last-known-status view written by the crawler (GET /websites/status)
+STATUS_PATH = '/websites/status'
+STATUS_PARTITION = 'all'
+
+# Fleet counters (GET /websites/stats), kept in step with every website write.
+# Per-status counts come from the summary the crawler writes next to its status view.
+STATS_PATH = '/websites/stats'
+STATS_ID = '__stats__'
+STATS_COUNTERS = ('total_count', 'enabled_count', 'disabled_count')
+STATUS_SUMMARY_KEY = {'fleet': 'stats', 'website_id': STATUS_PARTITION}
+# Every write touches the counter item, so concurrent transactions can conflict
+TRANSACTION_ATTEMPTS = 3
+
+# Alarm logger table reads (GET /alarms/{name}/history and GET /alarms/recent)
+RECENT_ALARMS_PATH = '/alarms/recent'
+FIRING_ALARMS_PATH = '/alarms/firing'
+
+# Trigram search (GET /websites/search)
+SEARCH_PATH = '/websites/search'
+
+# Bulk export (GET /websites:export) - API Gateway caps Lambda responses near 6 MB
+EXPORT_PATH = '/websites:export'
+EXPORT_MAX_CHARS = 5 * 1024 * 1024
+EXPORT_CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Warm-container read cache for GET /websites and GET /websites/{id}.
+# Writes from this container clear it directly; writes from other containers
+# bump the shared cache version item, which is polled at most once per interval.
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '5'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+CACHE_VERSION_CHECK_SECONDS = float(os.environ.get('CACHE_VERSION_CHECK_SECONDS', '1'))
+CACHE_VERSION_ID = '__cache_version__'
+META_RECORD_TYPE = 'meta'
+NAMESPACE = os.environ.get('NAMESPACE', 'amiel-week3')
+
+read_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+_cache_state = {'version': None, 'checked_at': None}
+
+# Crawler metrics (GET /websites/{id}/metrics and GET /websites/metrics?ids=).
+# Names must match what the crawler publishes; AppStack passes them from constants.py
+METRICS_PATH = '/websites/metrics'
+METRIC_SERIES = (
+    ('availability', os.environ.get('AVAILABILITY_METRIC_NAME', 'Availability')),
+    ('latency_ms', os.environ.get('LATENCY_METRIC_NAME', 'Latency')),
+    ('response_size', os.environ.get('RESPONSE_SIZE_METRIC_NAME', 'ResponseSize'))
+)
+METRIC_QUERIES_PER_CALL = 500  # GetMetricData limit
+MAX_METRICS_TARGETS = 100
+DEFAULT_METRICS_PERIOD = 300
+DEFAULT_METRICS_RANGE = '3h'
+MAX_METRICS_RANGE_SECONDS = 15 * 24 * 3600
+MAX_METRICS_DATAPOINTS = 1440
+RANGE_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+# Datapoints only change once per crawl, so a short TTL absorbs dashboard fan-out
+metrics_cache = TTLCache(CACHE_MAX_ENTRIES, float(os.environ.get('METRICS_CACHE_TTL_SECONDS', '60')))
+
+# Idempotency-Key support for POST /websites and POST /websites:batch.
+# Completed responses are also kept in the container so hot retries skip DynamoDB.
+IDEMPOTENT_PATHS = ('/websites', BATCH_PATH)
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(idempotency.DEFAULT_TTL_SECONDS)))
+idempotency_cache = TTLCache(CACHE_MAX_ENTRIES, float(os.environ.get('IDEMPOTENCY_CACHE_TTL_SECONDS', '300')))
+
+# Response compression - API Gateway returns isBase64Encoded bodies as binary only when
+# the first media type of the request's Accept header is one of the API's binary media types
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BINARY_MEDIA_TYPES = frozenset(
+    os.environ.get('BINARY_MEDIA_TYPES', 'application/json,application/x-ndjson,text/csv').split(','))
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-Match,If-None-Match,Idempotency-Key',
+    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
+    'Access-Control-Expose-Headers': 'ETag,Idempotent-Replayed'
+}
+
+def to_public(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip internal index attributes from an item before returning it"""
+    return {k: v for k, v in item.items() if k not in INTERNAL_FIELDS}
+
+def encode_cursor(last_evaluated_key: Dict[str, Any]) -> str:
+    """Turn a DynamoDB LastEvaluatedKey into an opaque pagination token"""
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str, key_attribute: str = 'id') -> Dict[str, Any]:
+    """Turn a pagination token back into an ExclusiveStartKey"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, dict) or key_attribute not in key:
+        raise ValueError("Invalid cursor")
+    return key
+
+def index_missing(error: ClientError) -> bool:
+    """True when a query failed because its index does not exist (yet), not because of its input"""
+    code = error.response['Error']['Code']
+    message = error.response['Error'].get('Message', '')
+    return code == 'ResourceNotFoundException' or (
+        code == 'ValidationException' and 'does not have the specified index' in message)
+
+def invalid_input(error: ClientError) -> bool:
+    """True for a ValidationException caused by the request, such as a tampered cursor"""
+    return error.response['Error']['Code'] == 'ValidationException' and not index_missing(error)
+
+def parse_limit(value: Optional[str]) -> int:
+    """Validate the ?limit= query parameter"""
+    if value is None or value == '':
+        return DEFAULT_PAGE_LIMIT
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+    return limit
+
+def parse_enabled(value: Optional[str]) -> Optional[bool]:
+    """Validate the ?enabled= query parameter"""
+    if value is None or value == '':
+        return None
+    if value.lower() not in ('true', 'false'):
+        raise ValueError("enabled must be 'true' or 'false'")
+    return value.lower() == 'true'
+
+def parse_fields(value: Optional[str]) -> Optional[List[str]]:
+    """Validate the ?fields= query parameter (comma separated attribute names)"""
+    if value is None or value == '':
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in PUBLIC_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+def enabled_key(enabled: Any) -> str:
+    """String form of the enabled flag stored for the enabled-key-index"""
+    return 'true' if enabled else 'false'
+
+def website_counts(website: Dict[str, Any], sign: int = 1) -> Dict[str, int]:
+    """Counter deltas for adding (sign=1) or removing (sign=-1) one website"""
+    state = 'enabled_count' if website.get('enabled', True) else 'disabled_count'
+    return {'total_count': sign, state: sign}
+
+def stats_update(deltas: Dict[str, int]) -> Dict[str, Any]:
+    """UpdateItem parameters applying counter deltas to the stats item"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    additions = ', '.join(f"{name} :{name}" for name in deltas)
+    return {
+        'Key': {'id': STATS_ID},
+        'UpdateExpression': f"SET record_type = :record_type ADD {additions}",
+        'ExpressionAttributeValues': {
+            ':record_type': META_RECORD_TYPE,
+            **{f':{name}': delta for name, delta in deltas.items()}
+        }
+    }
+
+def transact_write(table, transact_items: List[Dict[str, Any]]) -> None:
+    """TransactWriteItems, retrying cancellations caused only by conflicting transactions"""
+    for attempt in range(TRANSACTION_ATTEMPTS):
+        try:
+            table.meta.client.transact_write_items(TransactItems=transact_items)
+            return
+        except ClientError as e:
+            codes = {reason.get('Code') for reason in e.response.get('CancellationReasons') or []}
+            if attempt == TRANSACTION_ATTEMPTS - 1 or 'TransactionConflict' not in codes \
+                    or 'ConditionalCheckFailed' in codes:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+def plan_list_query(enabled: Optional[bool], name_prefix: Optional[str]) -> Dict[str, Any]:
+    """Pick the indexed Query that best serves the requested filters"""
+    if name_prefix:
+        params = {
+            'IndexName': NAME_INDEX,
+            'KeyConditionExpression': Key('record_type').eq(WEBSITE_RECORD_TYPE) & Key('name').begins_with(name_prefix)
+        }
+        if enabled is not None:
+            params['FilterExpression'] = Attr('enabled').eq(enabled)
+        return params
+    if enabled is not None:
+        return {
+            'IndexName': ENABLED_INDEX,
+            'KeyConditionExpression': Key('enabled_key').eq(enabled_key(enabled)),
+            'ScanIndexForward': False
+        }
+    return {
+        'IndexName': CREATED_AT_INDEX,
+        'KeyConditionExpression': Key('record_type').eq(WEBSITE_RECORD_TYPE),
+        'ScanIndexForward': False
+    }
+
+def plan_list_scan(enabled: Optional[bool], name_prefix: Optional[str]) -> Dict[str, Any]:
+    """Filtered scan used only when the required index is not available"""
+    condition = Attr('record_type').not_exists() | Attr('record_type').eq(WEBSITE_RECORD_TYPE)
+    if enabled is not None:
+        condition = condition & Attr('enabled').eq(enabled)
+    if name_prefix:
+        condition = condition & Attr('name').begins_with(name_prefix)
+    return {'FilterExpression': condition}
+
+def parse_url_filter(value: Optional[str]) -> Optional[str]:
+    """Validate the ?url= query parameter, returning its normalized form"""
+    if value is None or value == '':
+        return None
+    try:
+        url_key = normalize_url(value)
+    except ValueError:
+        raise ValueError("url must be a valid http:// or https:// URL")
+    if not url_key.startswith(('http://', 'https://')):
+        raise ValueError("url must be a valid http:// or https:// URL")
+    return url_key
+
+def projection_params(fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Build ProjectionExpression parameters for the requested fields"""
+    if not fields:
+        return {}
+    names = {f"#f{i}": field for i, field in enumerate(fields)}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+
+def version_etag(item: Dict[str, Any]) -> str:
+    """Strong ETag for a website item (items written before versioning are version 0)"""
+    return f'"{int(item.get("version", 0))}"'
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Expected version from an If-Match header; None means no precondition"""
+    if value is None or value.strip() == '*':
+        return None
+    tag = value.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise ValueError("If-Match must be an ETag returned by this API")
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a target URL used for duplicate detection: scheme and
+    host are lowercased, default ports, fragments and trailing slashes dropped.
+    Raises ValueError for URLs that cannot be parsed.
+    """
+    parsed = urllib.parse.urlsplit(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    if ':' in host:
+        host = f'[{host}]'
+    port = parsed.port
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f'{host}:{port}'
+    path = parsed.path.rstrip('/') or '/'
+    return urllib.parse.urlunsplit((scheme, netloc, path, parsed.query, ''))
+
+def url_guard_id(url_key: str) -> str:
+    return f'{URL_GUARD_PREFIX}{url_key}'
+
+def url_guard_item(website: Dict[str, Any]) -> Dict[str, Any]:
+    """Guard item reserving a website's normalized URL"""
+    return {
+        'id': url_guard_id(website['url_key']),
+        'record_type': URL_GUARD_RECORD_TYPE,
+        'website_id': website['id']
+    }
+
+def deserialize_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Python values for a low-level item (error responses skip the resource layer)"""
+    return {k: type_deserializer.deserialize(v) for k, v in item.items()}
+
+def cancellation_code(error: ClientError, index: int) -> Optional[str]:
+    """Why action number index of a cancelled transaction failed"""
+    if error.response['Error']['Code'] != 'TransactionCanceledException':
+        return None
+    reasons = error.response.get('CancellationReasons') or []
+    return reasons[index].get('Code') if index < len(reasons) else None
+
+def etag_matches(etag: Optional[str], if_none_match: Optional[str]) -> bool:
+    """Whether an If-None-Match header names the current ETag (weak comparison)"""
+    if not etag or not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    current = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == current:
+            return True
+    return False
+
+def conditional_get(response: Dict[str, Any], if_none_match: Optional[str]) -> Dict[str, Any]:
+    """Turn a 200 into a bodiless 304 when the client already has this representation"""
+    if response['statusCode'] != 200 or not etag_matches(response['headers'].get('ETag'), if_none_match):
+        return response
+    headers = {k: v for k, v in response['headers'].items() if k != 'Content-Type'}
+    return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+def is_website(item: Dict[str, Any]) -> bool:
+    """Websites share the id keyspace with the counters, cache version and URL guards"""
+    return item.get('record_type', WEBSITE_RECORD_TYPE) == WEBSITE_RECORD_TYPE
+
+def version_condition(expected_version: Optional[int]) -> Tuple[str, Dict[str, Any]]:
+    """ConditionExpression requiring the item to exist as a website (at the expected version)"""
+    condition = 'attribute_exists(id) AND (attribute_not_exists(record_type) OR record_type = :website_type)'
+    values = {':website_type': WEBSITE_RECORD_TYPE}
+    if expected_version is None:
+        return condition, values
+    values[':expected_version'] = expected_version
+    if expected_version == 0:
+        return condition + ' AND (attribute_not_exists(#version) OR #version = :expected_version)', values
+    return condition + ' AND #version = :expected_version', values
+
+def condition_failure_response(error: ClientError) -> Dict[str, Any]:
+    """404 when the item is gone, 412 when it exists at another version"""
+    # Error responses are not deserialized by the resource layer
+    current = error.response.get('Item')
+    return stale_item_response(deserialize_item(current) if current else None)
+
+def stale_item_response(current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Response for a failed version condition, given the current item (if any)"""
+    if not current or not is_website(current):
+        return create_response(404, {"error": "Website not found"})
+    return create_response(412, {"error": "Website has been modified since it was read"},
+                           headers={'ETag': version_etag(current)})
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
-    Main Lambda handler for CRUD API Gateway operations
+    Main Lambda handler for CRUD API Gateway operations, and for the websites
+    table's stream, which keeps the fleet counters
     """
+    records = event.get('Records') or []
+    if records and records[0].get('eventSource') == 'aws:dynamodb':
+        return count_website_changes(records)
+    try:
+        response = route_request(event)
+        headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        return compress_response(response, headers.get('accept-encoding'), headers.get('accept'))
+    finally:
+        emit_cache_metrics()
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows gzip (honouring q=0)"""
+    for coding in (accept_encoding or '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+def receives_binary(accept: Optional[str]) -> bool:
+    """Whether API Gateway will decode a base64 body for a request with this Accept header"""
+    first = (accept or '').split(',')[0].partition(';')[0].strip().lower()
+    return first in BINARY_MEDIA_TYPES
+
+def compress_response(response: Dict[str, Any], accept_encoding: Optional[str],
+                      accept: Optional[str]) -> Dict[str, Any]:
+    """Gzip bodies over GZIP_MIN_BYTES for clients that accept it and would receive the raw bytes"""
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded') or len(body) < GZIP_MIN_BYTES:
+        return response
+    headers = {**response['headers'], 'Vary': 'Accept, Accept-Encoding'}
+    if not accepts_gzip(accept_encoding) or not receives_binary(accept):
+        return {**response, 'headers': headers}
+    
+    compressed = gzip.compress(body.encode('utf-8'), compresslevel=GZIP_LEVEL, mtime=0)
+    headers['Content-Encoding'] = 'gzip'
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        # A strong ETag names exact bytes; the gzipped body is another representation
+        headers['ETag'] = f'W/{etag}'
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def request_body(event: Dict[str, Any]) -> Optional[str]:
+    """Request body as text (binary media types make API Gateway base64 encode it)"""
+    body = event.get('body')
+    if body and event.get('isBase64Encoded'):
+        try:
+            return base64.b64decode(body).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValueError("Request body is not valid base64-encoded UTF-8")
+    return body
+
+def route_request(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Dispatch an API Gateway event to the matching operation"""
     try:
         # Get HTTP method and path
         http_method = event.get('httpMethod', 'GET')
         path = event.get('path', '')
         path_parameters = event.get('pathParameters') or {}
         query_parameters = event.get('queryStringParameters') or {}
+        headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
         
         logger.info(f"Processing {http_method} request to {path}")
         
+        try:
+            raw_body = request_body(event)
+        except ValueError as e:
+            return create_response(400, {"error": str(e)})
+        
+        # Bulk import takes the raw body since NDJSON is not a single JSON document
+        if http_method == 'POST' and path == BATCH_PATH:
+            return idempotent_request(headers, path, raw_body, lambda: create_websites_batch(raw_body))
+        
         # Parse request body if present
         body = None
-        if event.get('body'):
+        if raw_body:
             try:
-                body = json.loads(event['body'])
+                body = json.loads(raw_body)
             except json.JSONDecodeError:
                 return create_response(400, {"error": "Invalid JSON in request body"})
         
         # Route requests based on HTTP method and path
         if http_method == 'GET' and path == '/websites':
-            return list_websites()
+            return conditional_get(list_websites(query_parameters), headers.get('if-none-match'))
+        elif http_method == 'GET' and path == EXPORT_PATH:
+            return export_websites_response(query_parameters)
+        elif http_method == 'GET' and path == STATUS_PATH:
+            return list_website_status(query_parameters)
+        elif http_method == 'GET' and path == STATS_PATH:
+            return get_website_stats()
+        elif http_method == 'GET' and path == SEARCH_PATH:
+            return search_websites(query_parameters)
+        elif http_method == 'GET' and path == METRICS_PATH:
+            return get_websites_metrics(query_parameters)
+        elif http_method == 'GET' and path == RECENT_ALARMS_PATH:
+            return list_recent_alarm_transitions(query_parameters)
+        elif http_method == 'GET' and path == FIRING_ALARMS_PATH:
+            return list_firing_alarms(query_parameters)
+        elif http_method == 'GET' and path.startswith('/alarms/') and path.endswith('/history'):
+            alarm_name = path_parameters.get('name')
+            if not alarm_name:
+                return create_response(400, {"error": "Alarm name is required"})
+            return get_alarm_history(urllib.parse.unquote(alarm_name), query_parameters)
+        elif http_method == 'GET' and path.startswith('/websites/') and path.endswith('/metrics'):
+            website_id = path_parameters.get('id')
+            if not website_id:
+                return create_response(400, {"error": "Website ID is required"})
+            return get_website_metrics(website_id, query_parameters)
         elif http_method == 'GET' and path.startswith('/websites/'):
             website_id = path_parameters.get('id')
             if not website_id:
                 return create_response(400, {"error": "Website ID is required"})
-            return get_website(website_id)
+            return conditional_get(get_website(website_id), headers.get('if-none-match'))
         elif http_method == 'POST' and path == '/websites':
-            return create_website(body)
+            return idempotent_request(headers, path, raw_body, lambda: create_website(body))
         elif http_method == 'PUT' and path.startswith('/websites/'):
             website_id = path_parameters.get('id')
             if not website_id:
                 return create_response(400, {"error": "Website ID is required"})
-            return update_website(website_id, body)
+            return update_website(website_id, body, headers.get('if-match'))
         elif http_method == 'DELETE' and path.startswith('/websites/'):
             website_id = path_parameters.get('id')
             if not website_id:
                 return create_response(400, {"error": "Website ID is required"})
-            return delete_website(website_id)
+            return delete_website(website_id, headers.get('if-match'))
         else:
             return create_response(405, {"error": f"Method {http_method} not allowed for {path}"})
             
@@ -74,17 +545,74 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         logger.error(f"Error processing request: {str(e)}")
         return create_response(500, {"error": "Internal server error"})
 
-def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
-    """Create a standardized API Gateway response"""
+def idempotent_request(headers: Dict[str, str], path: str, raw_body: Optional[str], execute) -> Dict[str, Any]:
+    """
+    Run a POST at most once per Idempotency-Key. A retry with the same key and
+    body gets the first response back (marked Idempotent-Replayed) without
+    writing again; requests without the header run as usual.
+    """
+    key = headers.get('idempotency-key')
+    if key is None:
+        return execute()
+    try:
+        idempotency.validate_key(key)
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    table_name = os.environ.get('IDEMPOTENCY_TABLE')
+    if not table_name:
+        logger.warning("Idempotency-Key ignored: IDEMPOTENCY_TABLE is not configured")
+        return execute()
+    
+    # Keys are scoped per endpoint; the body fingerprint catches reuse for a different request
+    record_key = f"{path}#{key}"
+    fingerprint = hashlib.sha256((raw_body or '').encode('utf-8')).hexdigest()
+    cached = idempotency_cache.get(record_key)
+    if cached is not None and cached[0] == fingerprint:
+        return replayed(cached[1])
+    
+    table = dynamodb.Table(table_name)
+    try:
+        stored = idempotency.claim(table, record_key, fingerprint, IDEMPOTENCY_TTL_SECONDS)
+    except idempotency.IdempotencyError as e:
+        return create_response(e.status_code, {"error": str(e)})
+    if stored is not None:
+        idempotency_cache.put(record_key, (fingerprint, stored))
+        return replayed(stored)
+    
+    try:
+        response = execute()
+    except Exception:
+        idempotency.release(table, record_key)
+        raise
+    try:
+        if idempotency.complete(table, record_key, response):
+            idempotency_cache.put(record_key, (fingerprint, response))
+    except Exception as e:
+        # The write succeeded; a retry after the claim lapses would run it again
+        logger.error(f"Could not store idempotent response for {record_key}: {str(e)}")
+    return copy_response(response)
+
+def replayed(response: Dict[str, Any]) -> Dict[str, Any]:
+    response = copy_response(response)
+    response['headers']['Idempotent-Replayed'] = 'true'
+    return response
+
+def create_response(status_code: int, body: Dict[str, Any],
+                    headers: Optional[Dict[str, str]] = None,
+                    content_etag: bool = False) -> Dict[str, Any]:
+    """
+    Create a standardized API Gateway response.
+    content_etag adds a strong ETag hashed from the serialized body, for
+    responses (like list pages) that have no single item version.
+    """
+    serialized = decimal_json.dumps(body)
+    response_headers = {'Content-Type': 'application/json', **CORS_HEADERS, **(headers or {})}
+    if content_etag:
+        response_headers['ETag'] = f'"{hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:32]}"'
     return {
         'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS'
-        },
-        'body': json.dumps(body)
+        'headers': response_headers,
+        'body': serialized
     }
 
 def get_table():
@@ -94,128 +622,559 @@ def get_table():
         raise ValueError("TARGET_WEBSITES_TABLE or TARGET_TABLE environment variable not set")
     return dynamodb.Table(table_name)
 
-def list_websites() -> Dict[str, Any]:
-    """List all websites in the target list"""
+def get_search_table():
+    """The trigram search index table, or None when this deployment does not have one"""
+    table_name = os.environ.get('SEARCH_INDEX_TABLE')
+    return dynamodb.Table(table_name) if table_name else None
+
+def copy_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy a cached response so callers can add headers without touching the cache"""
+    return {**response, 'headers': dict(response['headers'])}
+
+def sync_cache_version(table) -> None:
+    """Drop cached reads if another container has written since the last check"""
+    now = time.monotonic()
+    checked_at = _cache_state['checked_at']
+    if checked_at is not None and now - checked_at < CACHE_VERSION_CHECK_SECONDS:
+        return
+    _cache_state['checked_at'] = now
+    try:
+        item = table.get_item(Key={'id': CACHE_VERSION_ID}, ProjectionExpression='cache_version').get('Item') or {}
+    except Exception as e:
+        logger.warning(f"Could not read cache version, dropping cached reads: {str(e)}")
+        read_cache.clear()
+        return
+    version = item.get('cache_version', 0)
+    if version != _cache_state['version']:
+        read_cache.clear()
+        _cache_state['version'] = version
+
+def cached_read(table, key: Tuple, load, versioned: bool = True) -> Dict[str, Any]:
+    """
+    Serve a GET from the read cache, storing successful responses from load().
+    Unversioned reads (not invalidated by website writes) rely on the TTL alone.
+    """
+    if read_cache.ttl_seconds <= 0 or read_cache.max_entries <= 0:
+        return load()
+    if versioned:
+        sync_cache_version(table)
+    key = (table.name,) + key
+    cached = read_cache.get(key)
+    if cached is not None:
+        return copy_response(cached)
+    response = load()
+    if response['statusCode'] == 200:
+        read_cache.put(key, response)
+    return copy_response(response)
+
+def invalidate_read_cache(table) -> None:
+    """Clear this container's cache and bump the shared version for the others"""
+    read_cache.clear()
+    try:
+        response = table.update_item(
+            Key={'id': CACHE_VERSION_ID},
+            UpdateExpression="SET record_type = :record_type ADD cache_version :one",
+            ExpressionAttributeValues={':record_type': META_RECORD_TYPE, ':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        _cache_state['version'] = response['Attributes']['cache_version']
+    except Exception as e:
+        # Other containers fall back to the TTL; the write itself already succeeded
+        logger.warning(f"Could not bump cache version: {str(e)}")
+
+def reset_read_cache() -> None:
+    """Forget every cached read and counter (cold-start state)"""
+    for cache in (read_cache, metrics_cache, idempotency_cache):
+        cache.clear()
+        cache.take_stats()
+    _cache_state.update(version=None, checked_at=None)
+
+def emit_cache_metrics() -> None:
+    """Publish cache hit/miss counts for this invocation as an EMF log line"""
+    hits, misses = read_cache.take_stats()
+    metrics_hits, metrics_misses = metrics_cache.take_stats()
+    if not (hits or misses or metrics_hits or metrics_misses):
+        return
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": [["Service"]],
+                "Metrics": [
+                    {"Name": "CacheHits", "Unit": "Count"},
+                    {"Name": "CacheMisses", "Unit": "Count"},
+                    {"Name": "MetricsCacheHits", "Unit": "Count"},
+                    {"Name": "MetricsCacheMisses", "Unit": "Count"}
+                ]
+            }]
+        },
+        "Service": "crud-api",
+        "CacheHits": hits,
+        "CacheMisses": misses,
+        "MetricsCacheHits": metrics_hits,
+        "MetricsCacheMisses": metrics_misses
+    }))
+
+def list_websites(query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """List one page of websites, optionally filtered and projected"""
+    query_parameters = query_parameters or {}
+    try:
+        limit = parse_limit(query_parameters.get('limit'))
+        cursor = query_parameters.get('cursor')
+        start_key = decode_cursor(cursor) if cursor else None
+        enabled = parse_enabled(query_parameters.get('enabled'))
+        fields = parse_fields(query_parameters.get('fields'))
+        name_prefix = query_parameters.get('name_prefix') or None
+        url_key = parse_url_filter(query_parameters.get('url'))
+        if url_key and (start_key or enabled is not None or name_prefix):
+            raise ValueError("url cannot be combined with cursor, enabled or name_prefix")
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+
     try:
         table = get_table()
-        
-        # Scan the table to get all websites
-        response = table.scan()
-        websites = response.get('Items', [])
-        
-        # Convert Decimal objects to regular numbers for JSON serialization
-        websites = convert_decimals(websites)
-        
-        # Sort by created_at timestamp
-        websites.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        return create_response(200, {
-            "websites": websites,
-            "count": len(websites)
-        })
-        
+        cache_key = ('list', tuple(sorted(query_parameters.items())))
+        if url_key:
+            return cached_read(table, cache_key, lambda: lookup_website_by_url(table, url_key, fields))
+        return cached_read(table, cache_key,
+                           lambda: query_websites_page(table, limit, start_key, enabled, fields, name_prefix))
     except Exception as e:
         logger.error(f"Error listing websites: {str(e)}")
         return create_response(500, {"error": "Failed to list websites"})
 
+def lookup_website_by_url(table, url_key: str, fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Find the website registered for a normalized URL through its guard item"""
+    _, website = find_by_url_key(table, url_key)
+    websites = []
+    if website:
+        websites.append({k: website[k] for k in (fields or PUBLIC_FIELDS) if k in website})
+    return create_response(200, {
+        "websites": websites,
+        "count": len(websites),
+        "next_cursor": None,
+        "access_path": {"operation": "GetItem", "index": None, "filtered": False}
+    }, content_etag=True)
+
+def query_websites_page(table, limit: int, start_key: Optional[Dict[str, Any]], enabled: Optional[bool],
+                        fields: Optional[List[str]], name_prefix: Optional[str]) -> Dict[str, Any]:
+    """Read one page of websites from DynamoDB"""
+    # Always project so internal index attributes never leave DynamoDB
+    page_params = {'Limit': limit, **projection_params(fields or list(PUBLIC_FIELDS))}
+    if start_key:
+        page_params['ExclusiveStartKey'] = start_key
+    
+    query_params = plan_list_query(enabled, name_prefix)
+    try:
+        # Indexed Query - pages come back already ordered by the index sort key
+        response = table.query(**query_params, **page_params)
+        access_path = {
+            "operation": "Query",
+            "index": query_params['IndexName'],
+            "filtered": 'FilterExpression' in query_params
+        }
+        websites = response.get('Items', [])
+    except ClientError as e:
+        if invalid_input(e):
+            # A cursor that decodes but is not a key of this index
+            return create_response(400, {"error": "Invalid cursor"})
+        if not index_missing(e):
+            raise
+        # Index not available yet (e.g. table created before it was added)
+        logger.warning(f"{query_params['IndexName']} unavailable, falling back to scan: {str(e)}")
+        response = table.scan(**plan_list_scan(enabled, name_prefix), **page_params)
+        access_path = {"operation": "Scan", "index": None, "filtered": True}
+        websites = response.get('Items', [])
+        websites.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+    
+    # Items are projected to public fields, so they are serialized as-is
+    
+    last_key = response.get('LastEvaluatedKey')
+    
+    return create_response(200, {
+        "websites": websites,
+        "count": len(websites),
+        "next_cursor": encode_cursor(last_key) if last_key else None,
+        "access_path": access_path
+    }, content_etag=True)
+
 def get_website(website_id: str) -> Dict[str, Any]:
     """Get a specific website by ID"""
     try:
         table = get_table()
-        
-        response = table.get_item(Key={'id': website_id})
-        
-        if 'Item' not in response:
-            return create_response(404, {"error": "Website not found"})
-        
-        # Convert Decimal objects to regular numbers for JSON serialization
-        website = convert_decimals(response['Item'])
-        
-        return create_response(200, {
-            "website": website
-        })
-        
+        return cached_read(table, ('website', website_id), lambda: read_website(table, website_id))
     except Exception as e:
         logger.error(f"Error getting website {website_id}: {str(e)}")
         return create_response(500, {"error": "Failed to get website"})
 
+def read_website(table, website_id: str) -> Dict[str, Any]:
+    """Read a single website from DynamoDB"""
+    response = table.get_item(Key={'id': website_id})
+    
+    if 'Item' not in response or not is_website(response['Item']):
+        return create_response(404, {"error": "Website not found"})
+    
+    website = to_public(response['Item'])
+    
+    return create_response(200, {
+        "website": website
+    }, headers={'ETag': version_etag(response['Item'])})
+
+def validate_website(data: Any) -> Optional[str]:
+    """Validate a new website payload, returning an error message or None"""
+    if not isinstance(data, dict):
+        return "Website must be a JSON object"
+    
+    # Validate required fields
+    required_fields = ['url', 'name']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            return f"Field '{field}' is required"
+    
+    # Validate URL format
+    url = data['url']
+    if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+        return "URL must start with http:// or https://"
+    
+    # Additional URL validation
+    try:
+        parsed = urllib.parse.urlparse(url)
+        if not parsed.netloc:
+            return "Invalid URL format"
+        url_key = normalize_url(url)
+    except Exception:
+        return "Invalid URL format"
+    if len(url_key) > MAX_URL_KEY_LENGTH:
+        return f"URL must be at most {MAX_URL_KEY_LENGTH} characters"
+    
+    return None
+
+def build_website_item(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the DynamoDB item for a validated website payload"""
+    # Generate unique ID and timestamps
+    current_time = datetime.utcnow().isoformat()
+    
+    return {
+        'id': str(uuid.uuid4()),
+        'url': data['url'],
+        'url_key': normalize_url(data['url']),
+        'name': data['name'],
+        'description': data.get('description', ''),
+        'enabled': data.get('enabled', True),
+        'check_interval': data.get('check_interval', 300),  # 5 minutes default
+        'timeout': data.get('timeout', 30),
+        'expected_status': data.get('expected_status', 200),
+        'created_at': current_time,
+        'updated_at': current_time,
+        'version': 1,
+        'record_type': WEBSITE_RECORD_TYPE,
+        'enabled_key': enabled_key(data.get('enabled', True))
+    }
+
+def update_search_index(website: Dict[str, Any], deleted: bool = False) -> None:
+    """Bring the trigram index up to date after a write (the write itself already succeeded)"""
+    table = get_search_table()
+    if table is None:
+        return
+    try:
+        if deleted:
+            search_index.unindex_website(table, website['id'])
+        else:
+            search_index.index_website(table, website)
+    except Exception as e:
+        logger.warning(f"Could not update search index for {website['id']}: {str(e)}")
+
+def put_website_with_guard(table, website: Dict[str, Any], stale_owner: Optional[str] = None) -> None:
+    """Write a website and the guard reserving its URL in one transaction"""
+    # The resource's client serializes Python values for transactions too
+    guard = {'TableName': table.name, 'Item': url_guard_item(website)}
+    if stale_owner is None:
+        guard['ConditionExpression'] = 'attribute_not_exists(id)'
+    else:
+        # Take over a guard left behind by a website that no longer exists
+        guard['ConditionExpression'] = 'website_id = :owner'
+        guard['ExpressionAttributeValues'] = {':owner': stale_owner}
+    transact_write(table, [
+        {'Put': {
+            'TableName': table.name,
+            'Item': website,
+            'ConditionExpression': 'attribute_not_exists(id)'
+        }},
+        {'Put': guard}
+    ])
+
+def find_by_url_key(table, url_key: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """(owner id, website) registered for a normalized URL; website is None for a stale guard"""
+    guard = table.get_item(Key={'id': url_guard_id(url_key)}, ConsistentRead=True).get('Item')
+    if not guard:
+        return None, None
+    website = table.get_item(Key={'id': guard['website_id']}, ConsistentRead=True).get('Item')
+    return guard['website_id'], website
+
 def create_website(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-    """Create a new website entry"""
+    """Create a new website entry, or return the existing one for a duplicate URL"""
     try:
         if not data:
             return create_response(400, {"error": "Request body is required"})
         
-        # Validate required fields
-        required_fields = ['url', 'name']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return create_response(400, {"error": f"Field '{field}' is required"})
+        error = validate_website(data)
+        if error:
+            return create_response(400, {"error": error})
         
-        # Validate URL format
-        url = data['url']
-        if not url.startswith(('http://', 'https://')):
-            return create_response(400, {"error": "URL must start with http:// or https://"})
-        
-        # Additional URL validation
-        try:
-            import urllib.parse
-            parsed = urllib.parse.urlparse(url)
-            if not parsed.netloc:
-                return create_response(400, {"error": "Invalid URL format"})
-        except Exception:
-            return create_response(400, {"error": "Invalid URL format"})
-        
-        # Generate unique ID and timestamps
-        website_id = str(uuid.uuid4())
-        current_time = datetime.utcnow().isoformat()
-        
-        # Prepare website data
-        website_data = {
-            'id': website_id,
-            'url': url,
-            'name': data['name'],
-            'description': data.get('description', ''),
-            'enabled': data.get('enabled', True),
-            'check_interval': data.get('check_interval', 300),  # 5 minutes default
-            'timeout': data.get('timeout', 30),
-            'expected_status': data.get('expected_status', 200),
-            'created_at': current_time,
-            'updated_at': current_time
-        }
+        website_data = build_website_item(data)
         
         table = get_table()
-        table.put_item(Item=website_data)
-        
-        logger.info(f"Created website {website_id}: {url}")
+        stale_owner = None
+        # A second attempt is only needed to replace a stale guard
+        for _ in range(2):
+            try:
+                put_website_with_guard(table, website_data, stale_owner)
+            except ClientError as e:
+                if cancellation_code(e, 1) != 'ConditionalCheckFailed':
+                    raise
+                stale_owner, existing = find_by_url_key(table, website_data['url_key'])
+                if existing:
+                    logger.info(f"Website for {website_data['url']} already exists as {existing['id']}")
+                    return create_response(200, {
+                        "message": "Website already exists",
+                        "website": to_public(existing)
+                    }, headers={'ETag': version_etag(existing)})
+                continue
+            
+            invalidate_read_cache(table)
+            update_search_index(website_data)
+            
+            logger.info(f"Created website {website_data['id']}: {website_data['url']}")
+            
+            return create_response(201, {
+                "message": "Website created successfully",
+                "website": to_public(website_data)
+            }, headers={'ETag': version_etag(website_data)})
         
-        return create_response(201, {
-            "message": "Website created successfully",
-            "website": website_data
-        })
+        return create_response(409, {"error": "URL is being registered concurrently, retry the request"})
         
     except Exception as e:
         logger.error(f"Error creating website: {str(e)}")
         return create_response(500, {"error": "Failed to create website"})
 
-def update_website(website_id: str, data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-    """Update an existing website entry"""
+def parse_batch_body(raw_body: str) -> Iterator[Tuple[int, Any, Optional[str]]]:
+    """
+    Yield (index, item, error) for each entry of a JSON array or NDJSON body.
+    NDJSON lines are decoded one at a time so a bad line only fails itself.
+    """
+    if raw_body.lstrip().startswith('['):
+        try:
+            items = json.loads(raw_body)
+        except json.JSONDecodeError:
+            raise ValueError("Invalid JSON array in request body")
+        for index, item in enumerate(items):
+            yield index, item, None
+        return
+    
+    index = 0
+    for line in raw_body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line), None
+        except json.JSONDecodeError:
+            yield index, None, "Invalid JSON"
+        index += 1
+
+def get_thread_table(table_name: Optional[str] = None):
+    """Per-thread table handle (the websites table by default) - boto3 resources must not be shared between threads"""
+    table_name = table_name or get_table().name
+    tables = getattr(_thread_local, 'tables', None)
+    if tables is None:
+        tables = _thread_local.tables = {}
+    if table_name not in tables:
+        tables[table_name] = boto3.session.Session().resource('dynamodb').Table(table_name)
+    return tables[table_name]
+
+def existing_url_owners(table, url_keys: List[str]) -> Dict[str, str]:
+    """Map each already registered normalized URL to its website id (one BatchGetItem)"""
+    owners = {}
+    request = {table.name: {
+        'Keys': [{'id': url_guard_id(url_key)} for url_key in set(url_keys)],
+        'ProjectionExpression': 'id, website_id'
+    }}
+    while request:
+        response = table.meta.client.batch_get_item(RequestItems=request)
+        for guard in response['Responses'].get(table.name, []):
+            owners[guard['id'][len(URL_GUARD_PREFIX):]] = guard['website_id']
+        request = response.get('UnprocessedKeys')
+    return owners
+
+def settle_failed_chunk(table, pending: List[Tuple[int, Dict[str, Any]]]) -> Set[str]:
+    """
+    After batch_writer failed part-way, find which websites of a chunk were
+    written (consistent BatchGetItem on their ids), finish their URL guards and
+    release the guards written for the others. Returns the ids of the websites
+    that now exist.
+    """
+    written = set()
+    request = {table.name: {
+        'Keys': [{'id': item['id']} for _, item in pending],
+        'ProjectionExpression': 'id',
+        'ConsistentRead': True
+    }}
+    while request:
+        response = table.meta.client.batch_get_item(RequestItems=request)
+        written.update(item['id'] for item in response['Responses'].get(table.name, []))
+        request = response.get('UnprocessedKeys')
+    
+    with table.batch_writer() as batch:
+        for _, item in pending:
+            if item['id'] in written:
+                batch.put_item(Item=url_guard_item(item))
+    for _, item in pending:
+        if item['id'] not in written:
+            # Conditional on the owner, so a guard another write took in between stays
+            release_url_guard(table, item)
+    return written
+
+def write_batch_chunk(chunk: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Write one chunk of items and their URL guards through batch_writer and
+    report per item. URLs that already have a guard are skipped; BatchWriteItem
+    cannot be conditional, so this check is not atomic like single creates.
+    """
+    try:
+        table = get_thread_table()
+        owners = existing_url_owners(table, [item['url_key'] for _, item in chunk])
+    except Exception as e:
+        logger.error(f"Error writing batch chunk: {str(e)}")
+        return [{"index": index, "status": "failed", "error": "Failed to write website"} for index, _ in chunk]
+    
+    results = []
+    pending = []
+    for index, item in chunk:
+        owner = owners.get(item['url_key'])
+        if owner:
+            results.append({"index": index, "status": "exists", "id": owner})
+        else:
+            pending.append((index, item))
+    
+    try:
+        with table.batch_writer() as batch:
+            for _, item in pending:
+                batch.put_item(Item=item)
+                batch.put_item(Item=url_guard_item(item))
+        written = {item['id'] for _, item in pending}
+    except Exception as e:
+        # Earlier flushes may have succeeded, so report what is actually in the table
+        logger.error(f"Error writing batch chunk: {str(e)}")
+        try:
+            written = settle_failed_chunk(table, pending)
+        except Exception as e:
+            logger.error(f"Could not settle failed batch chunk: {str(e)}")
+            return results + [{"index": index, "status": "failed", "error": "Failed to write website"}
+                              for index, _ in pending]
+    
+    for index, item in pending:
+        if item['id'] not in written:
+            results.append({"index": index, "status": "failed", "error": "Failed to write website"})
+            continue
+        results.append({"index": index, "status": "created", "id": item['id']})
+    
+    index_new_websites([item for _, item in pending if item['id'] in written])
+    return results
+
+def index_new_websites(websites: List[Dict[str, Any]]) -> None:
+    """Post search items for freshly imported websites (the imports themselves already succeeded)"""
+    search_table = get_search_table()
+    if search_table is None or not websites:
+        return
+    try:
+        with get_thread_table(search_table.name).batch_writer() as batch:
+            for website in websites:
+                for search_item in search_index.new_website_items(website):
+                    batch.put_item(Item=search_item)
+    except Exception as e:
+        logger.warning(f"Could not update search index for {len(websites)} imported websites: {str(e)}")
+
+def create_websites_batch(raw_body: Optional[str]) -> Dict[str, Any]:
+    """Bulk import websites from a JSON array or NDJSON body"""
+    if not raw_body:
+        return create_response(400, {"error": "Request body is required"})
+    
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=BATCH_WRITE_WORKERS) as executor:
+            futures = []
+            chunk = []
+            first_index = {}
+            for index, data, error in parse_batch_body(raw_body):
+                if error is None and index >= MAX_BATCH_ITEMS:
+                    error = f"Batch limit of {MAX_BATCH_ITEMS} websites exceeded"
+                if error is None:
+                    error = validate_website(data)
+                if error is None:
+                    website = build_website_item(data)
+                    if website['url_key'] in first_index:
+                        error = f"Duplicate of item {first_index[website['url_key']]} in this batch"
+                    else:
+                        first_index[website['url_key']] = index
+                if error:
+                    results.append({"index": index, "status": "failed", "error": error})
+                    continue
+                
+                chunk.append((index, website))
+                if len(chunk) == BATCH_CHUNK_SIZE:
+                    futures.append(executor.submit(write_batch_chunk, chunk))
+                    chunk = []
+            if chunk:
+                futures.append(executor.submit(write_batch_chunk, chunk))
+            
+            for future in futures:
+                results.extend(future.result())
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    except Exception as e:
+        logger.error(f"Error importing websites: {str(e)}")
+        return create_response(500, {"error": "Failed to import websites"})
+    
+    results.sort(key=lambda result: result['index'])
+    created = sum(1 for result in results if result['status'] == 'created')
+    existing = sum(1 for result in results if result['status'] == 'exists')
+    failed = len(results) - created - existing
+    if created:
+        invalidate_read_cache(get_table())
+    
+    logger.info(f"Batch import: {created} created, {existing} already existed, {failed} failed")
+    
+    return create_response(200, {
+        "message": "Batch import completed",
+        "created": created,
+        "existing": existing,
+        "failed": failed,
+        "results": results
+    })
+
+def update_website(website_id: str, data: Optional[Dict[str, Any]],
+                   if_match: Optional[str] = None) -> Dict[str, Any]:
+    """Update an existing website entry in a single conditional write"""
     try:
         if not data:
             return create_response(400, {"error": "Request body is required"})
         
-        table = get_table()
-        
-        # Check if website exists
-        response = table.get_item(Key={'id': website_id})
-        if 'Item' not in response:
-            return create_response(404, {"error": "Website not found"})
-        
-        existing_website = response['Item']
+        try:
+            expected_version = parse_if_match(if_match)
+        except ValueError as e:
+            return create_response(400, {"error": str(e)})
         
-        # Prepare update expression
-        update_expression = "SET updated_at = :updated_at"
-        expression_values = {':updated_at': datetime.utcnow().isoformat()}
-        expression_names = {}
+        # Prepare update expression (record_type backfills items created before the index existed)
+        update_expression = ("SET updated_at = :updated_at, record_type = :record_type, "
+                             "#version = if_not_exists(#version, :zero) + :one")
+        expression_values = {
+            ':updated_at': datetime.utcnow().isoformat(),
+            ':record_type': WEBSITE_RECORD_TYPE,
+            ':zero': 0,
+            ':one': 1
+        }
+        expression_names = {'#version': 'version'}
+        # Attributes the update sets, besides the version
+        changes = {'updated_at': expression_values[':updated_at'], 'record_type': WEBSITE_RECORD_TYPE}
         
         # Update fields that are provided
         updatable_fields = ['name', 'description', 'enabled', 'check_interval', 'timeout', 'expected_status']
@@ -225,62 +1184,216 @@ def update_website(website_id: str, data: Optional[Dict[str, Any]]) -> Dict[str,
                 attr_name = f"#{field}" if field in ['name', 'description'] else field
                 update_expression += f", {attr_name} = :{field}"
                 expression_values[f':{field}'] = data[field]
+                changes[field] = data[field]
                 if field in ['name', 'description']:
                     expression_names[f"#{field}"] = field
         
+        # Keep the enabled-key-index in step with the enabled flag
+        if 'enabled' in data:
+            update_expression += ", enabled_key = :enabled_key"
+            expression_values[':enabled_key'] = changes['enabled_key'] = enabled_key(data['enabled'])
+        
         # Special handling for URL (validate format)
         if 'url' in data:
             url = data['url']
-            if not url.startswith(('http://', 'https://')):
+            if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
                 return create_response(400, {"error": "URL must start with http:// or https://"})
-            update_expression += ", url = :url"
-            expression_values[':url'] = url
-        
-        # Prepare update parameters
-        update_params = {
-            'Key': {'id': website_id},
-            'UpdateExpression': update_expression,
-            'ExpressionAttributeValues': expression_values,
-            'ReturnValues': 'ALL_NEW'
-        }
+            try:
+                url_key = normalize_url(url)
+            except ValueError:
+                return create_response(400, {"error": "Invalid URL format"})
+            update_expression += ", #url = :url, url_key = :url_key"
+            expression_names['#url'] = 'url'
+            expression_values[':url'] = changes['url'] = url
+            expression_values[':url_key'] = changes['url_key'] = url_key
         
-        # Add ExpressionAttributeNames if needed
-        if expression_names:
-            update_params['ExpressionAttributeNames'] = expression_names
+        table = get_table()
+        if 'url' in data:
+            return update_website_transaction(table, website_id, expected_version, update_expression,
+                                              expression_names, expression_values, changes)
         
-        # Perform update
-        table.update_item(**update_params)
+        # The condition replaces the old existence read and guards against lost updates
+        condition, condition_values = version_condition(expected_version)
+        expression_values.update(condition_values)
         
-        # Get updated item
-        response = table.get_item(Key={'id': website_id})
-        updated_website = response['Item']
+        try:
+            response = table.update_item(
+                Key={'id': website_id},
+                UpdateExpression=update_expression,
+                ConditionExpression=condition,
+                ExpressionAttributeNames=expression_names,
+                ExpressionAttributeValues=expression_values,
+                ReturnValues='ALL_NEW',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return condition_failure_response(e)
+        invalidate_read_cache(table)
         
-        # Convert Decimal objects to regular numbers for JSON serialization
-        updated_website = convert_decimals(updated_website)
+        updated_website = response['Attributes']
+        if 'name' in data:
+            update_search_index(updated_website)
         
         logger.info(f"Updated website {website_id}")
         
         return create_response(200, {
             "message": "Website updated successfully",
-            "website": updated_website
-        })
+            "website": to_public(updated_website)
+        }, headers={'ETag': version_etag(updated_website)})
         
     except Exception as e:
         logger.error(f"Error updating website {website_id}: {str(e)}")
         return create_response(500, {"error": "Failed to update website"})
 
-def delete_website(website_id: str) -> Dict[str, Any]:
-    """Delete a website entry"""
+def update_website_transaction(table, website_id: str, expected_version: Optional[int], update_expression: str,
+                               expression_names: Dict[str, str], expression_values: Dict[str, Any],
+                               changes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply an update that sets the URL, moving the URL guard in the same
+    transaction. The update is first tried as a single write assuming the
+    normalized URL is unchanged. When it is not, the failed condition returns
+    the current item, and the guard move is planned from its URL key, pinned in
+    the transaction's condition: a concurrent URL change re-plans from the item
+    the cancellation returns instead of moving the wrong guard.
+    """
+    condition, condition_values = version_condition(expected_version)
     try:
-        table = get_table()
+        updated_website = table.update_item(
+            Key={'id': website_id},
+            UpdateExpression=update_expression,
+            ConditionExpression=f"{condition} AND url_key = :url_key",
+            ExpressionAttributeNames=expression_names,
+            ExpressionAttributeValues={**expression_values, **condition_values},
+            ReturnValues='ALL_NEW',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        current = e.response.get('Item')
+        updated_website, error_response = move_url_guard(
+            table, website_id, expected_version, update_expression, expression_names, expression_values, changes,
+            deserialize_item(current) if current else None)
+        if error_response:
+            return error_response
+    invalidate_read_cache(table)
+    
+    update_search_index(updated_website)
+    
+    logger.info(f"Updated website {website_id}")
+    
+    return create_response(200, {
+        "message": "Website updated successfully",
+        "website": to_public(updated_website)
+    }, headers={'ETag': version_etag(updated_website)})
+
+def move_url_guard(table, website_id: str, expected_version: Optional[int], update_expression: str,
+                   expression_names: Dict[str, str], expression_values: Dict[str, Any],
+                   changes: Dict[str, Any],
+                   current: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Update a website whose URL key changes, together with its guards, planned
+    from the item as last returned by DynamoDB. Returns (updated website, None),
+    the website built from that item and the changes, or (None, error response).
+    """
+    new_key = expression_values[':url_key']
+    condition, condition_values = version_condition(expected_version)
+    for _ in range(TRANSACTION_ATTEMPTS):
+        if not current or not is_website(current) or (
+                expected_version is not None and int(current.get('version', 0)) != expected_version):
+            return None, stale_item_response(current)
+        old_key = current.get('url_key')
+        if old_key:
+            pinned = f"{condition} AND url_key = :old_url_key"
+            pinned_values = {':old_url_key': old_key}
+        else:
+            pinned, pinned_values = f"{condition} AND attribute_not_exists(url_key)", {}
+        transact_items = [{'Update': {
+            'TableName': table.name,
+            'Key': {'id': website_id},
+            'UpdateExpression': update_expression,
+            'ConditionExpression': pinned,
+            'ExpressionAttributeNames': expression_names,
+            'ExpressionAttributeValues': {**expression_values, **condition_values, **pinned_values},
+            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+        }}]
+        if new_key != old_key:
+            owned = {
+                'ConditionExpression': 'attribute_not_exists(id) OR website_id = :website_id',
+                'ExpressionAttributeValues': {':website_id': website_id}
+            }
+            transact_items.append({'Put': {
+                'TableName': table.name,
+                'Item': url_guard_item({'id': website_id, 'url_key': new_key}),
+                **owned
+            }})
+            if old_key:
+                transact_items.append({'Delete': {
+                    'TableName': table.name,
+                    'Key': {'id': url_guard_id(old_key)},
+                    **owned
+                }})
+        try:
+            transact_write(table, transact_items)
+        except ClientError as e:
+            if cancellation_code(e, 0) == 'ConditionalCheckFailed':
+                # Changed since it was returned: re-plan from the item as it is now
+                item = e.response['CancellationReasons'][0].get('Item')
+                current = deserialize_item(item) if item else None
+                continue
+            if cancellation_code(e, 1) == 'ConditionalCheckFailed':
+                owner, _ = find_by_url_key(table, new_key)
+                return None, create_response(409, {"error": "Another website already uses this URL",
+                                                   "website_id": owner})
+            raise
+        return {**current, **changes, 'version': int(current.get('version', 0)) + 1}, None
+    return None, create_response(409, {"error": "Website is being updated concurrently, retry the request"})
+
+def release_url_guard(table, website: Dict[str, Any]) -> None:
+    """Free a deleted website's URL (a guard left behind is reclaimed by the next create)"""
+    if not website.get('url_key'):
+        return
+    try:
+        table.delete_item(
+            Key={'id': url_guard_id(website['url_key'])},
+            ConditionExpression='website_id = :website_id',
+            ExpressionAttributeValues={':website_id': website['id']}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.warning(f"Could not release URL guard for {website['id']}: {str(e)}")
+
+def delete_website(website_id: str, if_match: Optional[str] = None) -> Dict[str, Any]:
+    """Delete a website entry in a single conditional write"""
+    try:
+        try:
+            expected_version = parse_if_match(if_match)
+        except ValueError as e:
+            return create_response(400, {"error": str(e)})
         
-        # Check if website exists
-        response = table.get_item(Key={'id': website_id})
-        if 'Item' not in response:
-            return create_response(404, {"error": "Website not found"})
+        condition, condition_values = version_condition(expected_version)
+        delete_params = {
+            'Key': {'id': website_id},
+            'ConditionExpression': condition,
+            'ExpressionAttributeValues': condition_values,
+            'ReturnValues': 'ALL_OLD',
+            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+        }
+        if expected_version is not None:
+            delete_params['ExpressionAttributeNames'] = {'#version': 'version'}
         
-        # Delete the website
-        table.delete_item(Key={'id': website_id})
+        table = get_table()
+        try:
+            deleted = table.delete_item(**delete_params)['Attributes']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return condition_failure_response(e)
+        release_url_guard(table, deleted)
+        update_search_index(deleted, deleted=True)
+        invalidate_read_cache(table)
         
         logger.info(f"Deleted website {website_id}")
         
@@ -292,3 +1405,523 @@ def delete_website(website_id: str) -> Dict[str, Any]:
     except Exception as e:
         logger.error(f"Error deleting website {website_id}: {str(e)}")
         return create_response(500, {"error": "Failed to delete website"})
+
+def get_website_stats() -> Dict[str, Any]:
+    """Fleet totals from the maintained counter item, plus the crawler's per-status summary"""
+    try:
+        table = get_table()
+        return cached_read(table, ('stats',), lambda: load_website_stats(table))
+    except Exception as e:
+        logger.error(f"Error getting website stats: {str(e)}")
+        return create_response(500, {"error": "Failed to get website stats"})
+
+def load_website_stats(table) -> Dict[str, Any]:
+    """Read both counter items in one BatchGetItem"""
+    status_table_name = os.environ.get('TARGET_STATUS_TABLE')
+    request = {table.name: {'Keys': [{'id': STATS_ID}]}}
+    if status_table_name:
+        request[status_table_name] = {'Keys': [STATUS_SUMMARY_KEY]}
+    items = {}
+    while request:
+        response = table.meta.client.batch_get_item(RequestItems=request)
+        for table_name, found in response['Responses'].items():
+            if found:
+                items[table_name] = found[0]
+        request = response.get('UnprocessedKeys')
+    
+    stats = items.get(table.name)
+    if not stats or 'counted_at' not in stats:
+        stats = recount_website_stats(table)
+    
+    status = None
+    summary = items.get(status_table_name)
+    if summary:
+        status = {
+            "up": summary.get('up', 0),
+            "down": summary.get('down', 0),
+            "status_codes": summary.get('status_codes', {}),
+            "checked_at": summary.get('checked_at')
+        }
+    
+    return create_response(200, {
+        "total": stats.get('total_count', 0),
+        "enabled": stats.get('enabled_count', 0),
+        "disabled": stats.get('disabled_count', 0),
+        "counted_since": stats['counted_at'],
+        "status": status
+    }, content_etag=True)
+
+def recount_website_stats(table) -> Dict[str, Any]:
+    """
+    Seed the counters from a full scan, once per table. Tables created before
+    the counters existed start here; every later write keeps them current.
+    """
+    counts = dict.fromkeys(STATS_COUNTERS, 0)
+    params = {
+        'FilterExpression': website_filter(),
+        'ProjectionExpression': '#enabled',
+        'ExpressionAttributeNames': {'#enabled': 'enabled'}
+    }
+    while True:
+        response = table.scan(**params)
+        for item in response.get('Items', []):
+            for name, delta in website_counts(item).items():
+                counts[name] += delta
+        if 'LastEvaluatedKey' not in response:
+            break
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    try:
+        return table.update_item(
+            Key={'id': STATS_ID},
+            UpdateExpression=("SET record_type = :record_type, counted_at = :counted_at, "
+                              + ', '.join(f"{name} = :{name}" for name in STATS_COUNTERS)),
+            ConditionExpression='attribute_not_exists(counted_at)',
+            ExpressionAttributeValues={
+                ':record_type': META_RECORD_TYPE,
+                ':counted_at': datetime.utcnow().isoformat(),
+                **{f':{name}': count for name, count in counts.items()}
+            },
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # Another container seeded the counters first
+        return table.get_item(Key={'id': STATS_ID}, ConsistentRead=True)['Item']
+
+def count_website_changes(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Fold a batch of websites table stream records into the fleet counters with
+    one UpdateItem. Writes never touch the counter item themselves, so they do
+    not contend on it; the counters trail the table by the stream's delay.
+    """
+    deltas = dict.fromkeys(STATS_COUNTERS, 0)
+    for record in records:
+        change = record.get('dynamodb', {})
+        for image_name, sign in (('OldImage', -1), ('NewImage', 1)):
+            image = deserialize_item(change.get(image_name) or {})
+            # The counters, cache version and URL guards share the table
+            if 'url' not in image or not is_website(image):
+                continue
+            for name, delta in website_counts(image, sign).items():
+                deltas[name] += delta
+    if any(deltas.values()):
+        get_table().update_item(**stats_update(deltas))
+    logger.info(f"Counted {len(records)} website changes: {deltas}")
+    return {"records": len(records), **deltas}
+
+def list_website_status(query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """One page of the crawler's last-known status for every target"""
+    query_parameters = query_parameters or {}
+    try:
+        limit = parse_limit(query_parameters.get('limit'))
+        cursor = query_parameters.get('cursor')
+        start_key = decode_cursor(cursor, key_attribute='website_id') if cursor else None
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    
+    table_name = os.environ.get('TARGET_STATUS_TABLE')
+    if not table_name:
+        return create_response(503, {"error": "Status view is not configured"})
+    
+    try:
+        table = dynamodb.Table(table_name)
+        cache_key = ('status', limit, cursor)
+        # Written by the crawler, not this API, so only the TTL applies
+        return cached_read(table, cache_key, lambda: query_status_page(table, limit, start_key), versioned=False)
+    except Exception as e:
+        logger.error(f"Error listing website status: {str(e)}")
+        return create_response(500, {"error": "Failed to list website status"})
+
+def query_status_page(table, limit: int, start_key: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Every status record lives in one partition, so a page is a single Query"""
+    params = {'KeyConditionExpression': Key('fleet').eq(STATUS_PARTITION), 'Limit': limit}
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+    response = table.query(**params)
+    
+    statuses = [{k: v for k, v in item.items() if k != 'fleet'} for item in response.get('Items', [])]
+    last_key = response.get('LastEvaluatedKey')
+    
+    return create_response(200, {
+        "statuses": statuses,
+        "count": len(statuses),
+        "next_cursor": encode_cursor(last_key) if last_key else None
+    }, content_etag=True)
+
+def get_alarm_table():
+    """The alarm logger's table, or None when this deployment does not expose it"""
+    table_name = os.environ.get('ALARM_TABLE')
+    return dynamodb.Table(table_name) if table_name else None
+
+def get_alarm_history(alarm_name: str, query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """One page of an alarm's state transitions, newest first, optionally within ?from=&to="""
+    query_parameters = query_parameters or {}
+    try:
+        limit = parse_limit(query_parameters.get('limit'))
+        cursor = query_parameters.get('cursor')
+        start_key = decode_cursor(cursor, key_attribute='Timestamp') if cursor else None
+        if start_key and start_key.get('AlarmName') != alarm_name:
+            raise ValueError("Invalid cursor")
+        start = query_parameters.get('from')
+        start = alarm_history.parse_time(start, 'from') if start else None
+        end = query_parameters.get('to')
+        end = alarm_history.parse_time(end, 'to') if end else None
+        if start and end and start > end:
+            raise ValueError("from must not be after to")
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    
+    table = get_alarm_table()
+    if table is None:
+        return create_response(503, {"error": "Alarm history is not configured"})
+    
+    def load():
+        transitions, last_key = alarm_history.history_page(table, alarm_name, start, end, limit, start_key)
+        return create_response(200, {
+            "alarm_name": alarm_name,
+            "transitions": transitions,
+            "count": len(transitions),
+            "next_cursor": encode_cursor(last_key) if last_key else None
+        }, content_etag=True)
+    
+    try:
+        cache_key = ('alarm_history', alarm_name, tuple(sorted(query_parameters.items())))
+        # Written by the alarm logger, not this API, so only the TTL applies
+        return cached_read(table, cache_key, load, versioned=False)
+    except Exception as e:
+        logger.error(f"Error reading history for alarm {alarm_name}: {str(e)}")
+        return create_response(500, {"error": "Failed to read alarm history"})
+
+def list_recent_alarm_transitions(query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """One page of transitions across every alarm since ?since= (default the last 24 hours)"""
+    query_parameters = query_parameters or {}
+    now = datetime.now(timezone.utc)
+    try:
+        limit = parse_limit(query_parameters.get('limit'))
+        since = alarm_history.recent_since(query_parameters.get('since'), now)
+        cursor = query_parameters.get('cursor')
+        position = decode_cursor(cursor, key_attribute='day') if cursor else None
+        if position and not re.fullmatch(r'\d{4}-\d{2}-\d{2}', str(position['day'])):
+            raise ValueError("Invalid cursor")
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    
+    table = get_alarm_table()
+    if table is None:
+        return create_response(503, {"error": "Alarm history is not configured"})
+    
+    def load():
+        try:
+            transitions, next_position = alarm_history.recent_page(table, since, limit, position, now)
+        except ClientError as e:
+            if invalid_input(e):
+                return create_response(400, {"error": "Invalid cursor"})
+            if not index_missing(e):
+                raise
+            logger.warning(f"{alarm_history.RECENT_INDEX} unavailable: {str(e)}")
+            return create_response(503, {"error": "Recent transitions index is not available yet"})
+        return create_response(200, {
+            "transitions": transitions,
+            "count": len(transitions),
+            "since": since,
+            "next_cursor": encode_cursor(next_position) if next_position else None
+        }, content_etag=True)
+    
+    try:
+        cache_key = ('recent_alarms', tuple(sorted(query_parameters.items())))
+        return cached_read(table, cache_key, load, versioned=False)
+    except Exception as e:
+        logger.error(f"Error listing recent alarm transitions: {str(e)}")
+        return create_response(500, {"error": "Failed to list recent alarm transitions"})
+
+def list_firing_alarms(query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """One page of the alarms currently in ALARM, from the alarm logger's sparse index"""
+    query_parameters = query_parameters or {}
+    try:
+        limit = parse_limit(query_parameters.get('limit'))
+        cursor = query_parameters.get('cursor')
+        start_key = decode_cursor(cursor, key_attribute='AlarmName') if cursor else None
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    
+    table = get_alarm_table()
+    if table is None:
+        return create_response(503, {"error": "Alarm history is not configured"})
+    
+    def load():
+        try:
+            alarms, last_key = alarm_history.firing_page(table, limit, start_key)
+        except ClientError as e:
+            if invalid_input(e):
+                return create_response(400, {"error": "Invalid cursor"})
+            if not index_missing(e):
+                raise
+            logger.warning(f"{alarm_history.FIRING_INDEX} unavailable: {str(e)}")
+            return create_response(503, {"error": "Firing alarms index is not available yet"})
+        return create_response(200, {
+            "alarms": [{
+                "alarm_name": alarm['AlarmName'],
+                "firing_since": alarm.get('StateChangeTime'),
+                "reason": alarm.get('Reason', '')
+            } for alarm in alarms],
+            "count": len(alarms),
+            "next_cursor": encode_cursor(last_key) if last_key else None
+        }, content_etag=True)
+    
+    try:
+        cache_key = ('firing_alarms', limit, cursor)
+        return cached_read(table, cache_key, load, versioned=False)
+    except Exception as e:
+        logger.error(f"Error listing firing alarms: {str(e)}")
+        return create_response(500, {"error": "Failed to list firing alarms"})
+
+def encode_search_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode('utf-8')).decode('ascii')
+
+def decode_search_cursor(cursor: str) -> int:
+    """Offset into the ranked results from a search pagination token"""
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['offset']
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+def search_websites(query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Ranked, paginated search over website names and hostnames"""
+    query_parameters = query_parameters or {}
+    query = search_index.normalize_text(query_parameters.get('q') or '')
+    try:
+        if len(query) < search_index.MIN_QUERY_LENGTH:
+            raise ValueError(f"q must be at least {search_index.MIN_QUERY_LENGTH} characters")
+        limit = parse_limit(query_parameters.get('limit'))
+        cursor = query_parameters.get('cursor')
+        offset = decode_search_cursor(cursor) if cursor else 0
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    
+    search_table = get_search_table()
+    if search_table is None:
+        return create_response(503, {"error": "Search is not configured"})
+    
+    try:
+        table = get_table()
+        cache_key = ('search', query, limit, offset)
+        return cached_read(table, cache_key, lambda: search_page(table, search_table, query, limit, offset))
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    except ClientError as e:
+        if not index_missing(e):
+            logger.error(f"Error searching websites: {str(e)}")
+            return create_response(500, {"error": "Failed to search websites"})
+        logger.error(f"{search_index.TRIGRAM_INDEX} unavailable: {str(e)}")
+        return create_response(503, {"error": "Search index is not available"})
+    except Exception as e:
+        logger.error(f"Error searching websites: {str(e)}")
+        return create_response(500, {"error": "Failed to search websites"})
+
+def search_page(table, search_table, query: str, limit: int, offset: int) -> Dict[str, Any]:
+    """Rank every match from the trigram index, then fetch one page of websites"""
+    ranked = search_index.rank_websites(query, lambda: get_thread_table(search_table.name))
+    page = ranked[offset:offset + limit]
+    
+    websites = {}
+    if page:
+        names = {f"#f{i}": field for i, field in enumerate(PUBLIC_FIELDS)}
+        request = {table.name: {
+            'Keys': [{'id': website_id} for website_id, _ in page],
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names
+        }}
+        while request:
+            response = table.meta.client.batch_get_item(RequestItems=request)
+            for website in response['Responses'].get(table.name, []):
+                websites[website['id']] = website
+            request = response.get('UnprocessedKeys')
+    
+    # Postings of a website deleted mid-flight may briefly outlive it
+    results = [dict(websites[website_id], score=round(score, 3))
+               for website_id, score in page if website_id in websites]
+    next_offset = offset + limit
+    
+    return create_response(200, {
+        "websites": results,
+        "count": len(results),
+        "total": len(ranked),
+        "next_cursor": encode_search_cursor(next_offset) if next_offset < len(ranked) else None
+    }, content_etag=True)
+
+def export_websites_response(query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Export every website as NDJSON or CSV using a parallel scan"""
+    query_parameters = query_parameters or {}
+    fmt = query_parameters.get('format') or 'ndjson'
+    try:
+        segments = int(query_parameters.get('segments') or DEFAULT_SEGMENTS)
+    except ValueError:
+        return create_response(400, {"error": "segments must be an integer"})
+    
+    out = io.StringIO()
+    try:
+        count = export_websites(get_table().name, out, fmt, segments, max_chars=EXPORT_MAX_CHARS)
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    except ExportTooLarge:
+        return create_response(413, {"error": "Export too large for an API response; use bulk_export.py instead"})
+    except Exception as e:
+        logger.error(f"Error exporting websites: {str(e)}")
+        return create_response(500, {"error": "Failed to export websites"})
+    
+    logger.info(f"Exported {count} websites as {fmt}")
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': EXPORT_CONTENT_TYPES[fmt], 'X-Export-Count': str(count), **CORS_HEADERS},
+        'body': out.getvalue()
+    }
+
+def parse_metrics_window(query_parameters: Dict[str, str]) -> Tuple[int, int]:
+    """Validate ?period= (seconds) and ?range= (e.g. 90m, 3h, 7d), returning both in seconds"""
+    try:
+        period = int(query_parameters.get('period') or DEFAULT_METRICS_PERIOD)
+    except ValueError:
+        raise ValueError("period must be an integer number of seconds")
+    if period < 60 or period > 86400 or period % 60:
+        raise ValueError("period must be a multiple of 60 between 60 and 86400")
+    
+    match = re.fullmatch(r'(\d+)([mhd])', query_parameters.get('range') or DEFAULT_METRICS_RANGE)
+    if not match:
+        raise ValueError("range must look like 90m, 3h or 7d")
+    range_seconds = int(match.group(1)) * RANGE_UNITS[match.group(2)]
+    if range_seconds < period or range_seconds > MAX_METRICS_RANGE_SECONDS:
+        raise ValueError("range must be at least one period and at most 15d")
+    if range_seconds // period > MAX_METRICS_DATAPOINTS:
+        raise ValueError(f"range/period must not exceed {MAX_METRICS_DATAPOINTS} datapoints")
+    return period, range_seconds
+
+def metric_queries(url: str, prefix: str, period: int) -> List[Dict[str, Any]]:
+    """GetMetricData queries for one target, ids prefixed so batches can mix targets"""
+    dimensions = [{'Name': 'URL', 'Value': url}]
+    return [{
+        'Id': f'{prefix}_{key}',
+        'MetricStat': {
+            'Metric': {'Namespace': NAMESPACE, 'MetricName': metric_name, 'Dimensions': dimensions},
+            'Period': period,
+            'Stat': 'Average'
+        },
+        'ReturnData': True
+    } for key, metric_name in METRIC_SERIES]
+
+def get_metric_data_batched(queries: List[Dict[str, Any]], start: datetime,
+                            end: datetime) -> Dict[str, Dict[str, List[Any]]]:
+    """Run any number of metric queries, METRIC_QUERIES_PER_CALL per GetMetricData call"""
+    series = {}
+    for offset in range(0, len(queries), METRIC_QUERIES_PER_CALL):
+        params = {
+            'MetricDataQueries': queries[offset:offset + METRIC_QUERIES_PER_CALL],
+            'StartTime': start,
+            'EndTime': end,
+            'ScanBy': 'TimestampAscending'
+        }
+        while True:
+            response = cloudwatch.get_metric_data(**params)
+            for result in response['MetricDataResults']:
+                points = series.setdefault(result['Id'], {'timestamps': [], 'values': []})
+                points['timestamps'].extend(ts.isoformat() for ts in result['Timestamps'])
+                points['values'].extend(result['Values'])
+            if not response.get('NextToken'):
+                break
+            params['NextToken'] = response['NextToken']
+    return series
+
+def load_target_metrics(websites: List[Dict[str, Any]], period: int, range_seconds: int) -> List[Dict[str, Any]]:
+    """Metrics for each website, served from metrics_cache where possible"""
+    results = {}
+    missing = []
+    for website in websites:
+        cached = metrics_cache.get((website['url'], period, range_seconds))
+        if cached is not None:
+            results[website['id']] = cached
+        else:
+            missing.append(website)
+    
+    if missing:
+        # Align the window to the period so concurrent requests share datapoints
+        end_epoch = (int(time.time()) // period + 1) * period
+        end = datetime.fromtimestamp(end_epoch, tz=timezone.utc)
+        start = datetime.fromtimestamp(end_epoch - range_seconds, tz=timezone.utc)
+        queries = []
+        for i, website in enumerate(missing):
+            queries.extend(metric_queries(website['url'], f'm{i}', period))
+        series = get_metric_data_batched(queries, start, end)
+        
+        empty = {'timestamps': [], 'values': []}
+        for i, website in enumerate(missing):
+            metrics = {key: series.get(f'm{i}_{key}', empty) for key, _ in METRIC_SERIES}
+            metrics_cache.put((website['url'], period, range_seconds), metrics)
+            results[website['id']] = metrics
+    
+    return [{"website_id": website['id'], "url": website['url'], "metrics": results[website['id']]}
+            for website in websites]
+
+def get_website_metrics(website_id: str, query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Recent availability, latency and response size datapoints for one website"""
+    try:
+        period, range_seconds = parse_metrics_window(query_parameters or {})
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    
+    try:
+        website = get_table().get_item(Key={'id': website_id}, ProjectionExpression='id, #url, record_type',
+                                       ExpressionAttributeNames={'#url': 'url'}).get('Item')
+        if not website or not is_website(website) or 'url' not in website:
+            return create_response(404, {"error": "Website not found"})
+        
+        target = load_target_metrics([website], period, range_seconds)[0]
+        return create_response(200, {"period": period, "range_seconds": range_seconds, **target})
+        
+    except Exception as e:
+        logger.error(f"Error getting metrics for website {website_id}: {str(e)}")
+        return create_response(500, {"error": "Failed to get website metrics"})
+
+def get_websites_metrics(query_parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Metrics for many websites (?ids=a,b,c) with as few GetMetricData calls as possible"""
+    query_parameters = query_parameters or {}
+    try:
+        period, range_seconds = parse_metrics_window(query_parameters)
+        website_ids = list(dict.fromkeys(i.strip() for i in (query_parameters.get('ids') or '').split(',') if i.strip()))
+        if not website_ids:
+            raise ValueError("ids is required")
+        if len(website_ids) > MAX_METRICS_TARGETS:
+            raise ValueError(f"At most {MAX_METRICS_TARGETS} ids per request")
+    except ValueError as e:
+        return create_response(400, {"error": str(e)})
+    
+    try:
+        table = get_table()
+        found = {}
+        request = {table.name: {
+            'Keys': [{'id': website_id} for website_id in website_ids],
+            'ProjectionExpression': 'id, #url, record_type',
+            'ExpressionAttributeNames': {'#url': 'url'}
+        }}
+        while request:
+            response = table.meta.client.batch_get_item(RequestItems=request)
+            for website in response['Responses'].get(table.name, []):
+                if is_website(website) and 'url' in website:
+                    found[website['id']] = website
+            request = response.get('UnprocessedKeys')
+        
+        websites = [found[website_id] for website_id in website_ids if website_id in found]
+        return create_response(200, {
+            "period": period,
+            "range_seconds": range_seconds,
+            "websites": load_target_metrics(websites, period, range_seconds),
+            "not_found": [website_id for website_id in website_ids if website_id not in found]
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting metrics for websites: {str(e)}")
+        return create_response(500, {"error": "Failed to get website metrics"})
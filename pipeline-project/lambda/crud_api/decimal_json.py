@@ -0,0 +1,26 @@
+"""
+decimal_json.py - Single-pass JSON encoding for DynamoDB items
+
+boto3 returns numbers as Decimal, which json.dumps cannot serialize. Instead
+of copying every item into plain numbers first, the encoder converts each
+Decimal as it is written: integral values stay integers, the rest become
+floats. Sets (DynamoDB SS/NS attributes) are written as lists.
+"""
+import json
+from decimal import Decimal
+from typing import Any
+
+
+def encode_default(value: Any) -> Any:
+    """json.dumps fallback for the types DynamoDB returns"""
+    if isinstance(value, Decimal):
+        integer = int(value)
+        return integer if integer == value else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> str:
+    """Serialize obj to JSON in one pass, converting Decimals on the fly"""
+    return json.dumps(obj, default=encode_default)
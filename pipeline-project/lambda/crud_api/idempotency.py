@@ -0,0 +1,109 @@
+"""
+idempotency.py - Idempotency-Key records for retried POST requests
+
+The first request with a key claims a record in the idempotency table before
+running the write; the response is stored on the record when it completes.
+A retry with the same key and body gets the stored response back instead of
+writing again. Records expire through the table's TTL attribute (DynamoDB
+deletes them lazily, so expiry is also checked in the claim condition).
+"""
+import time
+from typing import Any, Dict, Optional
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+# A claim older than this belongs to an invocation that died (Lambda timeout is 30s)
+IN_PROGRESS_SECONDS = 60
+MAX_KEY_LENGTH = 255
+# Leave room for the other attributes under DynamoDB's 400 KB item limit
+MAX_STORED_BODY_BYTES = 350 * 1024
+
+_deserializer = TypeDeserializer()
+
+
+class IdempotencyError(Exception):
+    """A key that cannot be used for this request right now"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def validate_key(key: str) -> None:
+    if not 0 < len(key) <= MAX_KEY_LENGTH or not key.isprintable():
+        raise ValueError(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} printable characters")
+
+
+def claim(table, record_key: str, fingerprint: str, ttl_seconds: int) -> Optional[Dict[str, Any]]:
+    """
+    Claim record_key for this request. Returns None when the caller should run
+    the request, or the stored response of an earlier completed request.
+    """
+    now = int(time.time())
+    try:
+        table.put_item(
+            Item={
+                'idempotency_key': record_key,
+                'state': IN_PROGRESS,
+                'fingerprint': fingerprint,
+                'locked_until': now + IN_PROGRESS_SECONDS,
+                'expires_at': now + ttl_seconds
+            },
+            ConditionExpression=('attribute_not_exists(idempotency_key) OR expires_at < :now '
+                                 'OR (#state = :in_progress AND locked_until < :now)'),
+            ExpressionAttributeNames={'#state': 'state'},
+            ExpressionAttributeValues={':now': now, ':in_progress': IN_PROGRESS},
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # Error responses are not deserialized by the resource layer
+        existing = {k: _deserializer.deserialize(v) for k, v in (e.response.get('Item') or {}).items()}
+
+    if existing.get('fingerprint') != fingerprint:
+        raise IdempotencyError(422, "Idempotency-Key was already used with a different request body")
+    if existing.get('state') != COMPLETED:
+        raise IdempotencyError(409, "A request with this Idempotency-Key is still in progress")
+    return stored_response(existing)
+
+
+def stored_response(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': int(record['status_code']),
+        'headers': dict(record.get('headers', {})),
+        'body': record.get('body', '')
+    }
+
+
+def complete(table, record_key: str, response: Dict[str, Any]) -> bool:
+    """
+    Store the response on a claimed record. Returns False when the response is
+    not kept (server errors and oversized bodies), in which case the claim is
+    released so a retry runs the request again.
+    """
+    if response['statusCode'] >= 500 or len(response['body'].encode('utf-8')) > MAX_STORED_BODY_BYTES:
+        release(table, record_key)
+        return False
+    table.update_item(
+        Key={'idempotency_key': record_key},
+        UpdateExpression='SET #state = :completed, status_code = :status_code, headers = :headers, body = :body',
+        ExpressionAttributeNames={'#state': 'state'},
+        ExpressionAttributeValues={
+            ':completed': COMPLETED,
+            ':status_code': response['statusCode'],
+            ':headers': response['headers'],
+            ':body': response['body']
+        }
+    )
+    return True
+
+
+def release(table, record_key: str) -> None:
+    table.delete_item(Key={'idempotency_key': record_key})
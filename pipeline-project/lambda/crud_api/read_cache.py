@@ -0,0 +1,56 @@
+"""
+read_cache.py - Bounded LRU cache with per-entry TTL
+
+Lives in module scope of the Lambda so warm containers can answer repeated
+reads without going back to DynamoDB. Hit and miss counts are kept so the
+handler can publish them and the TTL can be tuned.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Least-recently-used cache whose entries expire after ttl_seconds"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None when missing or expired"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if self.clock() < expires_at:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        self.entries[key] = (self.clock() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def take_stats(self) -> Tuple[int, int]:
+        """Return (hits, misses) since the last call and reset the counters"""
+        stats = (self.hits, self.misses)
+        self.hits = 0
+        self.misses = 0
+        return stats
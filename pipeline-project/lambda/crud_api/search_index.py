@@ -0,0 +1,154 @@
+"""
+search_index.py - Trigram inverted index over website names and hostnames
+
+Every website owns a search document item holding the text it was indexed
+under, and one posting item per trigram of that text, all in the search index
+table (SEARCH_INDEX_TABLE) rather than the websites table. Postings are read
+through the trigram-index GSI (trigram -> website_id) with one Query per query
+trigram, whose cost grows with the number of websites sharing that trigram.
+Trigrams nearly every hostname has (www, com, ...) are never posted, and a
+trigram with more than MAX_TRIGRAM_POSTINGS postings is skipped as too common,
+so a search reads at most MAX_QUERY_TRIGRAMS * (MAX_TRIGRAM_POSTINGS + 1) keys.
+"""
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from boto3.dynamodb.conditions import Key
+
+TRIGRAM_INDEX = 'trigram-index'
+SEARCH_DOC_PREFIX = 'SEARCH#'
+POSTING_PREFIX = 'TRIGRAM#'
+SEARCH_DOC_RECORD_TYPE = 'search_doc'
+POSTING_RECORD_TYPE = 'trigram'
+
+MIN_QUERY_LENGTH = 3
+# Longer queries are answered from an even sample of their trigrams
+MAX_QUERY_TRIGRAMS = 12
+# Fraction of the query trigrams a website must contain to be returned
+MIN_SCORE = 0.5
+SEARCH_WORKERS = 4
+# A trigram posted for more websites than this does not narrow a search down
+MAX_TRIGRAM_POSTINGS = 1000
+# Pieces of "www." and common TLDs that would be posted for almost every website
+STOP_TRIGRAMS = frozenset({'www', 'ww.', '.co', 'com', '.or', 'org', '.ne', 'net'})
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigrams a text is posted and searched under (stop trigrams left out)"""
+    text = normalize_text(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)} - STOP_TRIGRAMS
+
+
+def search_text(website: Dict[str, Any]) -> str:
+    """The text a website is found by: its name and the hostname of its URL"""
+    hostname = urllib.parse.urlsplit(website.get('url') or '').hostname or ''
+    return normalize_text(f"{website.get('name') or ''} {hostname}")
+
+
+def search_doc_id(website_id: str) -> str:
+    return f'{SEARCH_DOC_PREFIX}{website_id}'
+
+
+def posting_item(trigram: str, website_id: str) -> Dict[str, Any]:
+    return {
+        'id': f'{POSTING_PREFIX}{trigram}#{website_id}',
+        'record_type': POSTING_RECORD_TYPE,
+        'trigram': trigram,
+        'website_id': website_id
+    }
+
+
+def new_website_items(website: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Search document and postings for a website that has never been indexed"""
+    text = search_text(website)
+    yield {'id': search_doc_id(website['id']), 'record_type': SEARCH_DOC_RECORD_TYPE,
+           'website_id': website['id'], 'text': text}
+    for trigram in trigrams(text):
+        yield posting_item(trigram, website['id'])
+
+
+def write_postings(table, website_id: str, old_text: str, new_text: str) -> None:
+    """Apply the posting difference between two versions of a website's text"""
+    old, new = trigrams(old_text), trigrams(new_text)
+    with table.batch_writer() as batch:
+        for trigram in new - old:
+            batch.put_item(Item=posting_item(trigram, website_id))
+        for trigram in old - new:
+            batch.delete_item(Key={'id': posting_item(trigram, website_id)['id']})
+
+
+def index_website(table, website: Dict[str, Any]) -> None:
+    """Re-index a website after its name or URL changed"""
+    text = search_text(website)
+    # Swapping the search document returns the text the postings were built from
+    previous = table.put_item(
+        Item={'id': search_doc_id(website['id']), 'record_type': SEARCH_DOC_RECORD_TYPE,
+              'website_id': website['id'], 'text': text},
+        ReturnValues='ALL_OLD'
+    ).get('Attributes', {})
+    write_postings(table, website['id'], previous.get('text', ''), text)
+
+
+def unindex_website(table, website_id: str) -> None:
+    """Remove a deleted website's search document and postings"""
+    previous = table.delete_item(
+        Key={'id': search_doc_id(website_id)},
+        ReturnValues='ALL_OLD'
+    ).get('Attributes', {})
+    write_postings(table, website_id, previous.get('text', ''), '')
+
+
+def query_trigrams(query: str) -> List[str]:
+    """Trigrams looked up for a search query"""
+    grams = sorted(trigrams(query))
+    if len(grams) > MAX_QUERY_TRIGRAMS:
+        step = (len(grams) - 1) / (MAX_QUERY_TRIGRAMS - 1)
+        grams = [grams[round(i * step)] for i in range(MAX_QUERY_TRIGRAMS)]
+    return grams
+
+
+def posting_website_ids(table, trigram: str) -> Optional[List[str]]:
+    """Every website id posted under one trigram, or None if there are more than MAX_TRIGRAM_POSTINGS"""
+    params = {
+        'IndexName': TRIGRAM_INDEX,
+        'KeyConditionExpression': Key('trigram').eq(trigram),
+        'ProjectionExpression': 'website_id',
+        'Limit': MAX_TRIGRAM_POSTINGS + 1
+    }
+    website_ids = []
+    while True:
+        response = table.query(**params)
+        website_ids.extend(item['website_id'] for item in response.get('Items', []))
+        if len(website_ids) > MAX_TRIGRAM_POSTINGS:
+            return None
+        if 'LastEvaluatedKey' not in response:
+            return website_ids
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        params['Limit'] = MAX_TRIGRAM_POSTINGS + 1 - len(website_ids)
+
+
+def rank_websites(query: str, table_for_thread: Callable[[], Any]) -> List[Tuple[str, float]]:
+    """
+    (website_id, score) for every website matching the query, best first.
+    The score is the fraction of the query's selective trigrams found in the
+    website's text; ties are broken by id so pages stay stable. Raises
+    ValueError when the query has no trigram selective enough to search by.
+    """
+    grams = query_trigrams(query)
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        postings = [website_ids for website_ids in
+                    executor.map(lambda gram: posting_website_ids(table_for_thread(), gram), grams)
+                    if website_ids is not None]
+    if not postings:
+        raise ValueError("q is too common to search by; add more characters")
+    counts = Counter(website_id for website_ids in postings for website_id in website_ids)
+    ranked = [(website_id, count / len(postings)) for website_id, count in counts.items()
+              if count / len(postings) >= MIN_SCORE]
+    ranked.sort(key=lambda match: (-match[1], match[0]))
+    return ranked
@@ -5,12 +5,293 @@ import time
 import json
 import os
 import logging
-from boto3.dynamodb.conditions import Attr
+from collections import namedtuple
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from boto3.dynamodb.conditions import Attr, Key
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Error codes recorded per probe
+PROBE_OK = 0
+PROBE_HTTP_ERROR = 1
+PROBE_URL_ERROR = 2
+PROBE_UNEXPECTED_ERROR = 3
+
+# Last-known-status view: one record per target in a single partition of the
+# status table, so the whole fleet is read back with one paginated Query
+STATUS_PARTITION = "all"
+# Per-status fleet counts, read by GET /websites/stats (outside the view's partition)
+SUMMARY_PARTITION = "stats"
+# Unchanged records are still rewritten this often so checked_at stays fresh
+DEFAULT_STATUS_REFRESH_SECONDS = 900
+# Latency moves every probe; smaller changes than this do not count as a change
+LATENCY_CHANGE_MS = 50
+LATENCY_CHANGE_RATIO = 0.2
+# PutMetricData accepts up to 1000 datums and a 1 MB request per call
+METRIC_DATA_BATCH = 1000
+METRIC_DATA_MAX_BYTES = 900 * 1024
+# Rough encoded size of one datum besides its URL, which percent-encodes to up to 3 bytes per character
+METRIC_DATUM_OVERHEAD_BYTES = 200
+
+
+class Probe(namedtuple("Probe", "url status latency_ms size error")):
+    """Outcome of checking one URL. status is 0 when there was no response."""
+
+    __slots__ = ()
+
+    @property
+    def available(self):
+        """1 when the probe got an HTTP 200, otherwise 0"""
+        return 1 if self.status == 200 else 0
+
+    @property
+    def failed(self):
+        return self.error != PROBE_OK
+
+
+def probe(url):
+    """Check a single URL and return its Probe"""
+    start = time.time()
+    try:
+        # Use urllib instead of requests to avoid external dependencies
+        with urllib.request.urlopen(url, timeout=5) as response:
+            latency_ms = (time.time() - start) * 1000.0
+            size = len(response.read())
+            logger.info(f"Successfully checked {url}: {response.status}, {latency_ms:.2f}ms")
+            return Probe(url, response.status, latency_ms, size, PROBE_OK)
+    except urllib.error.HTTPError as e:
+        # HTTP errors (4xx, 5xx) - log but don't fail
+        latency_ms = (time.time() - start) * 1000.0
+        logger.warning(f"HTTP error for {url}: {e.code} - {e.reason}")
+        return Probe(url, e.code, latency_ms, 0, PROBE_HTTP_ERROR)
+    except urllib.error.URLError as e:
+        # Network errors - log but don't fail
+        logger.warning(f"URL error for {url}: {e.reason}")
+        return Probe(url, 0, 0, 0, PROBE_URL_ERROR)
+    except Exception as e:
+        # Other errors - log but don't fail
+        logger.error(f"Unexpected error for {url}: {str(e)}")
+        return Probe(url, 0, 0, 0, PROBE_UNEXPECTED_ERROR)
+
+
+def metric_data(result, availability_metric, latency_metric, response_size_metric):
+    """Build the CloudWatch MetricData payload for a single probe"""
+    dimensions = [{"Name": "URL", "Value": result.url}]
+    return [
+        {"MetricName": availability_metric, "Dimensions": dimensions, "Value": result.available},
+        {"MetricName": latency_metric, "Dimensions": dimensions, "Value": result.latency_ms},
+        {"MetricName": response_size_metric, "Dimensions": dimensions, "Value": result.size},
+    ]
+
+
+class MetricPublisher:
+    """
+    Publishes probe metrics while the run is still probing.
+
+    Datums are buffered only until the next probe would overflow one
+    PutMetricData call, then sent, so the run holds at most one call's
+    payload however many targets it checks.
+    """
+
+    def __init__(self, cw, namespace, availability_metric, latency_metric, response_size_metric):
+        self.cw = cw
+        self.namespace = namespace
+        self.metric_names = (availability_metric, latency_metric, response_size_metric)
+        self.batch = []
+        self.batch_bytes = 0
+
+    def add(self, result):
+        data = metric_data(result, *self.metric_names)
+        data_bytes = len(data) * (3 * len(result.url) + METRIC_DATUM_OVERHEAD_BYTES)
+        if self.batch and (len(self.batch) + len(data) > METRIC_DATA_BATCH
+                           or self.batch_bytes + data_bytes > METRIC_DATA_MAX_BYTES):
+            self.flush()
+        self.batch.extend(data)
+        self.batch_bytes += data_bytes
+
+    def flush(self):
+        """Send whatever is buffered in one PutMetricData call"""
+        if not self.batch:
+            return
+        try:
+            self.cw.put_metric_data(Namespace=self.namespace, MetricData=self.batch)
+        except Exception as e:
+            logger.error(f"Failed to put metric data for {len(self.batch) // 3} URLs: {str(e)}")
+            # Don't fail the entire function for metric publishing errors
+        self.batch = []
+        self.batch_bytes = 0
+
+
+def load_status_view(status_table):
+    """Previous last-status records keyed by website id"""
+    records = {}
+    params = {"KeyConditionExpression": Key("fleet").eq(STATUS_PARTITION)}
+    while True:
+        response = status_table.query(**params)
+        for item in response.get("Items", []):
+            records[item["website_id"]] = item
+        if "LastEvaluatedKey" not in response:
+            return records
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+# Order of a status record's fields in StatusCache's compact tuples
+STATUS_FIELDS = ("url", "status", "error", "size", "consecutive_failures", "latency_ms", "checked_at")
+
+
+def compact_status(record):
+    """The fields status_changed compares, as a tuple in STATUS_FIELDS order"""
+    return (record["url"], int(record["status"]), int(record["error"]), int(record["size"]),
+            int(record["consecutive_failures"]), int(record["latency_ms"]), record["checked_at"])
+
+
+class StatusCache:
+    """
+    The last status records this container wrote, keyed by website id.
+
+    Loaded from the table on a cold start and kept in step with every write,
+    so warm runs decide what changed without reading the view's partition.
+    If another container writes the same view, this copy can lag behind it
+    for at most one refresh interval, since unchanged records are rewritten
+    that often anyway.
+    """
+
+    def __init__(self):
+        self.table_name = None
+        self.records = None
+
+    def take(self, status_table):
+        """Hand the cached records to a run, loading them first on a cold start"""
+        records, self.records = self.records, None
+        if records is None or self.table_name != status_table.name:
+            records = {website_id: compact_status(item) for website_id, item in load_status_view(status_table).items()}
+        return records
+
+    def keep(self, status_table, records):
+        """Keep what a run left in the view for the next warm run"""
+        self.table_name = status_table.name
+        self.records = records
+
+
+status_cache = StatusCache()
+
+
+def status_record(website_id, result, previous, checked_at):
+    """Compact last-status record for one probe"""
+    failures = int(previous.get("consecutive_failures", 0)) + 1 if result.failed and previous else int(result.failed)
+    return {
+        "fleet": STATUS_PARTITION,
+        "website_id": website_id,
+        "url": result.url,
+        "status": result.status,
+        "error": result.error,
+        "available": result.available,
+        # DynamoDB numbers cannot be floats; whole milliseconds are plenty
+        "latency_ms": int(round(result.latency_ms)),
+        "size": result.size,
+        "checked_at": checked_at.isoformat(),
+        "consecutive_failures": failures,
+    }
+
+
+def status_changed(previous, record, now, refresh_seconds):
+    """Whether a record is worth writing over the previous one"""
+    if not previous:
+        return True
+    for field in ("url", "status", "error", "size", "consecutive_failures"):
+        if previous.get(field) != record[field]:
+            return True
+    old_latency = int(previous.get("latency_ms", 0))
+    if abs(record["latency_ms"] - old_latency) > max(LATENCY_CHANGE_MS, LATENCY_CHANGE_RATIO * old_latency):
+        return True
+    last_checked = datetime.fromisoformat(previous["checked_at"])
+    return (now - last_checked).total_seconds() >= refresh_seconds
+
+
+class StatusView:
+    """
+    Writes the last-status view as probes finish.
+
+    Use as a context manager around the probe loop: each record() goes
+    straight to a DynamoDB batch writer, skipping records that have not
+    meaningfully changed, and leaving the block drops records of targets
+    no longer probed. Previous records come from status_cache, so only a
+    cold start reads the view back. Only running counts are kept for the
+    fleet summary. Write errors are logged and stop further view writes;
+    they never fail the crawl, and the next run reloads from the table.
+    """
+
+    def __init__(self, status_table, refresh_seconds=DEFAULT_STATUS_REFRESH_SECONDS):
+        self.table = status_table
+        self.refresh_seconds = refresh_seconds
+        self.previous = status_cache.take(status_table)
+        # What the view holds after this run, handed back to status_cache on a clean exit
+        self.records = {}
+        self.now = datetime.now(timezone.utc)
+        self.writer = self.batch = None
+        self.written = self.skipped = self.removed = 0
+        self.up = self.down = 0
+        self.status_codes = {}
+
+    def __enter__(self):
+        self.writer = self.table.batch_writer()
+        self.batch = self.writer.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and self.batch is not None:
+                for website_id in self.previous:
+                    self.batch.delete_item(Key={"fleet": STATUS_PARTITION, "website_id": website_id})
+                self.removed = len(self.previous)
+            self.writer.__exit__(exc_type, exc, tb)
+            if exc_type is None and self.batch is not None:
+                status_cache.keep(self.table, self.records)
+        except Exception as e:
+            logger.error(f"Failed to update status view: {str(e)}")
+        return False
+
+    def record(self, website_id, result):
+        """Count one probe for the summary and write its status record if it changed"""
+        if result.available:
+            self.up += 1
+        else:
+            self.down += 1
+        code = str(result.status)
+        self.status_codes[code] = self.status_codes.get(code, 0) + 1
+        if self.batch is None:
+            return
+        cached = self.previous.pop(website_id, None)
+        old = dict(zip(STATUS_FIELDS, cached)) if cached else None
+        item = status_record(website_id, result, old, self.now)
+        if not status_changed(old, item, self.now, self.refresh_seconds):
+            self.records[website_id] = cached
+            self.skipped += 1
+            return
+        try:
+            self.batch.put_item(Item=item)
+            self.records[website_id] = compact_status(item)
+            self.written += 1
+        except Exception as e:
+            logger.error(f"Failed to update status view: {str(e)}")
+            self.batch = None
+
+    def write_summary(self):
+        """Overwrite the fleet's per-status counts for this run in one PutItem"""
+        self.table.put_item(Item={
+            "fleet": SUMMARY_PARTITION,
+            "website_id": STATUS_PARTITION,
+            "up": self.up,
+            "down": self.down,
+            "status_codes": self.status_codes,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+        })
+        return self.up, self.down
+
+
 def lambda_handler(event, context):
     # Website monitoring Lambda function using built-in libraries
     cw = boto3.client("cloudwatch")
@@ -33,81 +314,60 @@ def lambda_handler(event, context):
     logger.info(f"Starting website monitoring")
     
     try:
-        # Get enabled websites from DynamoDB
-        response = table.scan(
-            FilterExpression=Attr('enabled').eq(True)
-        )
-        urls = [item['url'] for item in response.get('Items', [])]
+        # Get enabled websites from DynamoDB (every page, so the status view sees every target)
+        # Only (id, url) pairs are kept, not the full items
+        scan_params = {"FilterExpression": Attr('enabled').eq(True)}
+        targets = []
+        while True:
+            response = table.scan(**scan_params)
+            targets.extend((item.get('id'), item['url']) for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
         
-        if not urls:
+        if not targets:
             logger.warning("No enabled websites found in target list")
             return {"statusCode": 200, "body": "No websites to monitor"}
         
-        logger.info(f"Found {len(urls)} enabled websites to monitor")
+        logger.info(f"Found {len(targets)} enabled websites to monitor")
         
     except Exception as e:
         logger.error(f"Error reading from DynamoDB: {str(e)}")
         return {"statusCode": 500, "body": "Database error"}
     
-    successful_checks = 0
-    failed_checks = 0
-
-    for url in urls:
-        start = time.time()
+    view = None
+    status_table_name = os.environ.get("TARGET_STATUS_TABLE")
+    if status_table_name:
         try:
-            # Use urllib instead of requests to avoid external dependencies
-            with urllib.request.urlopen(url, timeout=5) as response:
-                latency_ms = (time.time() - start) * 1000.0
-                availability = 1 if response.status == 200 else 0
-                size = len(response.read())
-                successful_checks += 1
-                logger.info(f"Successfully checked {url}: {response.status}, {latency_ms:.2f}ms")
-        except urllib.error.HTTPError as e:
-            # HTTP errors (4xx, 5xx) - log but don't fail
-            latency_ms = (time.time() - start) * 1000.0
-            availability = 0
-            size = 0
-            failed_checks += 1
-            logger.warning(f"HTTP error for {url}: {e.code} - {e.reason}")
-        except urllib.error.URLError as e:
-            # Network errors - log but don't fail
-            latency_ms = 0
-            availability = 0
-            size = 0
-            failed_checks += 1
-            logger.warning(f"URL error for {url}: {e.reason}")
+            refresh_seconds = int(os.environ.get("STATUS_REFRESH_SECONDS", DEFAULT_STATUS_REFRESH_SECONDS))
+            view = StatusView(dynamodb.Table(status_table_name), refresh_seconds)
         except Exception as e:
-            # Other errors - log but don't fail
-            latency_ms = 0
-            availability = 0
-            size = 0
-            failed_checks += 1
-            logger.error(f"Unexpected error for {url}: {str(e)}")
+            # The view is a convenience - never fail the crawl over it
+            logger.error(f"Failed to load status view: {str(e)}")
 
+    # Each probe is published and written to the view as soon as it finishes,
+    # so nothing per target is held until the end of the run
+    metrics = MetricPublisher(cw, namespace, availability_metric, latency_metric, response_size_metric)
+    successful_checks = failed_checks = 0
+    with view if view else nullcontext():
+        for website_id, url in targets:
+            result = probe(url)
+            metrics.add(result)
+            if view and website_id:
+                view.record(website_id, result)
+            if result.failed:
+                failed_checks += 1
+            else:
+                successful_checks += 1
+    metrics.flush()
+
+    if view:
         try:
-            cw.put_metric_data(
-                Namespace=namespace,
-                MetricData=[
-                    {
-                        "MetricName": availability_metric,
-                        "Dimensions": [{"Name": "URL", "Value": url}],
-                        "Value": availability,
-                    },
-                    {
-                        "MetricName": latency_metric,
-                        "Dimensions": [{"Name": "URL", "Value": url}],
-                        "Value": latency_ms,
-                    },
-                    {
-                        "MetricName": response_size_metric,
-                        "Dimensions": [{"Name": "URL", "Value": url}],
-                        "Value": size,
-                    },
-                ],
-            )
+            up, down = view.write_summary()
+            logger.info(f"Status view: {view.written} written, {view.skipped} unchanged, {view.removed} removed; "
+                        f"{up} up, {down} down")
         except Exception as e:
-            logger.error(f"Failed to put metric data for {url}: {str(e)}")
-            # Don't fail the entire function for metric publishing errors
+            logger.error(f"Failed to update status summary: {str(e)}")
 
     logger.info(f"Monitoring complete: {successful_checks} successful, {failed_checks} failed")
-    return {"statusCode": 200, "body": f"Checked {len(urls)} URLs: {successful_checks} successful, {failed_checks} failed"}
+    return {"statusCode": 200, "body": f"Checked {len(targets)} URLs: {successful_checks} successful, {failed_checks} failed"}
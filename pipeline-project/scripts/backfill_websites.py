@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+backfill_websites.py - One-shot backfill of websites written before the indexed schema
+
+Websites created by the original CRUD API have no record_type, enabled_key or
+url_key, no URL# guard and no search document. Without them they are missing
+from the created-at, enabled-key and name indexes (so GET /websites and the
+alarm reconciler do not see them), duplicates of their URLs go undetected and
+search never finds them. For every such website this script:
+
+- sets record_type, enabled_key, url_key (and created_at if it is missing)
+  with a condition that skips websites deleted in the meantime
+- writes the URL# guard of each normalized URL for its oldest website, and
+  lists the websites that duplicate an already registered URL
+- indexes the website for search when --search-table is given
+
+Every step is idempotent, so the script can be re-run at any time. Deploy
+order for an existing stack (see "Upgrading an Existing Stack" in README.md):
+run it once before pushing the new code, which deploys index stage 1; raise
+the stages in constants.py one commit and one deployment at a time; then run
+it again with --search-table once the last stage is deployed to pick up
+websites written in between. The alarm reconciler only sees
+websites with an enabled_key, so its first full sync must come after the
+first run.
+
+Usage:
+    python scripts/backfill_websites.py --table <websites table> [--search-table <search table>] [--dry-run]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'crud_api'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from botocore.exceptions import ClientError
+
+import crud_handler
+import search_index
+
+
+def scan_websites(table):
+    """Every website item, legacy ones included"""
+    params = {'FilterExpression': crud_handler.website_filter(), 'ConsistentRead': True}
+    while True:
+        response = table.scan(**params)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def missing_attributes(website):
+    """Index attributes a website lacks, with the values they should have"""
+    expected = {
+        'record_type': crud_handler.WEBSITE_RECORD_TYPE,
+        'enabled_key': crud_handler.enabled_key(website.get('enabled', True)),
+        'url_key': crud_handler.normalize_url(website['url']),
+    }
+    if not website.get('created_at'):
+        expected['created_at'] = website.get('updated_at') or datetime.utcnow().isoformat()
+    return {name: value for name, value in expected.items() if website.get(name) != value}
+
+
+def set_attributes(table, website_id, attributes):
+    """Set index attributes on a website; False if it was deleted or is not a website anymore"""
+    names = {f'#a{i}': name for i, name in enumerate(attributes)}
+    values = {f':a{i}': value for i, value in enumerate(attributes.values())}
+    try:
+        table.update_item(
+            Key={'id': website_id},
+            UpdateExpression='SET ' + ', '.join(f'#a{i} = :a{i}' for i in range(len(attributes))),
+            ConditionExpression=('attribute_exists(id) AND '
+                                 '(attribute_not_exists(record_type) OR record_type = :website_type)'),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={**values, ':website_type': crud_handler.WEBSITE_RECORD_TYPE}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def register_url(table, website, stale_owner=None):
+    """
+    Write the website's URL# guard unless the URL is taken (a guard of the
+    deleted stale_owner is taken over); returns the URL's owner
+    """
+    if stale_owner:
+        condition = {'ConditionExpression': 'website_id = :stale_owner',
+                     'ExpressionAttributeValues': {':stale_owner': stale_owner}}
+    else:
+        condition = {'ConditionExpression': 'attribute_not_exists(id)'}
+    try:
+        table.put_item(Item=crud_handler.url_guard_item(website), **condition)
+        return website['id']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    return table.get_item(Key={'id': crud_handler.url_guard_id(website['url_key'])},
+                          ConsistentRead=True)['Item']['website_id']
+
+
+def backfill(table, search_table=None, dry_run=False):
+    """Backfill every website of the table; returns counts and the duplicate URLs found"""
+    summary = {'websites': 0, 'updated': 0, 'invalid_url': [], 'guards': 0, 'indexed': 0, 'duplicates': {}}
+    websites = []
+    for website in scan_websites(table):
+        summary['websites'] += 1
+        try:
+            attributes = missing_attributes(website)
+        except (KeyError, ValueError):
+            summary['invalid_url'].append(website['id'])
+            continue
+        if attributes and not dry_run:
+            if not set_attributes(table, website['id'], attributes):
+                continue
+        summary['updated'] += bool(attributes)
+        websites.append({**website, **attributes})
+
+    # The oldest website keeps a URL several websites share; the others are only reported
+    websites.sort(key=lambda website: (website['created_at'], website['id']))
+    for website in websites:
+        if dry_run:
+            continue
+        guard_id = crud_handler.url_guard_id(website['url_key'])
+        existing = table.get_item(Key={'id': guard_id}, ConsistentRead=True).get('Item')
+        owner = existing['website_id'] if existing else None
+        if owner is None or (owner != website['id'] and
+                             'Item' not in table.get_item(Key={'id': owner}, ConsistentRead=True)):
+            owner = register_url(table, website, stale_owner=owner)
+            summary['guards'] += owner == website['id']
+        if owner != website['id']:
+            summary['duplicates'].setdefault(website['url_key'], [owner]).append(website['id'])
+        if search_table is not None:
+            search_index.index_website(search_table, website)
+            summary['indexed'] += 1
+
+    if summary['updated'] and not dry_run:
+        crud_handler.invalidate_read_cache(table)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--table", required=True, help="websites table (TARGET_WEBSITES_TABLE)")
+    parser.add_argument("--search-table", help="search index table (SEARCH_INDEX_TABLE)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+
+    table = crud_handler.dynamodb.Table(args.table)
+    search_table = crud_handler.dynamodb.Table(args.search_table) if args.search_table else None
+    summary = backfill(table, search_table, args.dry_run)
+
+    print(f"Websites: {summary['websites']}, missing index attributes: {summary['updated']}, "
+          f"URL guards written: {summary['guards']}, indexed for search: {summary['indexed']}")
+    for website_id in summary['invalid_url']:
+        print(f"Skipped {website_id}: its URL cannot be parsed")
+    for url_key, website_ids in summary['duplicates'].items():
+        print(f"Duplicate URL {url_key}: kept {website_ids[0]}, also registered as {', '.join(website_ids[1:])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import gzip
+import importlib.util
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import boto3
+import pytest
+from moto import mock_aws
+
+
+def load_alarm_archiver():
+    spec = importlib.util.spec_from_file_location(
+        "alarm_archiver",
+        os.path.join(os.path.dirname(__file__), '..', 'lambda', 'alarm_archiver', 'alarm_archiver.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def transition(alarm_name, state_change_time, state='ALARM'):
+    return {
+        'AlarmName': alarm_name,
+        'Timestamp': f'{state_change_time}#msg-{alarm_name}-{state_change_time}',
+        'StateChangeTime': state_change_time,
+        'TransitionDay': state_change_time[:10],
+        'State': state,
+        'MetricName': 'Latency',
+        'ExpiresAt': Decimal(1704067200)
+    }
+
+
+class TestAlarmArchiver:
+    """Test suite for the alarm history archival job"""
+
+    @pytest.fixture
+    def alarm_table(self):
+        with mock_aws():
+            dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+            table = dynamodb.create_table(
+                TableName='test-alarm-table',
+                KeySchema=[
+                    {'AttributeName': 'AlarmName', 'KeyType': 'HASH'},
+                    {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}
+                ],
+                AttributeDefinitions=[
+                    {'AttributeName': 'AlarmName', 'AttributeType': 'S'},
+                    {'AttributeName': 'Timestamp', 'AttributeType': 'S'},
+                    {'AttributeName': 'TransitionDay', 'AttributeType': 'S'}
+                ],
+                GlobalSecondaryIndexes=[{
+                    'IndexName': 'recent-transitions-index',
+                    'KeySchema': [
+                        {'AttributeName': 'TransitionDay', 'KeyType': 'HASH'},
+                        {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['State']}
+                }],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            yield table
+
+    def test_archives_expiring_days_and_reads_them_back(self, alarm_table, tmp_path):
+        """Test that expiring days become gzip NDJSON files once, and ranges stream back"""
+        archiver = load_alarm_archiver()
+        with alarm_table.batch_writer() as batch:
+            for day in ('2024-01-01', '2024-01-02'):
+                for hour in range(3):
+                    batch.put_item(Item=transition(f'site-{hour}-latency', f'{day}T0{hour}:00:00+00:00'))
+            # The current-state item has no TransitionDay and is never archived
+            batch.put_item(Item={'AlarmName': 'site-0-latency', 'Timestamp': 'CURRENT', 'State': 'ALARM'})
+            # Too recent to expire yet
+            batch.put_item(Item=transition('site-0-latency', '2024-01-05T00:00:00+00:00'))
+
+        sink = archiver.LocalSink(str(tmp_path))
+        now = datetime(2024, 1, 2, 12, tzinfo=timezone.utc) + timedelta(
+            days=archiver.RETENTION_DAYS - archiver.ARCHIVE_LEAD_DAYS)
+        assert archiver.archive_expiring(alarm_table, sink, now=now) == {'2024-01-01': 3, '2024-01-02': 3}
+
+        path = tmp_path / 'alarms' / 'day=2024-01-01' / 'transitions.ndjson.gz'
+        with gzip.open(path, 'rt') as archived:
+            rows = [json.loads(line) for line in archived]
+        # Whole items, not just what the index projects, oldest first
+        assert [row['StateChangeTime'][11:13] for row in rows] == ['00', '01', '02']
+        assert (rows[0]['MetricName'], rows[0]['ExpiresAt']) == ('Latency', 1704067200)
+
+        # Archived days are not rewritten, even after TTL removes items from the table
+        alarm_table.delete_item(Key={'AlarmName': 'site-0-latency', 'Timestamp': rows[0]['Timestamp']})
+        assert archiver.archive_expiring(alarm_table, sink, now=now) == {}
+
+        streamed = list(archiver.read_archive(sink, '2024-01-01T01:00:00+00:00', '2024-01-02T01:00:00+00:00'))
+        assert [row['StateChangeTime'] for row in streamed] == [
+            '2024-01-01T01:00:00+00:00', '2024-01-01T02:00:00+00:00',
+            '2024-01-02T00:00:00+00:00', '2024-01-02T01:00:00+00:00']
+        one_alarm = archiver.read_archive(sink, '2023-12-01T00:00:00+00:00', '2024-01-31T00:00:00+00:00',
+                                          alarm_name='site-2-latency')
+        assert len(list(one_alarm)) == 2
@@ -0,0 +1,402 @@
+import importlib.util
+import json
+import os
+import sys
+from unittest.mock import patch
+
+import boto3
+import pytest
+from moto import mock_aws
+
+
+ALARM_LOGGER_DIR = os.path.join(os.path.dirname(__file__), '..', 'lambda', 'alarm_logger')
+
+
+def load_alarm_logger():
+    """Import the alarm logger fresh so it picks up the mocked table"""
+    # Its sibling modules are importable from the Lambda asset root
+    if ALARM_LOGGER_DIR not in sys.path:
+        sys.path.insert(0, ALARM_LOGGER_DIR)
+    spec = importlib.util.spec_from_file_location("alarm_logger", os.path.join(ALARM_LOGGER_DIR, 'alarm_logger.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def history_items(table):
+    """Logged transitions, without the per-alarm current-state items"""
+    return [item for item in table.scan()['Items'] if item['Timestamp'] != 'CURRENT']
+
+
+def sns_record(message_id, alarm_name, state, state_change_time, old_state='OK', metric=None, url=None):
+    message = {
+        'AlarmName': alarm_name,
+        'NewStateValue': state,
+        'OldStateValue': old_state,
+        'NewStateReason': f'{alarm_name} went {state}',
+        'StateChangeTime': state_change_time
+    }
+    if metric:
+        message['Trigger'] = {'MetricName': metric, 'Dimensions': [{'value': url, 'name': 'URL'}]}
+    return {
+        'EventSource': 'aws:sns',
+        'Sns': {
+            'MessageId': message_id,
+            'Timestamp': '2024-01-01T00:00:05.000Z',
+            'Message': json.dumps(message)
+        }
+    }
+
+
+class TestAlarmLogger:
+    """Test suite for the alarm logger Lambda function"""
+
+    @pytest.fixture
+    def alarm_table(self):
+        with mock_aws():
+            dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+            table = dynamodb.create_table(
+                TableName='test-alarm-table',
+                KeySchema=[
+                    {'AttributeName': 'AlarmName', 'KeyType': 'HASH'},
+                    {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}
+                ],
+                AttributeDefinitions=[
+                    {'AttributeName': 'AlarmName', 'AttributeType': 'S'},
+                    {'AttributeName': 'Timestamp', 'AttributeType': 'S'}
+                ],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            with patch.dict(os.environ, {'ALARM_TABLE': 'test-alarm-table'}):
+                yield table
+
+    def test_batches_records_and_drops_duplicates(self, alarm_table):
+        """Test that one invocation is written in a batch and redeliveries are dropped"""
+        alarm_logger = load_alarm_logger()
+        same_time = '2024-01-01T00:00:00.000+0000'
+        records = [
+            sns_record('msg-1', 'site-a-latency', 'ALARM', same_time),
+            # Same alarm, same instant, different message - both transitions are kept
+            sns_record('msg-2', 'site-a-latency', 'OK', same_time, old_state='ALARM'),
+            sns_record('msg-1', 'site-a-latency', 'ALARM', same_time),  # SNS redelivery
+            sns_record('msg-3', 'site-b-availability', 'ALARM', '2024-01-01T01:00:00.000+0100'),
+            {'Sns': {'MessageId': 'msg-4', 'Message': json.dumps({'NoAlarm': True})}}
+        ]
+
+        with patch.object(alarm_logger.table, 'batch_writer', wraps=alarm_logger.table.batch_writer) as batch_writer:
+            result = alarm_logger.lambda_handler({'Records': records}, {})
+        batch_writer.assert_called_once()
+
+        assert (result['processed'], result['duplicates']) == (3, 1)
+        items = history_items(alarm_table)
+        assert len(items) == 3
+        site_a = sorted(item['Timestamp'] for item in items if item['AlarmName'] == 'site-a-latency')
+        assert site_a == ['2024-01-01T00:00:00+00:00#msg-1', '2024-01-01T00:00:00+00:00#msg-2']
+        site_b = [item for item in items if item['AlarmName'] == 'site-b-availability'][0]
+        # StateChangeTime is normalized to UTC so the sort key orders correctly
+        assert site_b['StateChangeTime'] == '2024-01-01T00:00:00+00:00'
+        assert site_b['TransitionDay'] == '2024-01-01'
+        assert site_b['OldState'] == 'OK'
+        # History expires RETENTION_DAYS after the transition
+        assert site_b['ExpiresAt'] == 1704067200 + alarm_logger.RETENTION_DAYS * 86400
+
+        # A later redelivery rewrites the same item instead of adding one
+        alarm_logger.lambda_handler({'Records': records[:1]}, {})
+        assert len(history_items(alarm_table)) == 3
+
+    def test_direct_invocation_is_idempotent(self, alarm_table):
+        """Test that direct test events without a MessageId still get a stable key"""
+        alarm_logger = load_alarm_logger()
+        event = {'AlarmName': 'manual-test', 'NewStateValue': 'ALARM', 'NewStateReason': 'Testing',
+                 'StateChangeTime': '2024-01-01T00:00:00.000+0000'}
+
+        assert alarm_logger.lambda_handler(event, {})['processed'] == 1
+        alarm_logger.lambda_handler(event, {})
+        assert len(history_items(alarm_table)) == 1
+        assert alarm_logger.lambda_handler({}, {})['body'] == 'No Records; nothing processed'
+
+    def test_queue_batch_reports_item_failures(self, alarm_table):
+        """Test that SQS batches are written together and only failed messages are retried"""
+        alarm_logger = load_alarm_logger()
+        records = [
+            {'messageId': f'sqs-{i}', 'eventSource': 'aws:sqs',
+             'body': json.dumps(sns_record(f'msg-{i}', f'site-{i}-latency', 'ALARM', '2024-01-01T00:00:00.000+0000')['Sns'])}
+            for i in range(3)
+        ]
+        records.append({'messageId': 'sqs-garbage', 'eventSource': 'aws:sqs', 'body': 'not json'})
+
+        assert alarm_logger.lambda_handler({'Records': records}, {}) == {'batchItemFailures': []}
+        assert len(history_items(alarm_table)) == 3
+
+        # When the batch write fails, items are retried one by one and only the failures reported
+        put_item = alarm_logger.table.put_item
+
+        def flaky_put_item(**kwargs):
+            if kwargs['Item']['AlarmName'] == 'site-1-latency':
+                raise RuntimeError('throttled')
+            return put_item(**kwargs)
+
+        with patch.object(alarm_logger, 'write_items', side_effect=RuntimeError('batch failed')), \
+                patch.object(alarm_logger.table, 'put_item', side_effect=flaky_put_item):
+            result = alarm_logger.lambda_handler({'Records': records}, {})
+        assert result == {'batchItemFailures': [{'itemIdentifier': 'sqs-1'}]}
+
+    def test_current_state_follows_newest_transition(self, alarm_table):
+        """Test that the current-state item only moves forward and marks firing alarms"""
+        alarm_logger = load_alarm_logger()
+        current_key = {'AlarmName': 'site-a-latency', 'Timestamp': 'CURRENT'}
+
+        alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-1', 'site-a-latency', 'ALARM', '2024-01-01T00:00:00.000+0000'),
+            sns_record('msg-2', 'site-a-latency', 'OK', '2024-01-01T00:10:00.000+0000', old_state='ALARM'),
+            sns_record('msg-3', 'site-b-availability', 'ALARM', '2024-01-01T00:05:00.000+0000')
+        ]}, {})
+        current = alarm_table.get_item(Key=current_key)['Item']
+        assert (current['State'], current['MessageId']) == ('OK', 'msg-2')
+        assert 'Firing' not in current
+        firing = alarm_table.get_item(Key={'AlarmName': 'site-b-availability', 'Timestamp': 'CURRENT'})['Item']
+        assert firing['Firing'] == 'ALARM'
+
+        # A late-arriving older transition is kept in history but does not roll the state back
+        result = alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-0', 'site-a-latency', 'ALARM', '2023-12-31T23:55:00.000+0000')
+        ]}, {})
+        assert result['current_updated'] == 0
+        assert alarm_table.get_item(Key=current_key)['Item']['MessageId'] == 'msg-2'
+
+        alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-4', 'site-a-latency', 'ALARM', '2024-01-01T00:20:00.000+0000')
+        ]}, {})
+        current = alarm_table.get_item(Key=current_key)['Item']
+        assert (current['State'], current['Firing']) == ('ALARM', 'ALARM')
+        assert len(history_items(alarm_table)) == 5
+
+    def test_flapping_alarm_is_aggregated(self, alarm_table):
+        """Test that transitions past the flap threshold fold into one aggregated entry"""
+        alarm_logger = load_alarm_logger()
+        assert (alarm_logger.FLAP_THRESHOLD, alarm_logger.FLAP_WINDOW_SECONDS) == (6, 3600)
+        states = ['ALARM', 'OK'] * 5
+        records = [sns_record(f'msg-{i}', 'site-a-latency', state, f'2024-01-01T00:{i:02d}:00.000+0000')
+                   for i, state in enumerate(states)]
+
+        # Split over two invocations: the window lives in the current-state item
+        first = alarm_logger.lambda_handler({'Records': records[:4]}, {})
+        second = alarm_logger.lambda_handler({'Records': records[4:]}, {})
+        assert (first['written'], second['written'], second['flapping']) == (4, 1, 5)
+
+        history = sorted(history_items(alarm_table), key=lambda item: item['Timestamp'])
+        assert len(history) == 6
+        aggregated = history[-1]
+        assert aggregated['Timestamp'] == '2024-01-01T00:05:00+00:00#FLAPPING'
+        assert (aggregated['State'], aggregated['TransitionCount'], aggregated['LastState']) == ('FLAPPING', 5, 'OK')
+        current = alarm_table.get_item(Key={'AlarmName': 'site-a-latency', 'Timestamp': 'CURRENT'})['Item']
+        assert current['FlappingSince'] == '2024-01-01T00:05:00+00:00'
+        assert current['State'] == 'OK'
+
+        # Once the rate drops below the threshold, transitions are logged one by one again
+        calm = alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-10', 'site-a-latency', 'ALARM', '2024-01-01T03:00:00.000+0000')
+        ]}, {})
+        assert (calm['written'], calm['flapping']) == (1, 0)
+        current = alarm_table.get_item(Key={'AlarmName': 'site-a-latency', 'Timestamp': 'CURRENT'})['Item']
+        assert 'FlappingSince' not in current
+        assert current['Firing'] == 'ALARM'
+        assert len(history_items(alarm_table)) == 7
+
+    def test_transitions_are_replanned_when_current_state_moved(self, alarm_table):
+        """Test that a batch losing the race to a newer transition still lands in history"""
+        alarm_logger = load_alarm_logger()
+        alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-new', 'site-a-latency', 'ALARM', '2024-01-01T00:30:00.000+0000')
+        ]}, {})
+        states = ['ALARM', 'OK'] * 4
+        records = [sns_record(f'msg-{i}', 'site-a-latency', state, f'2024-01-01T00:{i:02d}:00.000+0000')
+                   for i, state in enumerate(states)]
+
+        # Planned against a state read before msg-new moved it, the batch would flap
+        with patch.object(alarm_logger, 'load_current_states', return_value={}):
+            result = alarm_logger.lambda_handler({'Records': records}, {})
+        assert (result['current_stale'], result['current_updated'], result['written']) == (1, 0, 8)
+        history = history_items(alarm_table)
+        assert len(history) == 9
+        assert all(item['State'] != 'FLAPPING' for item in history)
+        assert alarm_table.get_item(Key={'AlarmName': 'site-a-latency', 'Timestamp': 'CURRENT'})['Item']['MessageId'] == 'msg-new'
+
+        # A state that keeps moving gives up and reports the messages for redelivery
+        queue_records = [{'messageId': 'sqs-1', 'eventSource': 'aws:sqs', 'body': json.dumps(
+            sns_record('msg-late', 'site-a-latency', 'OK', '2024-01-01T00:40:00.000+0000')['Sns'])}]
+        with patch.object(alarm_logger, 'apply_plan', return_value=False):
+            response = alarm_logger.lambda_handler({'Records': queue_records}, {})
+        assert response == {'batchItemFailures': [{'itemIdentifier': 'sqs-1'}]}
+
+    def test_transitions_are_correlated_into_incidents(self, alarm_table):
+        """Test that alarms sharing a domain or metric group into one incident with an MTTR"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        incidents = dynamodb.create_table(
+            TableName='test-incident-table',
+            KeySchema=[{'AttributeName': 'incident_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'incident_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        with patch.dict(os.environ, {'INCIDENT_TABLE': 'test-incident-table'}):
+            alarm_logger = load_alarm_logger()
+        alarm_logger.incident_correlator._window.clear()
+
+        def incident_items():
+            return [item for item in incidents.scan()['Items'] if item['incident_id'].startswith('INC#')]
+
+        # Two hosts of one domain, and a third site failing on the same metric, in one batch
+        result = alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-1', 'a-availability', 'ALARM', '2024-01-01T00:00:00.000+0000',
+                       metric='Availability', url='https://www.example.com'),
+            sns_record('msg-2', 'b-latency', 'ALARM', '2024-01-01T00:00:30.000+0000',
+                       metric='Latency', url='https://api.example.com/health'),
+            sns_record('msg-3', 'c-latency', 'ALARM', '2024-01-01T00:01:00.000+0000',
+                       metric='Latency', url='https://other.org')
+        ]}, {})
+        assert result['incidents'] == 1
+        [incident] = incident_items()
+        assert incident['started_at'] == '2024-01-01T00:00:00+00:00'
+        assert incident['affected_targets'] == {'https://www.example.com', 'https://api.example.com/health',
+                                                'https://other.org'}
+        assert incident['status'] == 'OPEN'
+
+        # A later alarm inside the window joins the incident, found through the table this time
+        alarm_logger.incident_correlator._window.clear()
+        alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-4', 'd-availability', 'ALARM', '2024-01-01T00:03:00.000+0000',
+                       metric='Availability', url='https://shop.example.com')
+        ]}, {})
+        [incident] = incident_items()
+        assert incident['firing'] == {'a-availability', 'b-latency', 'c-latency', 'd-availability'}
+
+        # The incident resolves when its last alarm recovers
+        recovered = alarm_logger.lambda_handler({'Records': [
+            sns_record(f'msg-{5 + i}', name, 'OK', f'2024-01-01T00:1{i}:00.000+0000', old_state='ALARM')
+            for i, name in enumerate(['a-availability', 'b-latency', 'c-latency'])
+        ]}, {})
+        assert recovered['incidents_resolved'] == 0
+        recovered = alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-9', 'd-availability', 'OK', '2024-01-01T00:20:00.000+0000', old_state='ALARM')
+        ]}, {})
+        assert recovered['incidents_resolved'] == 1
+        [incident] = incident_items()
+        assert (incident['status'], incident['mttr_seconds']) == ('RESOLVED', 1200)
+        assert 'firing' not in incident
+
+        # An unrelated alarm long after the window opens a new incident
+        alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-10', 'c-latency', 'ALARM', '2024-01-01T02:00:00.000+0000',
+                       metric='Latency', url='https://other.org')
+        ]}, {})
+        assert sorted(item['status'] for item in incident_items()) == ['OPEN', 'RESOLVED']
+
+    def test_alarm_bridging_two_incidents_merges_them(self, alarm_table):
+        """Test that an alarm whose keys belong to two open incidents merges them into the oldest"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        incidents = dynamodb.create_table(
+            TableName='test-incident-table',
+            KeySchema=[{'AttributeName': 'incident_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'incident_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        with patch.dict(os.environ, {'INCIDENT_TABLE': 'test-incident-table'}):
+            alarm_logger = load_alarm_logger()
+        alarm_logger.incident_correlator._window.clear()
+
+        alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-1', 'a-latency', 'ALARM', '2024-01-01T00:00:00.000+0000',
+                       metric='Latency', url='https://a.com')]}, {})
+        alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-2', 'b-availability', 'ALARM', '2024-01-01T00:01:00.000+0000',
+                       metric='Availability', url='https://b.com')]}, {})
+        opened = {item['alarms'].pop(): item['incident_id'] for item in incidents.scan()['Items']
+                  if item['incident_id'].startswith('INC#')}
+        assert len(set(opened.values())) == 2
+
+        # Latency links it to the first incident, b.com to the second
+        result = alarm_logger.lambda_handler({'Records': [
+            sns_record('msg-3', 'c-latency', 'ALARM', '2024-01-01T00:02:00.000+0000',
+                       metric='Latency', url='https://b.com')]}, {})
+        assert result['incidents'] == 1
+        winner = incidents.get_item(Key={'incident_id': opened['a-latency']})['Item']
+        assert winner['firing'] == {'a-latency', 'b-availability', 'c-latency'}
+        assert winner['affected_targets'] == {'https://a.com', 'https://b.com'}
+        loser = incidents.get_item(Key={'incident_id': opened['b-availability']})['Item']
+        assert (loser['status'], loser['merged_into']) == ('MERGED', opened['a-latency'])
+        for pointer in ['ALARM#b-availability', 'ALARM#c-latency', 'KEY#domain:b.com', 'KEY#class:Availability']:
+            assert incidents.get_item(Key={'incident_id': pointer})['Item']['incident'] == opened['a-latency']
+
+        # Recoveries of the merged alarms resolve the surviving incident
+        recovered = alarm_logger.lambda_handler({'Records': [
+            sns_record(f'msg-{4 + i}', name, 'OK', f'2024-01-01T00:1{i}:00.000+0000', old_state='ALARM')
+            for i, name in enumerate(['a-latency', 'b-availability', 'c-latency'])
+        ]}, {})
+        assert recovered['incidents_resolved'] == 1
+        assert incidents.get_item(Key={'incident_id': opened['a-latency']})['Item']['status'] == 'RESOLVED'
+
+    def test_fleet_alarm_records_breached_targets(self, alarm_table):
+        """Test that a firing fleet alarm stores the URLs whose series breached its threshold"""
+        alarm_logger = load_alarm_logger()
+        trigger = {
+            'Period': 300, 'EvaluationPeriods': 1, 'ComparisonOperator': 'GreaterThanThreshold', 'Threshold': 500.0,
+            'Metrics': [{'Id': 'expr_1', 'ReturnData': True, 'Period': 300,
+                         'Expression': 'SELECT MAX(Latency) FROM SCHEMA("amiel-week3", URL)'}]
+        }
+
+        def fleet_record(message_id, state, state_change_time):
+            record = sns_record(message_id, 'fleet-latency', state, state_change_time)
+            message = json.loads(record['Sns']['Message'])
+            record['Sns']['Message'] = json.dumps({**message, 'Trigger': trigger})
+            return record
+
+        pages = [
+            {'MetricDataResults': [{'Label': 'https://a.example.com', 'Values': [812.0, 120.0]},
+                                   {'Label': 'https://b.example.com', 'Values': [95.0]}],
+             'NextToken': 'page-2'},
+            # A later page continuing a series holds older values, which must not count
+            {'MetricDataResults': [{'Label': 'https://b.example.com', 'Values': [900.0]},
+                                   {'Label': 'https://c.example.com', 'Values': [501.0]}]},
+        ]
+        with patch.object(alarm_logger.cloudwatch, 'get_metric_data', side_effect=pages) as get_metric_data:
+            alarm_logger.lambda_handler({'Records': [
+                fleet_record('msg-1', 'ALARM', '2024-01-01T00:05:00.000+0000')
+            ]}, {})
+            alarm_logger.lambda_handler({'Records': [
+                fleet_record('msg-2', 'OK', '2024-01-01T00:15:00.000+0000')
+            ]}, {})
+
+        # One SEARCH over the namespace, and none for the OK transition
+        assert get_metric_data.call_count == 2
+        query = get_metric_data.call_args_list[0].kwargs['MetricDataQueries'][0]['Expression']
+        assert query == "SEARCH('{amiel-week3,URL} MetricName=\"Latency\"', 'Maximum', 300)"
+        # Series labels are asked for as the URL dimension, not left to CloudWatch's default
+        label = get_metric_data.call_args_list[0].kwargs['MetricDataQueries'][0]['Label']
+        assert label == "${PROP('Dim.URL')}"
+        firing, recovered = sorted(history_items(alarm_table), key=lambda item: item['Timestamp'])
+        assert firing['BreachedTargets'] == ['https://a.example.com', 'https://c.example.com']
+        assert 'BreachedTargetsTruncated' not in firing
+        assert firing['MetricName'] == 'Latency'
+        assert 'BreachedTargets' not in recovered
+
+    def test_fleet_alarm_marks_truncated_breakdown(self, alarm_table):
+        """Test that a breakdown that reached the SEARCH series limit is marked as partial"""
+        alarm_logger = load_alarm_logger()
+        trigger = {
+            'Period': 60, 'EvaluationPeriods': 1, 'ComparisonOperator': 'LessThanThreshold', 'Threshold': 1.0,
+            'Metrics': [{'Id': 'expr_1', 'ReturnData': True, 'Period': 60,
+                         'Expression': 'SELECT MIN(Availability) FROM SCHEMA("amiel-week3", URL)'}]
+        }
+        record = sns_record('msg-1', 'fleet-availability', 'ALARM', '2024-01-01T00:05:00.000+0000')
+        message = json.loads(record['Sns']['Message'])
+        record['Sns']['Message'] = json.dumps({**message, 'Trigger': trigger})
+        limit = alarm_logger.fleet_breaches.SEARCH_SERIES_LIMIT
+        page = {'MetricDataResults': [
+            {'Label': f'https://site-{i}.example.com', 'Values': [0.0 if i < 3 else 1.0]} for i in range(limit)
+        ]}
+        with patch.object(alarm_logger.cloudwatch, 'get_metric_data', return_value=page):
+            alarm_logger.lambda_handler({'Records': [record]}, {})
+
+        firing, = history_items(alarm_table)
+        assert firing['BreachedTargets'] == [f'https://site-{i}.example.com' for i in range(3)]
+        assert firing['BreachedTargetsTruncated'] is True
@@ -0,0 +1,184 @@
+import importlib.util
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from moto import mock_aws
+
+
+def load_alarm_reconciler():
+    spec = importlib.util.spec_from_file_location(
+        "alarm_reconciler",
+        os.path.join(os.path.dirname(__file__), '..', 'lambda', 'alarm_reconciler', 'alarm_reconciler.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def website(website_id, url, enabled=True):
+    return {'id': website_id, 'url': url, 'name': website_id, 'enabled': enabled,
+            'enabled_key': 'true' if enabled else 'false', 'record_type': 'website',
+            'created_at': f'2024-01-01T00:00:00#{website_id}'}
+
+
+def stream_record(event_name, new_image=None, old_image=None):
+    serializer = TypeSerializer()
+    image = new_image or old_image
+    change = {'Keys': {'id': {'S': image['id']}}}
+    if new_image:
+        change['NewImage'] = {k: serializer.serialize(v) for k, v in new_image.items()}
+    if old_image:
+        change['OldImage'] = {k: serializer.serialize(v) for k, v in old_image.items()}
+    return {'eventSource': 'aws:dynamodb', 'eventName': event_name, 'dynamodb': change}
+
+
+class TestAlarmReconciler:
+    """Test suite for the per-website alarm reconciler"""
+
+    @pytest.fixture
+    def websites_table(self):
+        with mock_aws():
+            dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+            table = dynamodb.create_table(
+                TableName='test-websites-table',
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[
+                    {'AttributeName': 'id', 'AttributeType': 'S'},
+                    {'AttributeName': 'enabled_key', 'AttributeType': 'S'},
+                    {'AttributeName': 'created_at', 'AttributeType': 'S'}
+                ],
+                GlobalSecondaryIndexes=[{
+                    'IndexName': 'enabled-key-index',
+                    'KeySchema': [
+                        {'AttributeName': 'enabled_key', 'KeyType': 'HASH'},
+                        {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-websites-table',
+                                         'ALARM_TOPIC_ARN': 'arn:aws:sns:us-east-1:123456789012:alarms'}):
+                yield table
+
+    def alarms(self):
+        cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+        return {alarm['AlarmName']: alarm for alarm in cloudwatch.describe_alarms()['MetricAlarms']}
+
+    def test_full_sync_applies_only_the_difference(self, websites_table):
+        """Test that a full sync creates, updates and deletes alarms, and is a no-op when in sync"""
+        reconciler = load_alarm_reconciler()
+        for item in (website('a', 'https://a.example.com'), website('b', 'https://b.example.com'),
+                     website('c', 'https://c.example.com', enabled=False)):
+            websites_table.put_item(Item=item)
+        cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+        # A leftover alarm of a deleted website, and an alarm the reconciler does not own
+        cloudwatch.put_metric_alarm(AlarmName='website-monitor-gone-latency', MetricName='Latency',
+                                    Namespace='amiel-week3', Statistic='Average', Period=300,
+                                    EvaluationPeriods=1, Threshold=500, ComparisonOperator='GreaterThanThreshold')
+        cloudwatch.put_metric_alarm(AlarmName='lambda-errors', MetricName='Errors', Namespace='AWS/Lambda',
+                                    Statistic='Sum', Period=60, EvaluationPeriods=1, Threshold=1,
+                                    ComparisonOperator='GreaterThanThreshold')
+
+        result = reconciler.lambda_handler({'source': 'aws.events'}, {})
+        assert (result['websites'], result['put'], result['deleted']) == (2, 6, 1)
+        alarms = self.alarms()
+        assert sorted(alarms) == sorted(['lambda-errors'] + reconciler.alarm_names('a') + reconciler.alarm_names('b'))
+        latency = alarms['website-monitor-a-latency']
+        assert latency['Dimensions'] == [{'Name': 'URL', 'Value': 'https://a.example.com'}]
+        assert (latency['Threshold'], latency['ComparisonOperator']) == (500.0, 'GreaterThanThreshold')
+        assert latency['OKActions'] == ['arn:aws:sns:us-east-1:123456789012:alarms']
+
+        # Nothing changed: no writes at all
+        with patch.object(reconciler, 'apply', wraps=reconciler.apply) as apply:
+            reconciler.lambda_handler({'source': 'aws.events'}, {})
+        assert apply.call_args.args[1:] == ([], [])
+
+        # A changed URL only re-puts that website's alarms
+        websites_table.put_item(Item=website('b', 'https://b.example.org'))
+        result = reconciler.lambda_handler({'source': 'aws.events'}, {})
+        assert (result['put'], result['deleted']) == (3, 0)
+
+    def test_full_sync_resumes_after_running_out_of_time(self, websites_table):
+        """Test that a full sync stops at its deadline and the next one puts only what is left"""
+        reconciler = load_alarm_reconciler()
+        for item in (website('a', 'https://a.example.com'), website('b', 'https://b.example.com')):
+            websites_table.put_item(Item=item)
+        cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+        slow = MagicMock(wraps=cloudwatch)
+        slow.put_metric_alarm.side_effect = lambda **alarm: (time.sleep(0.2), cloudwatch.put_metric_alarm(**alarm))
+
+        with patch.object(reconciler, 'PUT_CONCURRENCY', 1):
+            first = reconciler.full_sync(websites_table, slow, deadline=time.monotonic() + 0.5)
+        assert 0 < first['put'] < 6
+        assert first['put'] + first['pending'] == 6
+        second = reconciler.full_sync(websites_table, cloudwatch)
+        assert (second['put'], second['pending']) == (first['pending'], 0)
+
+        # A sync with no time left puts nothing and does not chain; one that made progress does
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 1000
+        cloudwatch.delete_alarms(AlarmNames=reconciler.alarm_names('a'))
+        with patch.object(reconciler, 'continue_sync') as continue_sync:
+            result = reconciler.lambda_handler({'source': 'aws.events'}, context)
+            assert (result['put'], result['pending']) == (0, 3)
+            assert not continue_sync.called
+            with patch.object(reconciler, 'full_sync', return_value={'websites': 2, 'put': 2, 'deleted': 0,
+                                                                     'pending': 1}):
+                reconciler.lambda_handler({'source': 'aws.events'}, context)
+            continue_sync.assert_called_once_with(context)
+
+    def test_fleet_mode_deletes_leftover_website_alarms(self, websites_table):
+        """Test that after switching to fleet mode a full sync removes every per-website alarm"""
+        reconciler = load_alarm_reconciler()
+        websites_table.put_item(Item=website('a', 'https://a.example.com'))
+        assert reconciler.lambda_handler({'source': 'aws.events'}, {})['put'] == 3
+
+        with patch.dict(os.environ, {'ALARM_MODE': 'fleet'}):
+            reconciler = load_alarm_reconciler()
+        result = reconciler.lambda_handler({'source': 'aws.events'}, {})
+        assert (result['websites'], result['put'], result['deleted']) == (0, 0, 3)
+        assert self.alarms() == {}
+
+    def test_full_sync_is_skipped_before_the_enabled_index_exists(self, websites_table):
+        """Test that a stack at an early index stage keeps its alarms instead of deleting them all"""
+        reconciler = load_alarm_reconciler()
+        websites_table.put_item(Item=website('a', 'https://a.example.com'))
+        reconciler.lambda_handler({'source': 'aws.events'}, {})
+
+        with patch.object(reconciler, 'ENABLED_INDEX', 'not-deployed-yet-index'):
+            result = reconciler.lambda_handler({'source': 'aws.events'}, {})
+        assert (result['websites'], result['put'], result['deleted']) == (0, 0, 0)
+        assert sorted(self.alarms()) == reconciler.alarm_names('a')
+
+    def test_stream_batch_reconciles_changed_websites(self, websites_table):
+        """Test that stream records only touch the alarms of the websites they carry"""
+        reconciler = load_alarm_reconciler()
+        a, b = website('a', 'https://a.example.com'), website('b', 'https://b.example.com')
+        records = [
+            stream_record('INSERT', new_image=a),
+            stream_record('INSERT', new_image=b),
+            # Auxiliary items in the same table are ignored
+            stream_record('MODIFY', new_image={'id': '__stats__', 'record_type': 'meta', 'total_count': 2}),
+        ]
+        assert reconciler.lambda_handler({'Records': records}, {})['put'] == 6
+
+        disabled_b = {**b, 'enabled': False, 'enabled_key': 'false'}
+        result = reconciler.lambda_handler({'Records': [
+            # Only the newest image of a website in the batch counts
+            stream_record('MODIFY', new_image={**a, 'url': 'https://a.example.org'}, old_image=a),
+            stream_record('MODIFY', new_image={**a, 'url': 'https://a.example.net'}, old_image=a),
+            stream_record('MODIFY', new_image=disabled_b, old_image=b),
+        ]}, {})
+        assert (result['websites'], result['put'], result['deleted']) == (2, 3, 3)
+        alarms = self.alarms()
+        assert sorted(alarms) == reconciler.alarm_names('a')
+        assert alarms['website-monitor-a-availability']['Dimensions'][0]['Value'] == 'https://a.example.net'
+
+        result = reconciler.lambda_handler({'Records': [stream_record('REMOVE', old_image=a)]}, {})
+        assert result['deleted'] == 3
+        assert self.alarms() == {}
@@ -1,6 +1,8 @@
 import pytest
 import json
 import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
 from moto import mock_aws
 from unittest.mock import patch, MagicMock
 import os
@@ -9,11 +11,93 @@ import sys
 # Add the lambda directory to the path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'crud_api'))
 
-from crud_handler import lambda_handler, create_website, get_website, list_websites, update_website, delete_website
+from crud_handler import lambda_handler, encode_cursor, create_website, create_websites_batch, get_website, list_websites, update_website, delete_website
+
+def create_indexed_table(dynamodb, table_name='test-table'):
+    """Create the target websites table with the GSIs defined in AppStack"""
+    return dynamodb.create_table(
+        TableName=table_name,
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'record_type', 'AttributeType': 'S'},
+            {'AttributeName': 'created_at', 'AttributeType': 'S'},
+            {'AttributeName': 'enabled_key', 'AttributeType': 'S'},
+            {'AttributeName': 'name', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                'IndexName': 'created-at-index',
+                'KeySchema': [
+                    {'AttributeName': 'record_type', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'enabled-key-index',
+                'KeySchema': [
+                    {'AttributeName': 'enabled_key', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'name-index',
+                'KeySchema': [
+                    {'AttributeName': 'record_type', 'KeyType': 'HASH'},
+                    {'AttributeName': 'name', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+def create_search_table(dynamodb, table_name='test-search-table'):
+    """Create the search index table with the trigram GSI defined in AppStack"""
+    return dynamodb.create_table(
+        TableName=table_name,
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'trigram', 'AttributeType': 'S'},
+            {'AttributeName': 'website_id', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'trigram-index',
+            'KeySchema': [
+                {'AttributeName': 'trigram', 'KeyType': 'HASH'},
+                {'AttributeName': 'website_id', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'KEYS_ONLY'}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+def stream_records(table):
+    """Every record of a table's stream so far, as Lambda receives them"""
+    streams = boto3.client('dynamodbstreams', region_name='us-east-1')
+    stream_arn = table.meta.client.describe_table(TableName=table.name)['Table']['LatestStreamArn']
+    records = []
+    for shard in streams.describe_stream(StreamArn=stream_arn)['StreamDescription']['Shards']:
+        iterator = streams.get_shard_iterator(StreamArn=stream_arn, ShardId=shard['ShardId'],
+                                              ShardIteratorType='TRIM_HORIZON')['ShardIterator']
+        records.extend(dict(record, eventSource='aws:dynamodb')
+                       for record in streams.get_records(ShardIterator=iterator)['Records'])
+    return records
 
 class TestCRUDAPI:
     """Test suite for CRUD API Lambda function"""
     
+    @pytest.fixture(autouse=True)
+    def cold_read_cache(self):
+        """Start every test with an empty warm-container read cache"""
+        import crud_handler
+        crud_handler.reset_read_cache()
+        yield
+        crud_handler.reset_read_cache()
+    
     @pytest.fixture
     def mock_event_get_websites(self):
         """Mock API Gateway event for GET /websites"""
@@ -388,4 +472,1043 @@ class TestCRUDAPI:
                 assert 'headers' in response
                 assert 'Access-Control-Allow-Origin' in response['headers']
                 assert response['headers']['Access-Control-Allow-Origin'] == '*'
-                assert 'Access-Control-Allow-Methods' in response['headers']
\ No newline at end of file
+                assert 'Access-Control-Allow-Methods' in response['headers']
+    @mock_aws
+    def test_list_websites_pagination(self):
+        """Test that GET /websites pages through the created_at index newest first"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        create_indexed_table(dynamodb)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            for i in range(3):
+                create_website({'url': f'https://site{i}.example.com', 'name': f'Site {i}'})
+            
+            event = {
+                'httpMethod': 'GET',
+                'path': '/websites',
+                'pathParameters': None,
+                'queryStringParameters': {'limit': '2'},
+                'body': None
+            }
+            first_page = json.loads(lambda_handler(event, {})['body'])
+            assert first_page['count'] == 2
+            assert [w['name'] for w in first_page['websites']] == ['Site 2', 'Site 1']
+            assert 'record_type' not in first_page['websites'][0]
+            assert first_page['next_cursor']
+            
+            event['queryStringParameters'] = {'limit': '2', 'cursor': first_page['next_cursor']}
+            second_page = json.loads(lambda_handler(event, {})['body'])
+            assert [w['name'] for w in second_page['websites']] == ['Site 0']
+            assert second_page['next_cursor'] is None
+
+    def test_list_websites_invalid_limit(self):
+        """Test that out-of-range limits and malformed cursors are rejected"""
+        for params in ({'limit': '0'}, {'limit': 'abc'}, {'cursor': 'not-a-cursor'}):
+            response = list_websites(params)
+            assert response['statusCode'] == 400
+            assert 'error' in json.loads(response['body'])
+
+    @mock_aws
+    def test_list_websites_filters_and_projection(self):
+        """Test ?enabled=, ?name_prefix= and ?fields= map to indexed queries"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        create_indexed_table(dynamodb)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            create_website({'url': 'https://alpha.example.com', 'name': 'Alpha'})
+            create_website({'url': 'https://beta.example.com', 'name': 'Beta', 'enabled': False})
+            create_website({'url': 'https://alpine.example.com', 'name': 'Alpine', 'enabled': False})
+            
+            body = json.loads(list_websites({'enabled': 'false', 'fields': 'id,url'})['body'])
+            assert body['access_path'] == {'operation': 'Query', 'index': 'enabled-key-index', 'filtered': False}
+            assert {w['url'] for w in body['websites']} == {'https://beta.example.com', 'https://alpine.example.com'}
+            assert all(set(w) == {'id', 'url'} for w in body['websites'])
+            
+            body = json.loads(list_websites({'name_prefix': 'Alp', 'enabled': 'true'})['body'])
+            assert body['access_path'] == {'operation': 'Query', 'index': 'name-index', 'filtered': True}
+            assert [w['name'] for w in body['websites']] == ['Alpha']
+            
+            assert list_websites({'fields': 'id,secret'})['statusCode'] == 400
+
+    @mock_aws
+    def test_list_websites_scan_fallback_reports_access_path(self, sample_website_data):
+        """Test that a table without the indexes falls back to a filtered scan"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = dynamodb.create_table(
+            TableName='test-table',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        table.put_item(Item=sample_website_data)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            body = json.loads(list_websites({'enabled': 'true'})['body'])
+            assert body['access_path'] == {'operation': 'Scan', 'index': None, 'filtered': True}
+            assert body['count'] == 1
+
+    @mock_aws
+    def test_list_websites_rejects_cursor_for_another_key(self):
+        """Test that a cursor DynamoDB rejects is a 400, not a scan fallback"""
+        table = MagicMock()
+        table.name = 'test-table'
+        table.get_item.return_value = {}
+        table.query.side_effect = ClientError(
+            {'Error': {'Code': 'ValidationException', 'Message': 'The provided starting key is invalid'}}, 'Query')
+        # Decodes fine, but is not a key of the index the query runs on
+        cursor = encode_cursor({'id': 'whatever', 'unexpected': 'attribute'})
+        
+        with patch('crud_handler.get_table', return_value=table):
+            response = list_websites({'limit': '2', 'cursor': cursor})
+        
+        assert response['statusCode'] == 400
+        assert json.loads(response['body'])['error'] == 'Invalid cursor'
+        table.scan.assert_not_called()
+
+        # Only a missing index falls back to the scan
+        table.query.side_effect = ClientError(
+            {'Error': {'Code': 'ValidationException',
+                       'Message': 'The table does not have the specified index: created-at-index'}}, 'Query')
+        table.scan.return_value = {'Items': []}
+        with patch('crud_handler.get_table', return_value=table):
+            response = list_websites({'limit': '2', 'cursor': cursor})
+        
+        assert response['statusCode'] == 200
+        table.scan.assert_called_once()
+
+    @mock_aws
+    def test_batch_import_ndjson_partial_failure(self):
+        """Test that POST /websites:batch imports NDJSON and reports bad items individually"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        
+        lines = [json.dumps({'url': f'https://bulk{i}.example.com', 'name': f'Bulk {i}'}) for i in range(30)]
+        lines.insert(3, json.dumps({'url': 'ftp://bad.example.com', 'name': 'Bad URL'}))
+        lines.insert(5, '{not json')
+        event = {
+            'httpMethod': 'POST',
+            'path': '/websites:batch',
+            'pathParameters': None,
+            'queryStringParameters': None,
+            'body': '\n'.join(lines)
+        }
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            response = lambda_handler(event, {})
+            
+            assert response['statusCode'] == 200
+            body = json.loads(response['body'])
+            assert body['created'] == 30
+            assert body['failed'] == 2
+            failures = [r for r in body['results'] if r['status'] == 'failed']
+            assert [r['index'] for r in failures] == [3, 5]
+            assert 'http' in failures[0]['error']
+            websites = table.scan(Select='COUNT', FilterExpression=Attr('record_type').eq('website'))
+            assert websites['Count'] == 30
+
+    @mock_aws
+    def test_batch_import_json_array(self):
+        """Test that POST /websites:batch accepts a JSON array body"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        create_indexed_table(dynamodb)
+        
+        event = {
+            'httpMethod': 'POST',
+            'path': '/websites:batch',
+            'pathParameters': None,
+            'queryStringParameters': None,
+            'body': json.dumps([
+                {'url': 'https://one.example.com', 'name': 'One'},
+                {'name': 'Missing URL'}
+            ])
+        }
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            body = json.loads(lambda_handler(event, {})['body'])
+            assert body['created'] == 1
+            assert body['results'][1] == {'index': 1, 'status': 'failed', 'error': "Field 'url' is required"}
+
+    @mock_aws
+    def test_export_websites_csv_and_ndjson(self, sample_website_data):
+        """Test GET /websites:export streams every website via a parallel scan"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        table.put_item(Item=sample_website_data)
+        table.put_item(Item={'id': '__meta__', 'record_type': 'meta'})
+        
+        event = {
+            'httpMethod': 'GET',
+            'path': '/websites:export',
+            'pathParameters': None,
+            'queryStringParameters': {'format': 'csv', 'segments': '3'},
+            'body': None
+        }
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            for i in range(5):
+                create_website({'url': f'https://export{i}.example.com', 'name': f'Export {i}'})
+            
+            response = lambda_handler(event, {})
+            assert response['statusCode'] == 200
+            assert response['headers']['Content-Type'] == 'text/csv'
+            rows = response['body'].strip().splitlines()
+            assert rows[0].startswith('id,url,name')
+            assert len(rows) == 7
+            
+            event['queryStringParameters'] = {'format': 'ndjson'}
+            response = lambda_handler(event, {})
+            items = [json.loads(line) for line in response['body'].splitlines()]
+            assert len(items) == 6
+            assert all('record_type' not in item for item in items)
+            assert {item['check_interval'] for item in items} == {300}
+            
+            event['queryStringParameters'] = {'format': 'xml'}
+            assert lambda_handler(event, {})['statusCode'] == 400
+
+    @mock_aws
+    def test_update_website_if_match(self, sample_website_data):
+        """Test that updates are versioned and honour If-Match with a single write"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        table.put_item(Item=sample_website_data)
+        
+        event = {
+            'httpMethod': 'PUT',
+            'path': '/websites/test-id',
+            'pathParameters': {'id': 'test-id'},
+            'queryStringParameters': None,
+            'headers': {'If-Match': '"0"'},
+            'body': json.dumps({'name': 'First Edit'})
+        }
+        
+        # Record every DynamoDB operation the handler makes
+        import crud_handler
+        operations = []
+        record = lambda model, params, **kwargs: operations.append((model.name, params.get('Key', {}).get('id', {}).get('S')))
+        crud_handler.dynamodb.meta.client.meta.events.register('before-parameter-build.dynamodb', record)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            response = lambda_handler(event, {})
+            crud_handler.dynamodb.meta.client.meta.events.unregister('before-parameter-build.dynamodb', record)
+            # One conditional write for the website; cache version and search index are separate items
+            assert [op for op in operations if op[1] == 'test-id'] == [('UpdateItem', 'test-id')]
+            assert ('UpdateItem', crud_handler.CACHE_VERSION_ID) in operations
+            assert response['statusCode'] == 200
+            assert response['headers']['ETag'] == '"1"'
+            assert json.loads(response['body'])['website']['version'] == 1
+            
+            # A second writer still holding version 0 loses
+            event['body'] = json.dumps({'name': 'Stale Edit'})
+            response = lambda_handler(event, {})
+            assert response['statusCode'] == 412
+            assert response['headers']['ETag'] == '"1"'
+            assert table.get_item(Key={'id': 'test-id'})['Item']['name'] == 'First Edit'
+            
+            get_event = dict(event, httpMethod='GET', headers=None, body=None)
+            assert lambda_handler(get_event, {})['headers']['ETag'] == '"1"'
+
+    @mock_aws
+    def test_delete_website_conditions(self, sample_website_data):
+        """Test conditional delete returns 404 for missing items and 412 for stale versions"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        table.put_item(Item=dict(sample_website_data, version=3))
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            assert delete_website('missing-id')['statusCode'] == 404
+            assert delete_website('test-id', if_match='"2"')['statusCode'] == 412
+            assert delete_website('test-id', if_match='"3"')['statusCode'] == 200
+            assert 'Item' not in table.get_item(Key={'id': 'test-id'})
+
+    @mock_aws
+    def test_internal_items_are_not_websites(self):
+        """Test that counters and URL guards in the same table cannot be read, updated or deleted by id"""
+        import crud_handler
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            create_website({'url': 'https://internal.example.com', 'name': 'Internal'})
+            crud_handler.recount_website_stats(table)
+            guard_id = crud_handler.url_guard_id(crud_handler.normalize_url('https://internal.example.com'))
+            internal_ids = [crud_handler.STATS_ID, guard_id]
+            before = {item_id: table.get_item(Key={'id': item_id})['Item'] for item_id in internal_ids}
+            
+            for item_id in internal_ids:
+                assert get_website(item_id)['statusCode'] == 404
+                assert update_website(item_id, {'name': 'Hijacked'})['statusCode'] == 404
+                assert update_website(item_id, {'enabled': False})['statusCode'] == 404
+                assert delete_website(item_id)['statusCode'] == 404
+                assert table.get_item(Key={'id': item_id})['Item'] == before[item_id]
+
+    def test_decimal_json_keeps_integers(self):
+        """Test that the response encoder keeps integral Decimals as integers"""
+        from decimal import Decimal
+        import decimal_json
+        
+        encoded = decimal_json.dumps({'check_interval': Decimal('300'), 'ratio': Decimal('0.25'), 'tags': {'b', 'a'}})
+        assert encoded == '{"check_interval": 300, "ratio": 0.25, "tags": ["a", "b"]}'
+
+    @mock_aws
+    def test_read_cache_hits_and_invalidation(self, sample_website_data, capsys):
+        """Test that repeated GETs are served from cache until a write invalidates them"""
+        import crud_handler
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        table.put_item(Item=dict(sample_website_data, record_type='website', version=1))
+        
+        event = {
+            'httpMethod': 'GET',
+            'path': '/websites/test-id',
+            'pathParameters': {'id': 'test-id'},
+            'queryStringParameters': None,
+            'body': None
+        }
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            assert lambda_handler(event, {})['statusCode'] == 200
+            # A change the cache cannot see is hidden until invalidation
+            table.update_item(Key={'id': 'test-id'}, UpdateExpression='SET #n = :n',
+                              ExpressionAttributeNames={'#n': 'name'}, ExpressionAttributeValues={':n': 'Changed'})
+            cached = lambda_handler(event, {})
+            assert json.loads(cached['body'])['website']['name'] == 'Example Website'
+            
+            metrics = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+            assert [(m['CacheHits'], m['CacheMisses']) for m in metrics] == [(0, 1), (1, 0)]
+            
+            # A write from this container clears the cache
+            update_event = dict(event, httpMethod='PUT', body=json.dumps({'description': 'Edited'}))
+            assert lambda_handler(update_event, {})['statusCode'] == 200
+            fresh = json.loads(lambda_handler(event, {})['body'])['website']
+            assert fresh['name'] == 'Changed'
+            assert fresh['description'] == 'Edited'
+            
+            # A write from another container is seen through the shared version item
+            lambda_handler(event, {})
+            table.update_item(Key={'id': 'test-id'}, UpdateExpression='SET #n = :n',
+                              ExpressionAttributeNames={'#n': 'name'}, ExpressionAttributeValues={':n': 'Remote'})
+            table.update_item(Key={'id': crud_handler.CACHE_VERSION_ID}, UpdateExpression='ADD cache_version :one',
+                              ExpressionAttributeValues={':one': 1})
+            crud_handler._cache_state['checked_at'] = None
+            assert json.loads(lambda_handler(event, {})['body'])['website']['name'] == 'Remote'
+    
+    def test_ttl_cache_expiry_and_lru(self):
+        """Test that TTLCache expires entries and evicts the least recently used"""
+        from read_cache import TTLCache
+        now = [0.0]
+        cache = TTLCache(max_entries=2, ttl_seconds=5, clock=lambda: now[0])
+        
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        
+        now[0] = 5
+        assert cache.get('a') is None
+        assert cache.get('c') is None
+        assert cache.take_stats() == (1, 3)
+
+    @mock_aws
+    def test_conditional_get_not_modified(self, sample_website_data):
+        """Test that GETs answer a matching If-None-Match with a bodiless 304"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        table.put_item(Item=dict(sample_website_data, record_type='website', enabled_key='true', version=2))
+        
+        item_event = {
+            'httpMethod': 'GET',
+            'path': '/websites/test-id',
+            'pathParameters': {'id': 'test-id'},
+            'queryStringParameters': None,
+            'body': None
+        }
+        list_event = dict(item_event, path='/websites', pathParameters=None)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            first = lambda_handler(item_event, {})
+            assert first['headers']['ETag'] == '"2"'
+            
+            not_modified = lambda_handler(dict(item_event, headers={'If-None-Match': 'W/"1", "2"'}), {})
+            assert not_modified['statusCode'] == 304
+            assert not_modified['body'] == ''
+            assert not_modified['headers']['ETag'] == '"2"'
+            assert 'Content-Type' not in not_modified['headers']
+            
+            page = lambda_handler(list_event, {})
+            list_etag = page['headers']['ETag']
+            assert lambda_handler(dict(list_event, headers={'If-None-Match': list_etag}), {})['statusCode'] == 304
+            
+            # Any write changes both representations
+            update_event = dict(item_event, httpMethod='PUT', body=json.dumps({'name': 'Renamed'}))
+            assert lambda_handler(update_event, {})['statusCode'] == 200
+            changed = lambda_handler(dict(item_event, headers={'If-None-Match': '"2"'}), {})
+            assert changed['statusCode'] == 200
+            assert changed['headers']['ETag'] == '"3"'
+            changed_page = lambda_handler(dict(list_event, headers={'If-None-Match': list_etag}), {})
+            assert changed_page['statusCode'] == 200
+            assert changed_page['headers']['ETag'] != list_etag
+
+    @mock_aws
+    def test_duplicate_url_returns_existing_website(self):
+        """Test that URLs are unique after normalization and can be looked up with ?url="""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            first = create_website({'url': 'https://Example.com:443/status/', 'name': 'Example'})
+            assert first['statusCode'] == 201
+            website_id = json.loads(first['body'])['website']['id']
+            
+            duplicate = create_website({'url': 'https://example.com/status#top', 'name': 'Again'})
+            assert duplicate['statusCode'] == 200
+            assert json.loads(duplicate['body'])['website']['id'] == website_id
+            
+            found = json.loads(list_websites({'url': 'HTTPS://example.com/status'})['body'])
+            assert [w['id'] for w in found['websites']] == [website_id]
+            assert found['access_path']['operation'] == 'GetItem'
+            assert list_websites({'url': 'https://example.com/other'})['statusCode'] == 200
+            assert list_websites({'url': 'https://example.com', 'enabled': 'true'})['statusCode'] == 400
+            
+            # Moving a website to a taken URL conflicts; moving it elsewhere frees the old URL
+            other = json.loads(create_website({'url': 'https://other.example.com', 'name': 'Other'})['body'])['website']
+            conflict = update_website(other['id'], {'url': 'https://example.com/status'})
+            assert conflict['statusCode'] == 409
+            assert json.loads(conflict['body'])['website_id'] == website_id
+            
+            moved = update_website(website_id, {'url': 'https://moved.example.com'})
+            assert moved['statusCode'] == 200
+            assert moved['headers']['ETag'] == '"2"'
+            assert 'url_key' not in json.loads(moved['body'])['website']
+            assert create_website({'url': 'https://example.com/status', 'name': 'Reused'})['statusCode'] == 201
+            
+            # URL updates never read the item: a changed key costs the failed update plus the transaction,
+            # an equivalent URL is a single write
+            import crud_handler
+            operations = []
+            record = lambda model, params, **kwargs: operations.append(model.name)
+            crud_handler.dynamodb.meta.client.meta.events.register('before-parameter-build.dynamodb', record)
+            try:
+                moved = update_website(website_id, {'url': 'https://moved.example.org'})
+                assert operations[:2] == ['UpdateItem', 'TransactWriteItems']
+                assert json.loads(moved['body'])['website']['url'] == 'https://moved.example.org'
+                assert moved['headers']['ETag'] == '"3"'
+                operations.clear()
+                assert update_website(website_id, {'url': 'https://MOVED.example.org/'})['statusCode'] == 200
+                assert operations[:1] == ['UpdateItem'] and 'TransactWriteItems' not in operations
+            finally:
+                crud_handler.dynamodb.meta.client.meta.events.unregister('before-parameter-build.dynamodb', record)
+            
+            # A URL key that changed after it was returned re-plans instead of moving the wrong guard
+            move_url_guard = crud_handler.move_url_guard
+            stale = lambda *args: move_url_guard(*args[:-1], {**args[-1], 'url_key': 'https://stale.example.org/'})
+            with patch.object(crud_handler, 'move_url_guard', side_effect=stale):
+                replanned = update_website(website_id, {'url': 'https://final.example.org'})
+            assert replanned['statusCode'] == 200
+            assert 'Item' not in table.get_item(Key={'id': 'URL#https://moved.example.org/'})
+            assert table.get_item(Key={'id': 'URL#https://final.example.org/'})['Item']['website_id'] == website_id
+            
+            # Deleting releases the guard so the URL can be registered again
+            assert delete_website(other['id'])['statusCode'] == 200
+            assert 'Item' not in table.get_item(Key={'id': 'URL#https://other.example.com/'})
+            assert create_website({'url': 'https://other.example.com/', 'name': 'Back'})['statusCode'] == 201
+
+    @mock_aws
+    def test_batch_import_skips_registered_urls(self):
+        """Test that bulk import reports URLs that already exist instead of duplicating them"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            existing = json.loads(create_website({'url': 'https://a.example.com', 'name': 'A'})['body'])['website']
+            body = json.dumps([
+                {'url': 'https://A.example.com/', 'name': 'A again'},
+                {'url': 'https://b.example.com', 'name': 'B'},
+                {'url': 'https://b.example.com/', 'name': 'B twice'}
+            ])
+            response = create_websites_batch(body)
+            results = json.loads(response['body'])
+            
+            assert (results['created'], results['existing'], results['failed']) == (1, 1, 1)
+            assert results['results'][0] == {'index': 0, 'status': 'exists', 'id': existing['id']}
+            assert 'Duplicate of item 1' in results['results'][2]['error']
+            websites = table.scan(FilterExpression=Attr('record_type').eq('website'))['Items']
+            assert sorted(w['url'] for w in websites) == ['https://a.example.com', 'https://b.example.com']
+
+    @mock_aws
+    def test_batch_import_reports_partially_written_chunk(self):
+        """Test that a chunk failing part-way reports and counts the websites that were written"""
+        import crud_handler
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        real_batch_writer = table.batch_writer
+        
+        class FailingWriter:
+            """Writes straight through, then fails at the second URL guard"""
+            guards = 0
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc):
+                return False
+            def put_item(self, Item):
+                if Item['record_type'] == 'url_guard':
+                    FailingWriter.guards += 1
+                    if FailingWriter.guards == 2:
+                        raise ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'boom'}},
+                                          'BatchWriteItem')
+                table.put_item(Item=Item)
+        
+        body = json.dumps([{'url': f'https://part{i}.example.com', 'name': f'Part {i}'} for i in range(3)])
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}), \
+                patch('crud_handler.get_thread_table', return_value=table), \
+                patch.object(table, 'batch_writer', side_effect=[FailingWriter(), real_batch_writer()]):
+            results = json.loads(create_websites_batch(body)['body'])
+        
+        assert [r['status'] for r in results['results']] == ['created', 'created', 'failed']
+        websites = table.scan(FilterExpression=Attr('record_type').eq('website'))['Items']
+        assert sorted(w['url'] for w in websites) == ['https://part0.example.com', 'https://part1.example.com']
+        # The website written before the failure got its guard after all
+        guard_id = crud_handler.url_guard_id(crud_handler.normalize_url('https://part1.example.com'))
+        assert table.get_item(Key={'id': guard_id})['Item']['website_id'] == results['results'][1]['id']
+        
+        # A retry only creates what is missing
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            retry = json.loads(create_websites_batch(body)['body'])
+        assert [r['status'] for r in retry['results']] == ['exists', 'exists', 'created']
+
+    @mock_aws
+    def test_backfill_legacy_websites(self):
+        """Test that the backfill script makes legacy websites visible to indexes, guards and search"""
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(
+            'backfill_websites', os.path.join(os.path.dirname(__file__), '..', 'scripts', 'backfill_websites.py'))
+        backfill_websites = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(backfill_websites)
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        search_table = create_search_table(dynamodb)
+        
+        # Items as the original API wrote them: no record_type, enabled_key, url_key or guard
+        for website_id, url, enabled, created_at in (('old-a', 'https://legacy.example.com', True, '2024-01-01T00:00:00'),
+                                                     ('old-b', 'https://Legacy.example.com/', True, '2024-02-01T00:00:00'),
+                                                     ('old-c', 'https://paused.example.com', False, '2024-03-01T00:00:00')):
+            table.put_item(Item={'id': website_id, 'url': url, 'name': f'Legacy {website_id}',
+                                 'enabled': enabled, 'created_at': created_at})
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table', 'SEARCH_INDEX_TABLE': 'test-search-table'}):
+            assert json.loads(list_websites({})['body'])['count'] == 0
+            
+            summary = backfill_websites.backfill(table, search_table)
+            assert (summary['websites'], summary['updated'], summary['guards'], summary['indexed']) == (3, 3, 2, 3)
+            assert summary['duplicates'] == {'https://legacy.example.com/': ['old-a', 'old-b']}
+            
+            assert json.loads(list_websites({})['body'])['count'] == 3
+            enabled = json.loads(list_websites({'enabled': 'true'})['body'])
+            assert enabled['access_path']['index'] == 'enabled-key-index'
+            assert sorted(w['id'] for w in enabled['websites']) == ['old-a', 'old-b']
+            duplicate = json.loads(create_website({'url': 'https://legacy.example.com', 'name': 'Again'})['body'])
+            assert duplicate['website']['id'] == 'old-a'
+            found = json.loads(lambda_handler({'httpMethod': 'GET', 'path': '/websites/search', 'pathParameters': None,
+                                               'queryStringParameters': {'q': 'paused'}, 'body': None}, {})['body'])
+            assert [w['id'] for w in found['websites']] == ['old-c']
+            
+            # Running it again changes nothing
+            summary = backfill_websites.backfill(table, search_table)
+            assert (summary['updated'], summary['guards']) == (0, 0)
+
+    @mock_aws
+    def test_search_websites_trigram_index(self):
+        """Test that GET /websites/search ranks, paginates and follows writes"""
+        import search_index
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        search_table = create_search_table(dynamodb)
+        
+        def search(q, **params):
+            event = {
+                'httpMethod': 'GET',
+                'path': '/websites/search',
+                'pathParameters': None,
+                'queryStringParameters': dict(params, q=q),
+                'body': None
+            }
+            return lambda_handler(event, {})
+        
+        assert search('example')['statusCode'] == 503
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table', 'SEARCH_INDEX_TABLE': 'test-search-table'}):
+            shop = json.loads(create_website({'url': 'https://shop.example.com', 'name': 'Storefront'})['body'])['website']
+            create_websites_batch(json.dumps([
+                {'url': 'https://status.example.org', 'name': 'Status page'},
+                {'url': 'https://blog.other.net', 'name': 'Company blog'}
+            ]))
+            
+            # Search items live in their own table, not in the websites table
+            assert table.scan(Select='COUNT', FilterExpression=Attr('record_type').is_in(['search_doc', 'trigram']))['Count'] == 0
+            assert search_table.get_item(Key={'id': f"SEARCH#{shop['id']}"})['Item']['text'] == 'storefront shop.example.com'
+            
+            body = json.loads(search('EXAMPLE')['body'])
+            assert body['total'] == 2
+            assert {w['url'] for w in body['websites']} == {'https://shop.example.com', 'https://status.example.org'}
+            
+            # Best match first, one trigram short still matches with a lower score
+            body = json.loads(search('shop.exampl')['body'])
+            assert body['websites'][0]['id'] == shop['id']
+            assert body['websites'][0]['score'] == 1.0
+            
+            first = json.loads(search('example', limit='1')['body'])
+            second = json.loads(search('example', limit='1', cursor=first['next_cursor'])['body'])
+            assert first['count'] == second['count'] == 1
+            assert first['websites'][0]['id'] != second['websites'][0]['id']
+            assert second['next_cursor'] is None
+            
+            # Renames and deletes update the postings
+            update_website(shop['id'], {'name': 'Merch store'})
+            assert json.loads(search('merch')['body'])['websites'][0]['id'] == shop['id']
+            assert json.loads(search('storefront')['body'])['total'] == 0
+            delete_website(shop['id'])
+            remaining = json.loads(search('shop.example')['body'])['websites']
+            assert shop['id'] not in [w['id'] for w in remaining]
+            assert json.loads(search('merch')['body'])['total'] == 0
+            
+            assert search('ab')['statusCode'] == 400
+            # Stop trigrams are never posted, and trigrams above the posting cap are skipped
+            assert search('www')['statusCode'] == 400
+            create_website({'url': 'https://www.example.io', 'name': 'Example IO'})
+            with patch.object(search_index, 'MAX_TRIGRAM_POSTINGS', 1):
+                assert search('example')['statusCode'] == 400
+                body = json.loads(search('status.example')['body'])
+                assert [w['url'] for w in body['websites']] == ['https://status.example.org']
+
+    @mock_aws
+    def test_website_metrics_batched_and_cached(self):
+        """Test per-target and multi-target metrics endpoints over GetMetricData"""
+        import crud_handler
+        from datetime import datetime, timezone
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        create_indexed_table(dynamodb)
+        cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            ids = []
+            for host, latency in (('a.example.com', 120.0), ('b.example.com', 80.0)):
+                website = json.loads(create_website({'url': f'https://{host}', 'name': host})['body'])['website']
+                ids.append(website['id'])
+                cloudwatch.put_metric_data(Namespace=crud_handler.NAMESPACE, MetricData=[{
+                    'MetricName': 'Latency',
+                    'Dimensions': [{'Name': 'URL', 'Value': website['url']}],
+                    'Timestamp': datetime.now(timezone.utc),
+                    'Value': latency
+                }])
+            
+            calls = []
+            record = lambda **kwargs: calls.append(1)
+            crud_handler.cloudwatch.meta.events.register('before-call.cloudwatch.GetMetricData', record)
+            try:
+                event = {
+                    'httpMethod': 'GET',
+                    'path': '/websites/metrics',
+                    'pathParameters': None,
+                    'queryStringParameters': {'ids': f'{ids[0]},{ids[1]},missing-id', 'period': '60', 'range': '1h'},
+                    'body': None
+                }
+                # Six metric queries split into two GetMetricData calls
+                with patch.object(crud_handler, 'METRIC_QUERIES_PER_CALL', 4):
+                    response = lambda_handler(event, {})
+                assert response['statusCode'] == 200
+                body = json.loads(response['body'])
+                assert len(calls) == 2
+                assert body['not_found'] == ['missing-id']
+                assert [w['metrics']['latency_ms']['values'] for w in body['websites']] == [[120.0], [80.0]]
+                assert body['websites'][0]['metrics']['availability']['values'] == []
+                
+                # The single-target form is answered from the short-TTL cache
+                single = lambda_handler({
+                    'httpMethod': 'GET',
+                    'path': f'/websites/{ids[1]}/metrics',
+                    'pathParameters': {'id': ids[1]},
+                    'queryStringParameters': {'period': '60', 'range': '1h'},
+                    'body': None
+                }, {})
+                assert json.loads(single['body'])['metrics']['latency_ms']['values'] == [80.0]
+                assert len(calls) == 2
+            finally:
+                crud_handler.cloudwatch.meta.events.unregister('before-call.cloudwatch.GetMetricData', record)
+            
+            event['queryStringParameters'] = {'ids': ids[0], 'range': '1y'}
+            assert lambda_handler(event, {})['statusCode'] == 400
+
+    @mock_aws
+    def test_list_website_status_view(self):
+        """Test that GET /websites/status pages through the crawler's status view"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        status_table = dynamodb.create_table(
+            TableName='test-status-table',
+            KeySchema=[
+                {'AttributeName': 'fleet', 'KeyType': 'HASH'},
+                {'AttributeName': 'website_id', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'fleet', 'AttributeType': 'S'},
+                {'AttributeName': 'website_id', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        for i in range(3):
+            status_table.put_item(Item={
+                'fleet': 'all', 'website_id': f'site-{i}', 'url': f'https://site{i}.example.com',
+                'status': 200, 'error': 0, 'available': 1, 'latency_ms': 100 + i, 'size': 512,
+                'checked_at': '2024-01-01T00:00:00+00:00', 'consecutive_failures': 0
+            })
+        
+        event = {
+            'httpMethod': 'GET',
+            'path': '/websites/status',
+            'pathParameters': None,
+            'queryStringParameters': {'limit': '2'},
+            'body': None
+        }
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            assert lambda_handler(event, {})['statusCode'] == 503
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table', 'TARGET_STATUS_TABLE': 'test-status-table'}):
+            first = json.loads(lambda_handler(event, {})['body'])
+            assert [s['website_id'] for s in first['statuses']] == ['site-0', 'site-1']
+            assert first['statuses'][0]['latency_ms'] == 100
+            assert 'fleet' not in first['statuses'][0]
+            
+            event['queryStringParameters'] = {'limit': '2', 'cursor': first['next_cursor']}
+            second = json.loads(lambda_handler(event, {})['body'])
+            assert [s['website_id'] for s in second['statuses']] == ['site-2']
+            assert second['next_cursor'] is None
+
+    @mock_aws
+    def test_gzip_large_responses_and_base64_bodies(self):
+        """Test gzip for clients that accept it and base64 request bodies from binary media types"""
+        import base64
+        import gzip
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        create_indexed_table(dynamodb)
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            create_event = {
+                'httpMethod': 'POST',
+                'path': '/websites',
+                'pathParameters': None,
+                'queryStringParameters': None,
+                'isBase64Encoded': True,
+                'body': base64.b64encode(json.dumps({'url': 'https://zipped.example.com', 'name': 'Zipped'}).encode()).decode()
+            }
+            assert lambda_handler(create_event, {})['statusCode'] == 201
+            create_event['body'] = '%%%'
+            assert lambda_handler(create_event, {})['statusCode'] == 400
+            for i in range(20):
+                create_website({'url': f'https://site{i}.example.com', 'name': f'Site {i}'})
+            
+            list_event = {
+                'httpMethod': 'GET',
+                'path': '/websites',
+                'pathParameters': None,
+                'queryStringParameters': None,
+                'body': None
+            }
+            plain = lambda_handler(list_event, {})
+            assert 'Content-Encoding' not in plain['headers']
+            assert plain['headers']['Vary'] == 'Accept, Accept-Encoding'
+            
+            zipped = lambda_handler(dict(list_event, headers={'Accept': 'application/json',
+                                                              'Accept-Encoding': 'br, gzip;q=0.8'}), {})
+            assert zipped['isBase64Encoded'] is True
+            assert zipped['headers']['Content-Encoding'] == 'gzip'
+            assert zipped['headers']['ETag'] == f"W/{plain['headers']['ETag']}"
+            wire = base64.b64decode(zipped['body'])
+            assert gzip.decompress(wire).decode('utf-8') == plain['body']
+            assert len(wire) < len(plain['body'])
+            
+            refused = lambda_handler(dict(list_event, headers={'Accept': 'application/json',
+                                                               'Accept-Encoding': 'gzip;q=0'}), {})
+            assert 'Content-Encoding' not in refused['headers']
+            
+            # API Gateway would hand a client accepting */* the base64 text, so it gets the plain body
+            anything = lambda_handler(dict(list_event, headers={'Accept': '*/*', 'Accept-Encoding': 'gzip'}), {})
+            assert 'Content-Encoding' not in anything['headers']
+            assert anything['body'] == plain['body']
+            
+            # The weak ETag still revalidates
+            revalidated = lambda_handler(dict(list_event, headers={
+                'Accept': 'application/json', 'Accept-Encoding': 'gzip', 'If-None-Match': zipped['headers']['ETag']}), {})
+            assert revalidated['statusCode'] == 304
+
+    @mock_aws
+    def test_website_stats_counters(self, sample_website_data):
+        """Test that the table's stream keeps the fleet counters and they are read without a scan"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        table.meta.client.update_table(TableName=table.name, StreamSpecification={
+            'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'})
+        status_table = dynamodb.create_table(
+            TableName='test-status-table',
+            KeySchema=[
+                {'AttributeName': 'fleet', 'KeyType': 'HASH'},
+                {'AttributeName': 'website_id', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'fleet', 'AttributeType': 'S'},
+                {'AttributeName': 'website_id', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        status_table.put_item(Item={'fleet': 'stats', 'website_id': 'all', 'up': 3, 'down': 1,
+                                    'status_codes': {'200': 3, '503': 1}, 'checked_at': '2024-01-01T00:00:00+00:00'})
+        # Written before the counters existed
+        table.put_item(Item=dict(sample_website_data, enabled=False, record_type='website'))
+        
+        event = {
+            'httpMethod': 'GET',
+            'path': '/websites/stats',
+            'pathParameters': None,
+            'queryStringParameters': None,
+            'body': None
+        }
+        import crud_handler
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table', 'TARGET_STATUS_TABLE': 'test-status-table'}):
+            # Count DynamoDB calls without the read cache in the way
+            crud_handler.read_cache.ttl_seconds = 0
+            try:
+                seeded = json.loads(lambda_handler(event, {})['body'])
+                assert (seeded['total'], seeded['enabled'], seeded['disabled']) == (1, 0, 1)
+                assert seeded['status']['up'] == 3
+                assert seeded['status']['status_codes'] == {'200': 3, '503': 1}
+                counted_before = len(stream_records(table))
+                
+                first = json.loads(create_website({'url': 'https://one.example.com', 'name': 'One'})['body'])['website']
+                create_website({'url': 'https://two.example.com', 'name': 'Two', 'enabled': False})
+                create_website({'url': 'https://one.example.com', 'name': 'One again'})  # duplicate, not counted
+                create_websites_batch(json.dumps([
+                    {'url': 'https://three.example.com', 'name': 'Three'},
+                    {'url': 'https://two.example.com', 'name': 'Two again'}
+                ]))
+                assert update_website(first['id'], {'enabled': False})['statusCode'] == 200
+                assert update_website(first['id'], {'enabled': False})['statusCode'] == 200  # no flip
+                assert delete_website('test-id')['statusCode'] == 200
+                
+                # Requests leave the counter item alone; the stream batch moves it in one update
+                assert table.get_item(Key={'id': crud_handler.STATS_ID})['Item']['total_count'] == 1
+                records = stream_records(table)[counted_before:]
+                counted = lambda_handler({'Records': records}, {})
+                assert (counted['total_count'], counted['enabled_count'], counted['disabled_count']) == (2, 1, 1)
+                
+                operations = []
+                record = lambda model, params, **kwargs: operations.append(model.name)
+                crud_handler.dynamodb.meta.client.meta.events.register('before-parameter-build.dynamodb', record)
+                try:
+                    stats = json.loads(lambda_handler(event, {})['body'])
+                finally:
+                    crud_handler.dynamodb.meta.client.meta.events.unregister('before-parameter-build.dynamodb', record)
+                assert operations == ['BatchGetItem']
+                assert (stats['total'], stats['enabled'], stats['disabled']) == (3, 1, 2)
+                assert stats['counted_since'] == seeded['counted_since']
+            finally:
+                crud_handler.read_cache.ttl_seconds = crud_handler.CACHE_TTL_SECONDS
+
+    @mock_aws
+    def test_idempotency_key_replays_creates(self):
+        """Test that retried POSTs with an Idempotency-Key replay the first response"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = create_indexed_table(dynamodb)
+        idempotency_table = dynamodb.create_table(
+            TableName='test-idempotency-table',
+            KeySchema=[{'AttributeName': 'idempotency_key', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'idempotency_key', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        event = {
+            'httpMethod': 'POST',
+            'path': '/websites',
+            'pathParameters': None,
+            'queryStringParameters': None,
+            'headers': {'Idempotency-Key': 'create-1'},
+            'body': json.dumps({'url': 'https://once.example.com', 'name': 'Once'})
+        }
+        import crud_handler
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table', 'IDEMPOTENCY_TABLE': 'test-idempotency-table'}):
+            first = lambda_handler(event, {})
+            assert first['statusCode'] == 201
+            assert 'Idempotent-Replayed' not in first['headers']
+            
+            # Warm container: answered from memory without touching DynamoDB
+            operations = []
+            record = lambda model, params, **kwargs: operations.append(model.name)
+            crud_handler.dynamodb.meta.client.meta.events.register('before-parameter-build.dynamodb', record)
+            try:
+                retry = lambda_handler(event, {})
+            finally:
+                crud_handler.dynamodb.meta.client.meta.events.unregister('before-parameter-build.dynamodb', record)
+            assert operations == []
+            assert retry['statusCode'] == 201
+            assert retry['headers']['Idempotent-Replayed'] == 'true'
+            assert json.loads(retry['body']) == json.loads(first['body'])
+            
+            # Another container replays the stored record
+            crud_handler.idempotency_cache.clear()
+            replay = lambda_handler(event, {})
+            assert replay['statusCode'] == 201
+            assert json.loads(replay['body'])['website']['id'] == json.loads(first['body'])['website']['id']
+            websites = table.scan(FilterExpression=Attr('record_type').eq('website'))['Items']
+            assert len(websites) == 1
+            
+            reused = lambda_handler(dict(event, body=json.dumps({'url': 'https://other.example.com', 'name': 'Other'})), {})
+            assert reused['statusCode'] == 422
+            
+            # A claim held by a running invocation
+            import hashlib
+            idempotency_table.put_item(Item={
+                'idempotency_key': '/websites#busy', 'state': 'IN_PROGRESS',
+                'fingerprint': hashlib.sha256(event['body'].encode('utf-8')).hexdigest(),
+                'locked_until': 2 ** 40, 'expires_at': 2 ** 40
+            })
+            assert lambda_handler(dict(event, headers={'Idempotency-Key': 'busy'}), {})['statusCode'] == 409
+            
+            batch_event = dict(event, path='/websites:batch', headers={'Idempotency-Key': 'import-1'},
+                               body=json.dumps([{'url': 'https://bulk.example.com', 'name': 'Bulk'}]))
+            assert json.loads(lambda_handler(batch_event, {})['body'])['created'] == 1
+            crud_handler.idempotency_cache.clear()
+            batch_retry = lambda_handler(batch_event, {})
+            assert batch_retry['headers']['Idempotent-Replayed'] == 'true'
+            assert json.loads(batch_retry['body'])['created'] == 1
+            
+            # Without the header every POST runs
+            assert lambda_handler(dict(event, headers=None), {})['statusCode'] == 200
+
+    @mock_aws
+    def test_alarm_history_and_recent_transitions(self):
+        """Test that alarm history is served by key-condition queries and the recent view by its index"""
+        from datetime import datetime, timedelta, timezone
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        alarm_table = dynamodb.create_table(
+            TableName='test-alarm-table',
+            KeySchema=[
+                {'AttributeName': 'AlarmName', 'KeyType': 'HASH'},
+                {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'AlarmName', 'AttributeType': 'S'},
+                {'AttributeName': 'Timestamp', 'AttributeType': 'S'},
+                {'AttributeName': 'TransitionDay', 'AttributeType': 'S'},
+                {'AttributeName': 'Firing', 'AttributeType': 'S'},
+                {'AttributeName': 'StateChangeTime', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'recent-transitions-index',
+                'KeySchema': [
+                    {'AttributeName': 'TransitionDay', 'KeyType': 'HASH'},
+                    {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }, {
+                'IndexName': 'firing-alarms-index',
+                'KeySchema': [
+                    {'AttributeName': 'Firing', 'KeyType': 'HASH'},
+                    {'AttributeName': 'StateChangeTime', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        transitions = [('site-a-latency', now - timedelta(hours=h), state)
+                       for h, state in ((1, 'OK'), (5, 'ALARM'), (30, 'OK'), (50, 'ALARM'))]
+        transitions.append(('site-b-availability', now - timedelta(hours=2), 'ALARM'))
+        for i, (name, at, state) in enumerate(transitions):
+            changed = at.isoformat()
+            alarm_table.put_item(Item={
+                'AlarmName': name, 'Timestamp': f'{changed}#msg-{i}', 'StateChangeTime': changed,
+                'TransitionDay': changed[:10], 'MessageId': f'msg-{i}', 'State': state, 'OldState': 'OK',
+                'Reason': f'{name} went {state}'
+            })
+        
+        event = {
+            'httpMethod': 'GET',
+            'path': '/alarms/site-a-latency/history',
+            'pathParameters': {'name': 'site-a-latency'},
+            'queryStringParameters': {'limit': '2'},
+            'body': None
+        }
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table'}):
+            assert lambda_handler(event, {})['statusCode'] == 503
+        
+        with patch.dict(os.environ, {'TARGET_WEBSITES_TABLE': 'test-table', 'ALARM_TABLE': 'test-alarm-table'}):
+            first = json.loads(lambda_handler(event, {})['body'])
+            assert [t['State'] for t in first['transitions']] == ['OK', 'ALARM']
+            assert 'TransitionDay' not in first['transitions'][0]
+            event['queryStringParameters'] = {'limit': '2', 'cursor': first['next_cursor']}
+            second = json.loads(lambda_handler(event, {})['body'])
+            assert [t['MessageId'] for t in second['transitions']] == ['msg-2', 'msg-3']
+            
+            # The bounds are inclusive of every message at the boundary instants
+            event['queryStringParameters'] = {
+                'from': (now - timedelta(hours=30)).isoformat(),
+                'to': (now - timedelta(hours=5)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            }
+            window = json.loads(lambda_handler(event, {})['body'])
+            assert [t['MessageId'] for t in window['transitions']] == ['msg-1', 'msg-2']
+            
+            event['queryStringParameters'] = {'from': 'yesterday'}
+            assert lambda_handler(event, {})['statusCode'] == 400
+            event['queryStringParameters'] = {'cursor': first['next_cursor']}
+            other = dict(event, path='/alarms/site-b-availability/history', pathParameters={'name': 'site-b-availability'})
+            assert lambda_handler(other, {})['statusCode'] == 400
+            
+            recent_event = {
+                'httpMethod': 'GET',
+                'path': '/alarms/recent',
+                'pathParameters': None,
+                'queryStringParameters': {'since': (now - timedelta(hours=40)).isoformat(), 'limit': '2'},
+                'body': None
+            }
+            pages = []
+            while True:
+                page = json.loads(lambda_handler(recent_event, {})['body'])
+                pages.append([t['MessageId'] for t in page['transitions']])
+                if not page['next_cursor']:
+                    break
+                recent_event['queryStringParameters'] = dict(recent_event['queryStringParameters'],
+                                                             cursor=page['next_cursor'])
+            # Newest first across alarms and day partitions; older than since is left out
+            assert [m for page in pages for m in page] == ['msg-0', 'msg-4', 'msg-1', 'msg-2']
+            assert all(len(page) <= 2 for page in pages)
+            
+            recent_event['queryStringParameters'] = {'since': (now - timedelta(days=30)).isoformat()}
+            assert lambda_handler(recent_event, {})['statusCode'] == 400
+            
+            # The current-state item is not part of the history
+            alarm_table.put_item(Item={'AlarmName': 'site-a-latency', 'Timestamp': 'CURRENT', 'State': 'OK'})
+            event['queryStringParameters'] = None
+            history = json.loads(lambda_handler(event, {})['body'])
+            assert 'CURRENT' not in [t['Timestamp'] for t in history['transitions']]
+            
+            # Only current-state items of alarms in ALARM are in the sparse index
+            for name, state, since in (('site-b-availability', 'ALARM', '2024-01-01T00:00:00+00:00'),
+                                       ('site-c-latency', 'ALARM', '2024-01-02T00:00:00+00:00'),
+                                       ('site-d-latency', 'OK', '2024-01-03T00:00:00+00:00')):
+                item = {'AlarmName': name, 'Timestamp': 'CURRENT', 'State': state, 'StateChangeTime': since,
+                        'Reason': f'{name} is {state}'}
+                if state == 'ALARM':
+                    item['Firing'] = 'ALARM'
+                alarm_table.put_item(Item=item)
+            firing_event = {
+                'httpMethod': 'GET',
+                'path': '/alarms/firing',
+                'pathParameters': None,
+                'queryStringParameters': {'limit': '1'},
+                'body': None
+            }
+            first = json.loads(lambda_handler(firing_event, {})['body'])
+            assert [a['alarm_name'] for a in first['alarms']] == ['site-b-availability']
+            assert first['alarms'][0]['firing_since'] == '2024-01-01T00:00:00+00:00'
+            firing_event['queryStringParameters'] = {'limit': '1', 'cursor': first['next_cursor']}
+            second = json.loads(lambda_handler(firing_event, {})['body'])
+            assert [a['alarm_name'] for a in second['alarms']] == ['site-c-latency']
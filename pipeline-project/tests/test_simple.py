@@ -1,7 +1,7 @@
 """
 BEGINNER-FRIENDLY TEST SUITE
 ============================
-5 Unit Tests + 5 Functional Tests for Website Monitoring
+8 Unit Tests + 5 Functional Tests for Website Monitoring
 
 UNIT TESTS: Test individual components in isolation
 FUNCTIONAL TESTS: Test complete workflows end-to-end
@@ -60,7 +60,7 @@ def mock_requests_success():
     mock_response.elapsed.total_seconds.return_value = 0.5
     return mock_response
 
-# UNIT TESTS (5 tests) - Test individual components in isolation
+# UNIT TESTS (8 tests) - Test individual components in isolation
 
 # UNIT TEST 1: Basic Functionality
 def test_1_unit_basic_functionality(mock_environment, mock_cloudwatch, mock_dynamodb, mock_requests_success):
@@ -94,7 +94,7 @@ def test_1_unit_basic_functionality(mock_environment, mock_cloudwatch, mock_dyna
                     # Assertions
                     assert result['statusCode'] == 200
                     assert 'Checked 3 URLs' in result['body']
-                    assert mock_cloudwatch.put_metric_data.call_count == 3
+                    assert mock_cloudwatch.put_metric_data.call_count == 1
 
 # UNIT TEST 2: Error Handling
 def test_2_unit_error_handling(mock_environment, mock_cloudwatch, mock_dynamodb):
@@ -127,7 +127,7 @@ def test_2_unit_error_handling(mock_environment, mock_cloudwatch, mock_dynamodb)
                     # Should handle errors gracefully
                     assert result['statusCode'] == 200
                     assert 'Checked 3 URLs' in result['body']
-                    assert mock_cloudwatch.put_metric_data.call_count == 3
+                    assert mock_cloudwatch.put_metric_data.call_count == 1
 
 # UNIT TEST 3: Timeout Handling
 def test_3_unit_timeout_handling(mock_environment, mock_cloudwatch, mock_dynamodb):
@@ -190,7 +190,7 @@ def test_4_unit_cloudwatch_data_validation(mock_environment, mock_cloudwatch, mo
                     result = lambda_module.lambda_handler({}, {})
                     
                     # Check CloudWatch calls
-                    assert mock_cloudwatch.put_metric_data.call_count == 3
+                    assert mock_cloudwatch.put_metric_data.call_count == 1
                 
                 # Validate data structure
                 calls = mock_cloudwatch.put_metric_data.call_args_list
@@ -237,6 +237,130 @@ def test_5_unit_environment_variables(mock_environment, mock_cloudwatch, mock_dy
                     assert result['statusCode'] == 200
                     assert 'Checked 3 URLs' in result['body']  # Based on URLS env var
 
+# UNIT TEST 6: Probe Outcomes
+def test_6_unit_probe_metric_data():
+    """
+    UNIT TEST 6: Probe Outcomes
+    
+    What it tests: Does one probe outcome turn into the right CloudWatch payload?
+    Why unit test: Tests the probe record in isolation, no AWS or HTTP needed
+    """
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(
+        "lambda_function", 
+        os.path.join(os.path.dirname(__file__), '..', 'lambda', 'website_crawler', 'lambda_function.py')
+    )
+    lambda_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(lambda_module)
+    
+    up = lambda_module.Probe('https://up.example.com', 200, 120.5, 2048, lambda_module.PROBE_OK)
+    down = lambda_module.Probe('https://down.example.com', 503, 80.0, 0, lambda_module.PROBE_HTTP_ERROR)
+    
+    assert (up.available, up.failed) == (1, False)
+    assert (down.available, down.failed) == (0, True)
+    
+    metrics = lambda_module.metric_data(down, 'Availability', 'Latency', 'ResponseSize')
+    values = {m['MetricName']: m['Value'] for m in metrics}
+    assert values == {'Availability': 0, 'Latency': 80.0, 'ResponseSize': 0}
+    assert metrics[0]['Dimensions'] == [{'Name': 'URL', 'Value': 'https://down.example.com'}]
+
+# UNIT TEST 7: Last-Status View
+def test_7_unit_status_view_skips_unchanged():
+    """
+    UNIT TEST 7: Last-Status View
+    
+    What it tests: Does the crawler only rewrite status records that changed?
+    Why unit test: Tests the status view writer with a mocked status table
+    """
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(
+        "lambda_function", 
+        os.path.join(os.path.dirname(__file__), '..', 'lambda', 'website_crawler', 'lambda_function.py')
+    )
+    lambda_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(lambda_module)
+    
+    checked_at = datetime.now(lambda_module.timezone.utc).isoformat()
+    previous = {
+        'steady': {'fleet': 'all', 'website_id': 'steady', 'url': 'https://steady.example.com', 'status': 200,
+                   'error': 0, 'latency_ms': 100, 'size': 2048, 'checked_at': checked_at, 'consecutive_failures': 0},
+        'flaky': {'fleet': 'all', 'website_id': 'flaky', 'url': 'https://flaky.example.com', 'status': 503,
+                  'error': 1, 'latency_ms': 90, 'size': 0, 'checked_at': checked_at, 'consecutive_failures': 2},
+        'removed': {'fleet': 'all', 'website_id': 'removed', 'url': 'https://gone.example.com', 'status': 200,
+                    'error': 0, 'latency_ms': 100, 'size': 10, 'checked_at': checked_at, 'consecutive_failures': 0}
+    }
+    status_table = MagicMock()
+    status_table.query.return_value = {'Items': list(previous.values())}
+    batch = status_table.batch_writer.return_value.__enter__.return_value
+    
+    with lambda_module.StatusView(status_table) as view:
+        # within latency tolerance
+        view.record('steady', lambda_module.Probe('https://steady.example.com', 200, 110.4, 2048, lambda_module.PROBE_OK))
+        view.record('flaky', lambda_module.Probe('https://flaky.example.com', 503, 95.0, 0, lambda_module.PROBE_HTTP_ERROR))
+        view.record('new', lambda_module.Probe('https://new.example.com', 200, 300.0, 512, lambda_module.PROBE_OK))
+        # Records are written as probes finish, not at the end of the run
+        assert batch.put_item.call_count == 2
+    
+    assert (view.written, view.skipped, view.removed) == (2, 1, 1)
+    records = {call.kwargs['Item']['website_id']: call.kwargs['Item'] for call in batch.put_item.call_args_list}
+    assert set(records) == {'flaky', 'new'}
+    assert records['flaky']['consecutive_failures'] == 3
+    assert records['new']['latency_ms'] == 300
+    batch.delete_item.assert_called_once_with(Key={'fleet': 'all', 'website_id': 'removed'})
+    
+    # A warm run decides from what the last run wrote, without reading the view back
+    with lambda_module.StatusView(status_table) as warm:
+        warm.record('steady', lambda_module.Probe('https://steady.example.com', 200, 95.0, 2048, lambda_module.PROBE_OK))
+        warm.record('flaky', lambda_module.Probe('https://flaky.example.com', 200, 95.0, 4096, lambda_module.PROBE_OK))
+    assert status_table.query.call_count == 1
+    assert (warm.written, warm.skipped, warm.removed) == (1, 1, 1)
+    assert batch.put_item.call_args.kwargs['Item']['consecutive_failures'] == 0
+    batch.delete_item.assert_called_with(Key={'fleet': 'all', 'website_id': 'new'})
+    
+    # Per-status counts go to their own partition for GET /websites/stats
+    assert view.write_summary() == (2, 1)
+    summary = status_table.put_item.call_args.kwargs['Item']
+    assert (summary['fleet'], summary['website_id']) == ('stats', 'all')
+    assert summary['status_codes'] == {'200': 2, '503': 1}
+
+# UNIT TEST 8: Batched Metric Publishing
+def test_8_unit_metrics_published_in_batches(mock_cloudwatch):
+    """
+    UNIT TEST 8: Batched Metric Publishing
+    
+    What it tests: Are metrics sent in as few PutMetricData calls as the API limits allow?
+    Why unit test: Tests the publisher with a mocked CloudWatch client
+    """
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(
+        "lambda_function", 
+        os.path.join(os.path.dirname(__file__), '..', 'lambda', 'website_crawler', 'lambda_function.py')
+    )
+    lambda_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(lambda_module)
+    
+    publisher = lambda_module.MetricPublisher(mock_cloudwatch, 'test-namespace', 'Availability', 'Latency', 'ResponseSize')
+    for i in range(700):
+        publisher.add(lambda_module.Probe(f'https://site-{i}.example.com', 200, 100.0, 1024, lambda_module.PROBE_OK))
+        # A full call goes out as soon as the next probe would not fit, so at most one is buffered
+        assert len(publisher.batch) <= lambda_module.METRIC_DATA_BATCH
+    assert mock_cloudwatch.put_metric_data.call_count == 2
+    publisher.flush()
+    
+    # 2100 datums at up to 1000 per call, never splitting one URL's metrics
+    sizes = [len(call.kwargs['MetricData']) for call in mock_cloudwatch.put_metric_data.call_args_list]
+    assert sizes == [999, 999, 102]
+    
+    # Long URLs hit the request size limit before the datum limit
+    long_cw = Mock()
+    long_publisher = lambda_module.MetricPublisher(long_cw, 'test-namespace', 'Availability', 'Latency', 'ResponseSize')
+    for i in range(300):
+        long_publisher.add(lambda_module.Probe(f'https://example.com/{i}/' + 'x' * 1000, 200, 100.0, 1024, lambda_module.PROBE_OK))
+    long_publisher.flush()
+    sizes = [len(call.kwargs['MetricData']) for call in long_cw.put_metric_data.call_args_list]
+    assert len(sizes) > 1
+    assert sum(sizes) == 900
+
 # FUNCTIONAL TESTS (5 tests) - Test complete workflows end-to-end
 
 # FUNCTIONAL TEST 1: End-to-End Monitoring Flow
@@ -277,7 +401,7 @@ def test_1_functional_end_to_end_flow(mock_environment, mock_cloudwatch, mock_dy
                     # Functional assertions
                     assert result['statusCode'] == 200
                     assert 'Checked 3 URLs' in result['body']
-                    assert mock_cloudwatch.put_metric_data.call_count == 3
+                    assert mock_cloudwatch.put_metric_data.call_count == 1
 
 # FUNCTIONAL TEST 2: Multi-Website Monitoring
 def test_2_functional_multi_website_monitoring(mock_environment, mock_cloudwatch, mock_dynamodb):
@@ -332,7 +456,7 @@ def test_2_functional_multi_website_monitoring(mock_environment, mock_cloudwatch
                     # Should handle multiple websites successfully
                     assert result['statusCode'] == 200
                     assert 'Checked 3 URLs' in result['body']
-                    assert mock_cloudwatch.put_metric_data.call_count == 3
+                    assert mock_cloudwatch.put_metric_data.call_count == 1
 
 # FUNCTIONAL TEST 3: Performance Measurement
 def test_3_functional_performance_measurement(mock_environment, mock_cloudwatch, mock_dynamodb):
@@ -372,7 +496,7 @@ def test_3_functional_performance_measurement(mock_environment, mock_cloudwatch,
                     # Performance assertions
                     assert result['statusCode'] == 200
                     assert 'Checked 3 URLs' in result['body']
-                    assert mock_cloudwatch.put_metric_data.call_count == 3
+                    assert mock_cloudwatch.put_metric_data.call_count == 1
                     
                     # Verify latency metrics are recorded
                     all_metrics = []
@@ -438,7 +562,7 @@ def test_4_functional_mixed_scenarios(mock_environment, mock_cloudwatch, mock_dy
                     # Should handle mixed scenarios gracefully
                     assert result['statusCode'] == 200
                     assert 'Checked 3 URLs' in result['body']
-                    assert mock_cloudwatch.put_metric_data.call_count == 3
+                    assert mock_cloudwatch.put_metric_data.call_count == 1
 
 # FUNCTIONAL TEST 5: Complete Monitoring Cycle
 def test_5_functional_complete_monitoring_cycle(mock_environment, mock_cloudwatch, mock_dynamodb):
@@ -480,7 +604,7 @@ def test_5_functional_complete_monitoring_cycle(mock_environment, mock_cloudwatc
                     # Complete cycle assertions
                     assert result['statusCode'] == 200
                     assert 'Checked 3 URLs' in result['body']
-                    assert mock_cloudwatch.put_metric_data.call_count == 3
+                    assert mock_cloudwatch.put_metric_data.call_count == 1
                     
                     # Verify all metrics are present
                 all_metrics = []
@@ -196,6 +196,37 @@ def test_dynamodb_table_structure(app_stack):
         ]
     })
 
+def test_index_stages_change_one_gsi_at_a_time():
+    """Test that every GSI rollout stage is one CloudFormation-deployable step from the last"""
+    from AppStack import WEBSITES_TABLE_INDEX_STAGES, ALARM_TABLE_INDEX_STAGES
+    import constants
+    
+    for stages, stage in ((WEBSITES_TABLE_INDEX_STAGES, constants.WEBSITES_TABLE_INDEX_STAGE),
+                          (ALARM_TABLE_INDEX_STAGES, constants.ALARM_TABLE_INDEX_STAGE)):
+        assert 0 <= stage < len(stages)
+        for previous, current in zip(stages, stages[1:]):
+            assert len(set(previous) ^ set(current)) == 1
+
+
+def test_cors_preflight_is_text_and_binary_types_are_explicit(app_stack):
+    """Test that only the gzip-able media types are binary and every CORS preflight stays a text MOCK"""
+    template = assertions.Template.from_stack(app_stack)
+    
+    template.has_resource_properties("AWS::ApiGateway::RestApi", {
+        "BinaryMediaTypes": ["application/json", "application/x-ndjson", "text/csv"]
+    })
+    preflights = template.find_resources("AWS::ApiGateway::Method", {"Properties": {"HttpMethod": "OPTIONS"}})
+    assert preflights
+    for preflight in preflights.values():
+        integration = preflight["Properties"]["Integration"]
+        assert integration["Type"] == "MOCK"
+        assert integration["ContentHandling"] == "CONVERT_TO_TEXT"
+        assert integration["RequestTemplates"] == {"application/json": "{ statusCode: 200 }"}
+        headers = integration["IntegrationResponses"][0]["ResponseParameters"]
+        assert headers["method.response.header.Access-Control-Allow-Origin"] == "'*'"
+        assert "If-Match" in headers["method.response.header.Access-Control-Allow-Headers"]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
 # Pipeline refresh - Wed Oct  8 21:56:32 AEDT 2025